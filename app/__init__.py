@@ -12,14 +12,31 @@ def create_app():
     # 确保图片目录存在
     os.makedirs(Config.PICTURE_DIR, exist_ok=True)
     
+    # 初始化存储模块（热点图片内存缓存）
+    from app.storage import init_storage
+    init_storage(app)
+    
     # 初始化配置模块（JSON 存储）
     from app.database import init_db
     init_db(app)
     
+    # 初始化 API 转发模块（共享 HTTP 连接池）
+    from app.proxy import init_proxy
+    init_proxy(app)
+    
+    # 初始化后台任务模块
+    from app.jobs import init_jobs
+    init_jobs(app)
+    
     # 初始化认证模块
     from app.auth import init_auth
     init_auth(app)
     
+    # 检查本地图片的发送方式
+    from app.routes.images import OFFLOAD_MODES
+    if app.config.get('IMAGE_OFFLOAD') not in OFFLOAD_MODES:
+        raise ValueError(f"IMAGE_OFFLOAD 只能为空、x-accel 或 x-sendfile，当前为 '{app.config.get('IMAGE_OFFLOAD')}'")
+    
     # 注册蓝图
     from app.routes.main import main_bp
     from app.routes.admin import admin_bp
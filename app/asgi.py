@@ -0,0 +1,181 @@
+"""
+ASGI 网关
+
+动态路由（API 端点转发、流式代理与只含外链的图片合集）在事件循环中直接处理，
+上游请求通过 httpx 异步发出，合集索引的磁盘访问在线程池中进行；
+本地图片、管理后台等其余请求交给 Flask 应用处理。
+"""
+import asyncio
+import json
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.datastructures import Headers
+from werkzeug.exceptions import HTTPException
+from werkzeug.urls import url_decode
+from werkzeug.utils import redirect
+from werkzeug.wrappers import Response
+from app.proxy import get_endpoint_plan
+from app.proxy.aio import AsyncUpstreamStream, async_http_client, get_proxy_result_async, open_stream_async
+from app.proxy.handler import ProxyResult, proxy_response_parts
+from app.proxy.stream import STREAM_CHUNK_SIZE, relay_headers
+from app.routes.images import selection_seed
+from app.routes.redirect import RESERVED_PATHS
+from app.storage import storage_manager
+
+
+def _route_name(path):
+    """与 redirect_bp 的 /<name> 规则一致，返回名称或 None"""
+    name = path[1:]
+    if not name or '/' in name:
+        return None
+    if name in RESERVED_PATHS or '.' in name or name == 'favicon.ico':
+        return None
+    return name
+
+
+def _json_response(body, status=200, headers=None):
+    return Response(
+        json.dumps(body, ensure_ascii=False) + '\n',
+        status=status,
+        headers=headers,
+        mimetype='application/json'
+    )
+
+
+async def _send_response(send, response, head=False):
+    body = b'' if head else response.get_data()
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [
+            (key.lower().encode('latin-1'), value.encode('latin-1'))
+            for key, value in response.headers.items()
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _relay_stream(send, receive, stream, head=False):
+    """把上游响应体按块转发给客户端，客户端断开时停止并关闭上游连接"""
+    async def wait_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    disconnected = asyncio.ensure_future(wait_disconnect())
+    response = stream.response
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [
+                (key.lower().encode('latin-1'), value.encode('latin-1'))
+                for key, value in relay_headers(response.headers).items()
+            ]
+        })
+        if not head and response.status_code != 304:
+            async for chunk in response.aiter_raw(STREAM_CHUNK_SIZE):
+                if disconnected.done():
+                    return
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        await stream.aclose()
+
+
+class AsyncGateway:
+    """ASGI 应用：异步处理动态路由，其余请求转交 Flask
+
+    Args:
+        flask_app: create_app() 创建的 Flask 应用
+    """
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi_app = WsgiToAsgi(flask_app)
+        async_http_client.configure(flask_app.config.get('ASYNC_MAX_CONNECTIONS', 1000))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            name = _route_name(scope.get('path', ''))
+            if name is not None:
+                head = scope['method'] == 'HEAD'
+                response = await self._dispatch(name, scope)
+                if isinstance(response, AsyncUpstreamStream):
+                    await _relay_stream(send, receive, response, head=head)
+                    return
+                if response is not None:
+                    await _send_response(send, response, head=head)
+                    return
+
+        await self.wsgi_app(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_http_client.aclose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _collection_redirect(self, name, args):
+        """只含外链的合集返回重定向响应；本地图片合集或不存在的名称返回 None，交给 Flask 处理"""
+        with self.flask_app.app_context():
+            if not storage_manager.is_link_only_collection(name):
+                return None
+            try:
+                seed, cache_control = selection_seed(args)
+            except HTTPException as e:
+                return e.get_response()
+            resource_type, resource = storage_manager.get_random_resource(name, seed=seed)
+            if resource_type != 'external':
+                return None
+            response = redirect(resource)
+            response.headers['Cache-Control'] = cache_control
+            return response
+
+    async def _dispatch(self, name, scope):
+        """处理动态路由，返回 None 表示交给 Flask 处理"""
+        args = url_decode(scope.get('query_string', b''))
+        with self.flask_app.app_context():
+            plan = get_endpoint_plan(name)
+        if plan is None:
+            # 合集索引的校验与外链读取会访问磁盘，放到线程池中执行，不阻塞事件循环
+            return await asyncio.to_thread(self._collection_redirect, name, args)
+
+        with self.flask_app.app_context():
+            if plan.redirect_body is not None:
+                return Response(
+                    plan.redirect_body,
+                    status=302,
+                    headers={'Location': plan.redirect_location},
+                    mimetype='text/html'
+                )
+            action, value, extra = plan.resolve(args)
+
+        if action == 'redirect':
+            return redirect(value)
+        if action == 'error':
+            return _json_response(value, extra)
+
+        if action == 'stream':
+            stream = await open_stream_async(value, extra, plan.name, Headers(
+                [(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope.get('headers', [])]
+            ))
+            if not isinstance(stream, ProxyResult):
+                return stream
+            result = stream
+        else:
+            result = await get_proxy_result_async(value, extra, plan.name)
+        kind, payload, status, headers = proxy_response_parts(result, extra)
+        if kind == 'redirect':
+            print(f'[Proxy] Redirecting to: {payload}')
+            return redirect(payload)
+        if kind == 'json':
+            return _json_response(payload, status, headers)
+        return Response(payload, status=status)
@@ -3,21 +3,31 @@
 """
 from app.database.db import (
     get_current_config, 
+    get_config_snapshot,
     save_config, 
     init_db,
     get_all_api_endpoints,
     add_api_endpoint,
     update_api_endpoint,
-    delete_api_endpoint
+    delete_api_endpoint,
+    COLLECTION_DELIVERY_MODES,
+    get_collection_settings,
+    update_collection_settings,
+    delete_collection_settings
 )
 
 __all__ = [
     'get_current_config', 
+    'get_config_snapshot',
     'save_config', 
     'init_db',
     'get_all_api_endpoints',
     'add_api_endpoint',
     'update_api_endpoint',
-    'delete_api_endpoint'
+    'delete_api_endpoint',
+    'COLLECTION_DELIVERY_MODES',
+    'get_collection_settings',
+    'update_collection_settings',
+    'delete_collection_settings'
 ]
 
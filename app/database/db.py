@@ -1,13 +1,135 @@
 """
 JSON 配置文件读写模块
+
+读取路径上使用缓存的只读配置快照：每个 worker 最多每隔 CONFIG_RELOAD_INTERVAL 秒
+通过 mtime/inode/size 校验一次配置文件，未变化时直接返回内存中的快照。
 """
 import json
 import os
+import threading
+import time
+from types import MappingProxyType
 from flask import current_app
 
-# 全局配置缓存
+# 全局配置缓存（ConfigSnapshot）
 _config_cache = None
 _config_path = None
+_config_lock = threading.Lock()
+_config_version = 0
+
+# 默认的快照校验间隔（秒）
+DEFAULT_RELOAD_INTERVAL = 1.0
+
+
+class ConfigSnapshot:
+    """不可变的配置快照
+
+    Attributes:
+        data: 只读配置（dict 冻结为 MappingProxyType，list 冻结为 tuple）
+        version: 本进程内单调递增的版本号，配置内容变化时加一
+    """
+
+    __slots__ = ('data', 'version', 'path', 'stat_key', 'checked_at')
+
+    def __init__(self, data, version, path, stat_key, checked_at):
+        self.data = data
+        self.version = version
+        self.path = path
+        self.stat_key = stat_key
+        self.checked_at = checked_at
+
+
+def _freeze(value):
+    """递归地把配置转换为只读结构"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _default_config():
+    return {"apiUrls": {}, "baseTag": ""}
+
+
+def _stat_key(path):
+    """配置文件的廉价变更标识 (mtime_ns, inode, size)，文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+
+def _resolve_config_path():
+    try:
+        return current_app.config.get('CONFIG_PATH', _config_path)
+    except RuntimeError:
+        return _config_path
+
+
+def _reload_interval():
+    try:
+        return current_app.config.get('CONFIG_RELOAD_INTERVAL', DEFAULT_RELOAD_INTERVAL)
+    except RuntimeError:
+        return DEFAULT_RELOAD_INTERVAL
+
+
+def _read_config_file(config_path):
+    """从磁盘读取可修改的配置字典
+
+    Returns:
+        dict or None: 配置字典，文件存在但读取或解析失败时返回 None
+    """
+    if not config_path or not os.path.exists(config_path):
+        return _default_config()
+    
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        print(f"读取配置文件失败: {e}")
+        return None
+
+
+def _thaw(value):
+    """把只读快照转换回可修改的结构"""
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+def _load_config_for_update():
+    """读取要修改的配置，文件损坏时基于当前快照修改，避免用默认配置覆盖原有内容"""
+    config = _read_config_file(_resolve_config_path())
+    if config is None:
+        config = _thaw(get_config_snapshot().data)
+    return config
+
+
+def _write_config_file(config_path, config):
+    """先写入临时文件再替换，读取方不会看到写了一半的配置"""
+    tmp_path = f'{config_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, config_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _swap_snapshot(config, config_path, stat_key, now):
+    """用新配置替换当前快照（调用方需持有 _config_lock）"""
+    global _config_cache, _config_version
+    _config_version += 1
+    _config_cache = ConfigSnapshot(_freeze(config), _config_version, config_path, stat_key, now)
+    return _config_cache
 
 def init_db(app):
     """初始化配置模块"""
@@ -20,44 +142,52 @@ def init_db(app):
             "apiUrls": {},
             "baseTag": ""
         }
-        with open(_config_path, 'w', encoding='utf-8') as f:
-            json.dump(default_config, f, ensure_ascii=False, indent=2)
+        _write_config_file(_config_path, default_config)
 
-def get_current_config():
-    """获取当前配置"""
-    global _config_cache, _config_path
-    
-    # 尝试从 Flask app 获取路径
-    try:
-        config_path = current_app.config.get('CONFIG_PATH', _config_path)
-    except RuntimeError:
-        config_path = _config_path
-    
-    if not config_path or not os.path.exists(config_path):
-        return {"apiUrls": {}, "baseTag": ""}
+def get_config_snapshot():
+    """获取当前配置快照，必要时按文件状态重新加载
+
+    Returns:
+        ConfigSnapshot: 当前配置快照
+    """
+    config_path = _resolve_config_path()
+    snapshot = _config_cache
+    now = time.monotonic()
+    if (snapshot is not None and snapshot.path == config_path
+            and now - snapshot.checked_at < _reload_interval()):
+        return snapshot
     
-    try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (json.JSONDecodeError, IOError) as e:
-        print(f"读取配置文件失败: {e}")
-        return {"apiUrls": {}, "baseTag": ""}
+    with _config_lock:
+        snapshot = _config_cache
+        stat_key = _stat_key(config_path) if config_path else None
+        if snapshot is not None and snapshot.path == config_path and snapshot.stat_key == stat_key:
+            snapshot.checked_at = now
+            return snapshot
+        config = _read_config_file(config_path)
+        if config is None:
+            if snapshot is not None and snapshot.path == config_path:
+                # 文件损坏时保留上一份快照，文件再次变化后重新读取
+                snapshot.stat_key = stat_key
+                snapshot.checked_at = now
+                return snapshot
+            config = _default_config()
+        return _swap_snapshot(config, config_path, stat_key, now)
+
+def get_current_config():
+    """获取当前配置（只读，修改配置请使用 save_config）"""
+    return get_config_snapshot().data
 
 def save_config(config):
-    """保存配置到文件"""
-    global _config_path
-    
-    try:
-        config_path = current_app.config.get('CONFIG_PATH', _config_path)
-    except RuntimeError:
-        config_path = _config_path
+    """保存配置到文件，并原子地替换内存中的配置快照"""
+    config_path = _resolve_config_path()
     
     if not config_path:
         raise ValueError("配置文件路径未设置")
     
     try:
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        with _config_lock:
+            _write_config_file(config_path, config)
+            _swap_snapshot(config, config_path, _stat_key(config_path), time.monotonic())
         return True
     except IOError as e:
         print(f"保存配置文件失败: {e}")
@@ -82,7 +212,7 @@ def add_api_endpoint(name, endpoint_config):
     Returns:
         bool: 成功返回 True，失败返回 False
     """
-    config = get_current_config()
+    config = _load_config_for_update()
     
     if name in config.get('apiUrls', {}):
         return False  # 端点已存在
@@ -98,17 +228,17 @@ def update_api_endpoint(name, endpoint_config):
     
     Args:
         name: 端点名称
-        endpoint_config: 新的端点配置
+        endpoint_config: 要更新的字段，未提供的字段（如 queryParams、proxySettings）保持不变
     
     Returns:
         bool: 成功返回 True，失败返回 False
     """
-    config = get_current_config()
+    config = _load_config_for_update()
     
     if name not in config.get('apiUrls', {}):
         return False  # 端点不存在
     
-    config['apiUrls'][name] = endpoint_config
+    config['apiUrls'][name].update(endpoint_config)
     return save_config(config)
 
 def delete_api_endpoint(name):
@@ -120,7 +250,7 @@ def delete_api_endpoint(name):
     Returns:
         bool: 成功返回 True，失败返回 False
     """
-    config = get_current_config()
+    config = _load_config_for_update()
     
     if name not in config.get('apiUrls', {}):
         return False
@@ -128,3 +258,40 @@ def delete_api_endpoint(name):
     del config['apiUrls'][name]
     return save_config(config)
 
+# =====================
+# 合集设置管理函数
+# =====================
+
+# 随机图片的返回方式：direct 直接返回图片内容，redirect 302 重定向到固定的 /picture/ 地址
+COLLECTION_DELIVERY_MODES = ('direct', 'redirect')
+
+def get_collection_settings(name):
+    """获取合集设置（只读），未设置时返回空字典"""
+    config = get_current_config()
+    return config.get('collectionSettings', {}).get(name, {})
+
+def update_collection_settings(name, settings):
+    """更新合集设置
+    
+    Args:
+        name: 合集名称
+        settings: 要更新的字段，未提供的字段保持不变
+    
+    Returns:
+        bool: 成功返回 True，失败返回 False
+    """
+    config = _load_config_for_update()
+    config.setdefault('collectionSettings', {}).setdefault(name, {}).update(settings)
+    return save_config(config)
+
+def delete_collection_settings(name):
+    """删除合集设置（合集被删除时调用）
+    
+    Returns:
+        bool: 成功或本来就没有设置时返回 True
+    """
+    config = _load_config_for_update()
+    if name not in config.get('collectionSettings', {}):
+        return True
+    del config['collectionSettings'][name]
+    return save_config(config)
@@ -0,0 +1,42 @@
+"""
+后台任务模块 - 持久化的任务表与跨 worker 的任务调度
+"""
+import os
+from app.jobs.manager import JobContext, JobManager, job_manager
+from app.jobs.operations import OPERATIONS
+
+__all__ = [
+    'JobContext',
+    'JobManager',
+    'job_manager',
+    'init_jobs'
+]
+
+
+def init_jobs(app):
+    """初始化后台任务模块
+
+    任务表默认保存在图片目录下的 .jobs/jobs.sqlite3，与图片一起持久化。
+
+    Args:
+        app: Flask应用实例
+    """
+    db_path = app.config.get('JOBS_DB_PATH')
+    if not db_path:
+        from app.storage import storage_manager
+        with app.app_context():
+            db_path = os.path.join(storage_manager.base_dir, '.jobs', 'jobs.sqlite3')
+
+    job_manager.configure(
+        app,
+        db_path,
+        concurrency=app.config.get('JOB_CONCURRENCY', 2),
+        stale_after=app.config.get('JOB_STALE_AFTER', 60),
+        max_attempts=app.config.get('JOB_MAX_ATTEMPTS', 3),
+        retention_days=app.config.get('JOB_RETENTION_DAYS', 7)
+    )
+    for operation, (func, description) in OPERATIONS.items():
+        job_manager.register(operation, func, description)
+
+    # 每个 worker 进程在处理第一个请求时启动调度线程，接手重启前遗留的排队任务
+    app.before_request(job_manager.ensure_running)
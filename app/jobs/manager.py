@@ -0,0 +1,185 @@
+"""
+后台任务调度
+
+每个 worker 进程运行一个调度线程：领取排队任务交给线程池执行、刷新本进程任务的心跳、
+把心跳超时（所属进程已退出）的任务重新排队。全部进程合计同时运行的任务数不超过 JOB_CONCURRENCY。
+"""
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.jobs.store import DONE, FAILED, JobStore
+
+# 调度线程的轮询间隔（秒）
+_POLL_INTERVAL = 1.0
+# 心跳间隔（秒）
+_HEARTBEAT_INTERVAL = 5.0
+# 进度写入数据库的最小间隔（秒）
+_PROGRESS_INTERVAL = 0.5
+# 清理过期任务记录的间隔（秒）
+_PURGE_INTERVAL = 3600
+
+
+class JobContext:
+    """传给任务函数的上下文，用于报告进度
+
+    Args:
+        store: JobStore
+        job: 任务记录
+    """
+
+    def __init__(self, store, job):
+        self.store = store
+        self.job = job
+        self.params = job['params']
+        self._reported_at = 0
+
+    def progress(self, done=None, total=None, message=None, force=False):
+        """报告进度（限频写入）
+
+        Args:
+            done: 已完成数量
+            total: 总数量
+            message: 进度说明
+            force: 忽略限频立即写入（完成最后一项时总是写入）
+        """
+        now = time.monotonic()
+        finished = done is not None and done == total
+        if not (force or finished) and now - self._reported_at < _PROGRESS_INTERVAL:
+            return
+        self._reported_at = now
+        self.store.update_progress(self.job['id'], self.job['owner'], done, total, message)
+
+
+class JobManager:
+    """任务提交与执行"""
+
+    def __init__(self):
+        self.store = None
+        self.concurrency = 2
+        self.stale_after = 60
+        self.max_attempts = 3
+        self.retention = 7 * 86400
+        self._operations = {}
+        self._app = None
+        self._owner = None
+        self._executor = None
+        self._active = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def configure(self, app, db_path, concurrency=2, stale_after=60, max_attempts=3, retention_days=7):
+        """设置任务表位置与调度参数"""
+        self._app = app
+        self.store = JobStore(db_path)
+        self.concurrency = max(1, concurrency)
+        self.stale_after = stale_after
+        self.max_attempts = max(1, max_attempts)
+        self.retention = retention_days * 86400
+
+    def register(self, operation, func, description):
+        """注册任务类型
+
+        Args:
+            operation: 任务类型名称
+            func: func(context, collection) -> (结果 dict, 说明)
+            description: 显示名称
+        """
+        self._operations[operation] = (func, description)
+
+    def describe(self, operation):
+        """任务类型的显示名称"""
+        entry = self._operations.get(operation)
+        return entry[1] if entry else operation
+
+    def ensure_running(self):
+        """确保当前进程的调度线程已启动（fork 后的新进程会重新启动）"""
+        pid = os.getpid()
+        if self._owner is not None and self._owner.endswith(f':{pid}'):
+            return
+        with self._lock:
+            if self._owner is not None and self._owner.endswith(f':{pid}'):
+                return
+            self._owner = f'{socket.gethostname()}:{pid}'
+            self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='job')
+            self._active = 0
+            threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True).start()
+
+    def submit(self, operation, collection, params=None):
+        """提交任务
+
+        Args:
+            operation: 任务类型
+            collection: 合集名称
+            params: 任务参数
+
+        Returns:
+            tuple: (任务, 是否新建)；同一合集已有相同类型的排队或运行中任务时返回该任务
+        """
+        if operation not in self._operations:
+            raise ValueError(f'未知的任务类型: {operation}')
+        self.ensure_running()
+        job, created = self.store.create(operation, collection, params)
+        if created:
+            self._wake.set()
+        return job, created
+
+    def get(self, job_id):
+        return self.store.get(job_id)
+
+    def list(self, collection=None, active_only=False, limit=50):
+        return self.store.list(collection, active_only, limit)
+
+    def _dispatch_loop(self):
+        owner = self._owner
+        last_heartbeat = last_purge = 0
+        while True:
+            self._wake.wait(_POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                now = time.monotonic()
+                if now - last_heartbeat >= _HEARTBEAT_INTERVAL:
+                    last_heartbeat = now
+                    if self._active:
+                        self.store.heartbeat(owner)
+                    requeued = self.store.requeue_stale(self.stale_after, self.max_attempts)
+                    if requeued:
+                        self._app.logger.warning(f"{requeued} 个后台任务的执行进程已退出，已重新排队。")
+                if now - last_purge >= _PURGE_INTERVAL:
+                    last_purge = now
+                    self.store.purge(time.time() - self.retention)
+                while self._active < self.concurrency:
+                    job = self.store.claim(owner, self.concurrency)
+                    if job is None:
+                        break
+                    with self._lock:
+                        self._active += 1
+                    self._executor.submit(self._execute, job)
+            except Exception as e:
+                self._app.logger.error(f"后台任务调度失败: {e}")
+
+    def _execute(self, job):
+        app = self._app
+        try:
+            app.logger.info(f"开始后台任务 #{job['id']}: {self.describe(job['operation'])} '{job['collection']}'")
+            try:
+                func = self._operations[job['operation']][0]
+                with app.app_context():
+                    result, message = func(JobContext(self.store, job), job['collection'])
+            except Exception as e:
+                app.logger.error(f"后台任务 #{job['id']} 失败: {e}", exc_info=True)
+                if not self.store.finish(job['id'], job['owner'], FAILED, message=str(e)):
+                    app.logger.warning(f"后台任务 #{job['id']} 已被重新排队，忽略本次执行结果")
+                return
+            if not self.store.finish(job['id'], job['owner'], DONE, message=message, result=result):
+                app.logger.warning(f"后台任务 #{job['id']} 已被重新排队，忽略本次执行结果")
+                return
+            app.logger.info(f"后台任务 #{job['id']} 完成: {message}")
+        finally:
+            with self._lock:
+                self._active -= 1
+            self._wake.set()
+
+
+job_manager = JobManager()
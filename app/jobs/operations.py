@@ -0,0 +1,95 @@
+"""
+后台任务类型
+
+每个任务函数接收 (JobContext, 合集名称)，返回 (结果 dict, 完成说明)。
+"""
+import os
+from app.database import delete_collection_settings
+from app.storage import storage_manager
+from app.storage.uploads import ARCHIVE_FILE_PREFIX, UPLOAD_FILE_PREFIX
+
+
+def cache_collection(context, collection):
+    """缓存合集的全部外链图片"""
+    def on_item(done, total, downloaded):
+        context.progress(done, total, f'已下载 {downloaded} 张')
+
+    if not storage_manager.collection_exists(collection):
+        raise ValueError(f"合集 '{collection}' 不存在")
+    downloaded = storage_manager.cache_external_images(collection, on_item=on_item)
+    return {'downloaded': downloaded}, f'共下载 {downloaded} 张新图片'
+
+
+def rename_long_filenames(context, collection):
+    """把合集中文件名过长的图片重命名为顺序编号"""
+    if not storage_manager.collection_exists(collection):
+        raise ValueError(f"合集 '{collection}' 不存在")
+    renamed = storage_manager.rename_long_filenames_in_collection(collection)
+    return {'renamed': renamed}, f'重命名 {renamed} 张图片'
+
+
+def delete_collection(context, collection):
+    """删除整个合集"""
+    if not storage_manager.delete_collection(collection):
+        raise ValueError(f"删除合集 '{collection}' 失败")
+    delete_collection_settings(collection)
+    return {'deleted': True}, '合集已删除'
+
+
+def validate_links(context, collection):
+    """检查合集外链，params.remove 为真时删除失效链接"""
+    def on_item(done, total, broken_count):
+        context.progress(done, total, f'失效 {broken_count} 个')
+
+    if not storage_manager.collection_exists(collection):
+        raise ValueError(f"合集 '{collection}' 不存在")
+    remove = bool(context.params.get('remove'))
+    broken = storage_manager.validate_collection_links(collection, remove=remove, on_item=on_item)
+    result = {
+        'brokenCount': len(broken),
+        'removed': len(broken) if remove else 0,
+        # 只保留前 100 条，避免任务记录过大
+        'broken': [{'url': url, 'reason': reason} for url, reason in broken[:100]]
+    }
+    message = f'发现 {len(broken)} 个失效外链' + ('，已删除' if remove and broken else '')
+    return result, message
+
+
+def import_archive(context, collection):
+    """把上传的压缩包解压导入合集，params.archive 为合集目录下的压缩包文件名"""
+    def on_item(done, total, imported):
+        context.progress(done, total, f'已导入 {imported} 张')
+
+    if not storage_manager.collection_exists(collection):
+        raise ValueError(f"合集 '{collection}' 不存在")
+    archive = context.params.get('archive', '')
+    # 兼容以上传临时文件名排队的旧任务
+    if not archive.startswith((ARCHIVE_FILE_PREFIX, UPLOAD_FILE_PREFIX)) or os.path.basename(archive) != archive:
+        raise ValueError(f"无效的压缩包文件名 '{archive}'")
+    archive_path = os.path.join(storage_manager.base_dir, collection, archive)
+    if not os.path.isfile(archive_path):
+        raise ValueError('压缩包已不存在，请重新上传')
+    # 重试时跳过上次已处理的成员（进度限频写入，最后少量成员可能重复导入）
+    skip = context.job['progress'] if context.job['attempts'] > 1 else 0
+    try:
+        stats = storage_manager.import_archive(collection, archive_path, skip=skip, on_item=on_item)
+    finally:
+        # 进程中途退出时压缩包保留，重新排队后继续导入
+        try:
+            os.remove(archive_path)
+        except FileNotFoundError:
+            pass
+    message = f"导入 {stats['imported']} 张图片"
+    ignored = stats['skipped'] + stats['oversized'] + stats['failed']
+    if ignored:
+        message += f"，{ignored} 个文件未导入"
+    return stats, message
+
+
+OPERATIONS = {
+    'cache': (cache_collection, '缓存外链图片'),
+    'rename': (rename_long_filenames, '重命名长文件名'),
+    'delete': (delete_collection, '删除合集'),
+    'validate_links': (validate_links, '检查外链'),
+    'import_archive': (import_archive, '导入压缩包'),
+}
@@ -0,0 +1,228 @@
+"""
+后台任务表（SQLite）
+
+任务记录持久化在图片目录下，worker 重启后仍然可见：
+- (operation, collection) 上的部分唯一索引保证同一操作在同一合集上最多只有一个排队或运行中的任务
+- 领取任务在 BEGIN IMMEDIATE 事务中完成，多个 gunicorn worker 之间不会重复领取
+- 运行中的任务由所属进程定期更新心跳，心跳超时的任务重新排队
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    operation TEXT NOT NULL,
+    collection TEXT NOT NULL,
+    params TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    message TEXT NOT NULL DEFAULT '',
+    result TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_unique
+    ON jobs (operation, collection) WHERE status IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+_COLUMNS = ('id', 'operation', 'collection', 'params', 'status', 'progress', 'total', 'message',
+            'result', 'attempts', 'owner', 'created_at', 'started_at', 'finished_at', 'heartbeat_at',
+            'updated_at')
+
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(zip(_COLUMNS, row))
+    job['params'] = json.loads(job['params'] or '{}')
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+class JobStore:
+    """任务表的读写封装，每个线程使用独立的连接
+
+    Args:
+        path: SQLite 数据库文件路径
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _select(self, where='', args=(), limit=None):
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+        if where:
+            sql += f' WHERE {where}'
+        sql += ' ORDER BY id DESC'
+        if limit:
+            sql += f' LIMIT {int(limit)}'
+        return [_row_to_job(row) for row in self._connect().execute(sql, args)]
+
+    def create(self, operation, collection, params=None):
+        """创建排队任务
+
+        Returns:
+            tuple: (任务, 是否新建)；已有相同的排队或运行中任务时返回该任务
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                'INSERT INTO jobs (operation, collection, params, status, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (operation, collection, json.dumps(params or {}, ensure_ascii=False), QUEUED, now, now)
+            )
+            return self.get(cursor.lastrowid), True
+        except sqlite3.IntegrityError:
+            existing = self._select(
+                'operation = ? AND collection = ? AND status IN (?, ?)',
+                (operation, collection) + ACTIVE_STATUSES, limit=1
+            )
+            if existing:
+                return existing[0], False
+            # 冲突的任务恰好在此期间结束，重新提交
+            return self.create(operation, collection, params)
+
+    def get(self, job_id):
+        """按 ID 获取任务，不存在时返回 None"""
+        jobs = self._select('id = ?', (job_id,), limit=1)
+        return jobs[0] if jobs else None
+
+    def list(self, collection=None, active_only=False, limit=50):
+        """按 ID 倒序列出任务"""
+        clauses, args = [], []
+        if collection is not None:
+            clauses.append('collection = ?')
+            args.append(collection)
+        if active_only:
+            clauses.append('status IN (?, ?)')
+            args.extend(ACTIVE_STATUSES)
+        return self._select(' AND '.join(clauses), tuple(args), limit=limit)
+
+    def claim(self, owner, max_running):
+        """领取最早的排队任务
+
+        Args:
+            owner: 领取者标识
+            max_running: 全部进程合计允许同时运行的任务数
+
+        Returns:
+            dict or None: 领取到的任务
+        """
+        conn = self._connect()
+        if conn.execute('SELECT 1 FROM jobs WHERE status = ? LIMIT 1', (QUEUED,)).fetchone() is None:
+            return None
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            running = conn.execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (RUNNING,)).fetchone()[0]
+            row = None
+            if running < max_running:
+                row = conn.execute(
+                    'SELECT id FROM jobs WHERE status = ? ORDER BY id LIMIT 1', (QUEUED,)
+                ).fetchone()
+            if row is not None:
+                now = time.time()
+                conn.execute(
+                    'UPDATE jobs SET status = ?, owner = ?, attempts = attempts + 1, started_at = ?, '
+                    'heartbeat_at = ?, updated_at = ? WHERE id = ?',
+                    (RUNNING, owner, now, now, now, row[0])
+                )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return self.get(row[0]) if row is not None else None
+
+    def update_progress(self, job_id, owner, progress=None, total=None, message=None):
+        """更新运行中任务的进度
+
+        只有任务仍由 owner 运行时才会写入：心跳超时后被重新排队并由其他进程领取的任务，
+        不会被原来的执行者覆盖。
+
+        Returns:
+            bool: 是否写入
+        """
+        now = time.time()
+        cursor = self._connect().execute(
+            'UPDATE jobs SET progress = COALESCE(?, progress), total = COALESCE(?, total), '
+            'message = COALESCE(?, message), heartbeat_at = ?, updated_at = ? '
+            'WHERE id = ? AND owner = ? AND status = ?',
+            (progress, total, message, now, now, job_id, owner, RUNNING)
+        )
+        return cursor.rowcount > 0
+
+    def finish(self, job_id, owner, status, message='', result=None):
+        """把 owner 正在运行的任务标记为完成或失败
+
+        Returns:
+            bool: 是否写入（任务已被重新排队或由其他进程领取时为 False）
+        """
+        now = time.time()
+        cursor = self._connect().execute(
+            'UPDATE jobs SET status = ?, message = ?, result = ?, finished_at = ?, updated_at = ? '
+            'WHERE id = ? AND owner = ? AND status = ?',
+            (status, message, json.dumps(result, ensure_ascii=False) if result is not None else None,
+             now, now, job_id, owner, RUNNING)
+        )
+        return cursor.rowcount > 0
+
+    def heartbeat(self, owner):
+        """刷新 owner 名下所有运行中任务的心跳"""
+        self._connect().execute(
+            'UPDATE jobs SET heartbeat_at = ? WHERE status = ? AND owner = ?',
+            (time.time(), RUNNING, owner)
+        )
+
+    def requeue_stale(self, stale_after, max_attempts):
+        """把心跳超时的运行中任务重新排队，尝试次数用尽的标记为失败
+
+        Returns:
+            int: 受影响的任务数
+        """
+        now = time.time()
+        cursor = self._connect().execute(
+            'UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, owner = NULL, '
+            "message = '执行任务的进程已退出', updated_at = ?, "
+            'finished_at = CASE WHEN attempts >= ? THEN ? ELSE NULL END '
+            'WHERE status = ? AND heartbeat_at < ?',
+            (max_attempts, FAILED, QUEUED, now, max_attempts, now, RUNNING, now - stale_after)
+        )
+        return cursor.rowcount
+
+    def purge(self, older_than):
+        """删除结束时间早于 older_than（时间戳）的任务记录"""
+        self._connect().execute(
+            'DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?', (DONE, FAILED, older_than)
+        )
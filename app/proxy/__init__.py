@@ -0,0 +1,44 @@
+"""
+API 转发模块 - 端点调度计划与代理请求处理
+"""
+from app.proxy.breaker import circuit_breakers, init_breakers
+from app.proxy.bulkhead import proxy_bulkheads
+from app.proxy.cache import proxy_cache
+from app.proxy.client import http_client, init_http_client, parse_host_pool_sizes
+from app.proxy.handler import handle_proxy_request, get_value_by_dot_notation
+from app.proxy.plan import EndpointPlan, get_endpoint_plan, get_endpoint_plans
+from app.proxy.prefetch import get_prefetch_stats
+from app.proxy.singleflight import proxy_singleflight
+
+__all__ = [
+    'http_client',
+    'circuit_breakers',
+    'proxy_bulkheads',
+    'proxy_cache',
+    'proxy_singleflight',
+    'init_proxy',
+    'handle_proxy_request',
+    'get_value_by_dot_notation',
+    'EndpointPlan',
+    'get_endpoint_plan',
+    'get_endpoint_plans',
+    'get_prefetch_stats'
+]
+
+
+def init_proxy(app):
+    """初始化 API 转发模块
+
+    Args:
+        app: Flask应用实例
+    """
+    init_http_client(app)
+    init_breakers(app)
+    proxy_bulkheads.configure(
+        directory=app.config.get('PROXY_BULKHEAD_DIR', ''),
+        global_limit=app.config.get('PROXY_GLOBAL_LIMIT', 0),
+        host_limits=parse_host_pool_sizes(app.config.get('PROXY_HOST_LIMITS', '')),
+        wait=app.config.get('PROXY_BULKHEAD_WAIT', 2)
+    )
+    proxy_cache.configure(app.config.get('PROXY_CACHE_SIZE', 1024))
+    proxy_singleflight.configure(app.config.get('PROXY_SINGLEFLIGHT_DIR', ''))
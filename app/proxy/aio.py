@@ -0,0 +1,285 @@
+"""
+异步代理模块（供 ASGI 入口使用）
+
+与 handler 使用相同的结果提取、响应缓存、熔断、并发隔离与对冲逻辑，
+上游请求改用 httpx.AsyncClient，单个进程即可同时挂起大量上游请求。
+"""
+import asyncio
+import time
+from contextlib import AsyncExitStack
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+import httpx
+from app.proxy.breaker import circuit_breakers
+from app.proxy.bulkhead import proxy_bulkheads
+from app.proxy.cache import proxy_cache
+from app.proxy.client import http_client
+from app.proxy.handler import ProxyResult, build_proxy_result
+from app.proxy.stream import upstream_request_headers
+
+# 进程内正在进行的上游请求：合并键 -> Future
+_inflight = {}
+# 后台刷新任务（保留引用避免被回收）
+_background_tasks = set()
+
+
+class AsyncHttpClient:
+    """按进程共享的异步 HTTP 客户端，在事件循环中首次使用时创建"""
+
+    def __init__(self):
+        self.max_connections = 1000
+        self._client = None
+
+    def configure(self, max_connections=1000):
+        """设置最大连接数，下次请求时重建客户端"""
+        self.max_connections = max_connections
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            client = httpx.AsyncClient(limits=httpx.Limits(max_connections=self.max_connections))
+            # 与同步客户端一致，不在不同用户请求之间共享上游 Cookie
+            client.cookies.jar.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            self._client = client
+        return self._client
+
+    async def get(self, url, timeout):
+        """发送 GET 请求
+
+        Args:
+            url: 目标 URL
+            timeout: (连接超时, 读取超时)
+        """
+        connect, read = timeout
+        return await self.client.get(url, timeout=httpx.Timeout(read, connect=connect))
+
+    async def open_stream(self, url, timeout, headers):
+        """发送 GET 请求并在收到响应头后返回，响应体需由调用方读取并关闭"""
+        connect, read = timeout
+        request = self.client.build_request(
+            'GET', url, headers=headers, timeout=httpx.Timeout(read, connect=connect)
+        )
+        return await self.client.send(request, stream=True)
+
+    async def aclose(self):
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+async_http_client = AsyncHttpClient()
+
+
+async def _hedged(request, delay):
+    """异步对冲请求：delay 秒内未返回时再发出一次，取先成功者并取消另一个"""
+    if delay is None:
+        return await request()
+
+    primary = asyncio.ensure_future(request())
+    done, _ = await asyncio.wait({primary}, timeout=delay)
+    if done:
+        return primary.result()
+
+    print(f'[Breaker] Hedging request after {delay:.3f}s')
+    hedge = asyncio.ensure_future(request())
+    pending = {primary, hedge}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+        return primary.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def fetch_proxy_result_async(target_url, proxy_settings):
+    """fetch_proxy_result 的异步版本
+
+    Args:
+        target_url: 目标 URL
+        proxy_settings: 端点的 proxySettings
+
+    Returns:
+        ProxyResult: 处理结果
+    """
+    host = urlsplit(target_url).netloc
+    breaker = circuit_breakers.get(host)
+    if not breaker.allow():
+        print(f'[Proxy] Circuit open for {host}, failing fast')
+        return ProxyResult('unavailable', breaker.retry_after(), 503)
+
+    timeout = http_client.timeout_for(proxy_settings)
+    delay = breaker.p95() if proxy_settings.get('hedge') else None
+    started = time.monotonic()
+    try:
+        print(f'[Proxy] Requesting: {target_url}')
+        resp = await _hedged(lambda: async_http_client.get(target_url, timeout), delay)
+    except httpx.TimeoutException:
+        breaker.record(False, time.monotonic() - started)
+        return ProxyResult('error', {'error': 'Proxy request timeout'}, 504)
+    except httpx.HTTPError as e:
+        breaker.record(False, time.monotonic() - started)
+        print(f'[Proxy] Failed: {str(e)}')
+        return ProxyResult('error', {'error': 'Proxy setup failed'}, 500)
+    except asyncio.CancelledError:
+        breaker.abandon()
+        raise
+    except BaseException:
+        breaker.record(False, time.monotonic() - started)
+        raise
+    breaker.record(resp.status_code < 500, time.monotonic() - started)
+    return build_proxy_result(resp, proxy_settings)
+
+
+async def _bulkheaded_fetch(target_url, proxy_settings, endpoint):
+    host = urlsplit(target_url).netloc
+    async with proxy_bulkheads.admit_async(endpoint, proxy_settings.get('maxConcurrency'), host) as admitted:
+        if not admitted:
+            return ProxyResult('unavailable', 1, 503)
+        return await fetch_proxy_result_async(target_url, proxy_settings)
+
+
+async def _coalesced_fetch(key, target_url, proxy_settings, endpoint):
+    """合并进程内同一目标的并发上游请求"""
+    future = _inflight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = _inflight[key] = asyncio.get_running_loop().create_future()
+    try:
+        result = await _bulkheaded_fetch(target_url, proxy_settings, endpoint)
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        # 没有其他等待者时避免 "exception was never retrieved" 警告
+        future.exception()
+        raise
+    finally:
+        del _inflight[key]
+
+
+async def _refresh(key, target_url, proxy_settings, endpoint, ttl, stale_ttl):
+    try:
+        result = await _coalesced_fetch(key, target_url, proxy_settings, endpoint)
+        proxy_cache.store(key, result, ttl, stale_ttl)
+    except Exception as e:
+        print(f'[ProxyCache] Refresh failed for {key}: {e}')
+    finally:
+        proxy_cache.end_refresh(key)
+
+
+async def get_proxy_result_async(target_url, proxy_settings, endpoint=None):
+    """get_proxy_result 的异步版本，与同步入口共用响应缓存
+
+    Args:
+        target_url: 目标 URL
+        proxy_settings: 端点的 proxySettings
+        endpoint: 端点名称（用于按端点限制并发）
+    """
+    key = (target_url, proxy_settings.get('imageUrlField'))
+    ttl = proxy_settings.get('cacheTtl')
+    if not ttl:
+        return await _coalesced_fetch(key, target_url, proxy_settings, endpoint)
+
+    ttl = float(ttl)
+    stale_ttl = float(proxy_settings.get('staleTtl') or 0)
+    result, state = proxy_cache.lookup(key)
+    if state == 'fresh':
+        return result
+    if state == 'stale':
+        if proxy_cache.begin_refresh(key):
+            task = asyncio.ensure_future(
+                _refresh(key, target_url, proxy_settings, endpoint, ttl, stale_ttl)
+            )
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+        return result
+
+    result = await _coalesced_fetch(key, target_url, proxy_settings, endpoint)
+    proxy_cache.store(key, result, ttl, stale_ttl)
+    return result
+
+
+class AsyncUpstreamStream:
+    """已打开的上游流式响应，关闭时同时释放并发名额"""
+
+    __slots__ = ('response', '_stack')
+
+    def __init__(self, response, stack):
+        self.response = response
+        self._stack = stack
+
+    async def aclose(self):
+        await self._stack.aclose()
+
+
+async def open_stream_async(target_url, proxy_settings, endpoint, request_headers):
+    """handle_stream_request 的异步版本：打开要转发的上游图片响应
+
+    Args:
+        target_url: 目标 URL
+        proxy_settings: 端点的 proxySettings
+        endpoint: 端点名称
+        request_headers: 客户端请求头
+
+    Returns:
+        AsyncUpstreamStream 或 ProxyResult（失败时）
+    """
+    image_url = target_url
+    if proxy_settings.get('imageUrlField'):
+        result = await get_proxy_result_async(target_url, proxy_settings, endpoint)
+        if result.kind != 'image':
+            return result
+        image_url = result.value
+
+    host = urlsplit(image_url).netloc
+    breaker = circuit_breakers.get(host)
+    if not breaker.allow():
+        return ProxyResult('unavailable', breaker.retry_after(), 503)
+
+    stack = AsyncExitStack()
+    admitted = await stack.enter_async_context(
+        proxy_bulkheads.admit_async(endpoint, proxy_settings.get('maxConcurrency'), host)
+    )
+    if not admitted:
+        await stack.aclose()
+        return ProxyResult('unavailable', 1, 503)
+
+    started = time.monotonic()
+    try:
+        print(f'[Stream] Requesting: {image_url}')
+        response = await async_http_client.open_stream(
+            image_url,
+            http_client.timeout_for(proxy_settings),
+            upstream_request_headers(request_headers)
+        )
+    except httpx.TimeoutException:
+        breaker.record(False, time.monotonic() - started)
+        await stack.aclose()
+        return ProxyResult('error', {'error': 'Proxy request timeout'}, 504)
+    except httpx.HTTPError as e:
+        breaker.record(False, time.monotonic() - started)
+        await stack.aclose()
+        print(f'[Stream] Failed: {str(e)}')
+        return ProxyResult('error', {'error': 'Proxy setup failed'}, 500)
+    except asyncio.CancelledError:
+        breaker.abandon()
+        await stack.aclose()
+        raise
+    except BaseException:
+        breaker.record(False, time.monotonic() - started)
+        await stack.aclose()
+        raise
+    breaker.record(response.status_code < 500, time.monotonic() - started)
+    stack.push_async_callback(response.aclose)
+
+    if response.status_code >= 400:
+        await stack.aclose()
+        return ProxyResult('error', {'error': f'Target API error ({response.status_code})'}, response.status_code)
+    return AsyncUpstreamStream(response, stack)
@@ -0,0 +1,278 @@
+"""
+上游熔断与对冲请求模块
+
+按上游主机维护熔断器：在滑动窗口内错误率（超过慢调用阈值的请求也计为失败）
+达到阈值后熔断，冷却期内直接快速失败；冷却结束后放行一个探测请求（半开），
+探测成功则恢复，失败则重新熔断。
+
+对冲请求：首个请求在该主机 p95 延迟内未返回时再发出第二个相同请求，取先返回者；
+总等待时间不超过读取超时，线程池名额用尽时不对冲。
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import requests
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# 计算 p95 所需的最少延迟样本数
+_MIN_LATENCY_SAMPLES = 20
+
+
+class CircuitBreaker:
+    """单个上游主机的熔断器
+
+    Args:
+        host: 上游主机（用于日志）
+        window: 统计窗口（秒）
+        min_requests: 窗口内至少多少个请求才判断错误率
+        error_rate: 触发熔断的错误率（0-1）
+        slow_call: 超过该耗时（秒）的请求计为失败，0 表示不按耗时判断
+        cooldown: 熔断持续时间（秒）
+    """
+
+    def __init__(self, host='', window=60, min_requests=10, error_rate=0.5, slow_call=5, cooldown=30):
+        self.host = host
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self._calls = deque()  # (时间, 是否失败)
+        self._failures = 0
+        self._latencies = deque(maxlen=200)
+        self._opened_until = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        cutoff = now - self.window
+        while self._calls and self._calls[0][0] < cutoff:
+            _, failed = self._calls.popleft()
+            self._failures -= failed
+
+    def allow(self):
+        """当前是否允许请求上游"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN and now >= self._opened_until:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def retry_after(self):
+        """距离熔断结束的秒数（至少 1）"""
+        return max(1, int(self._opened_until - time.monotonic() + 0.999))
+
+    def record(self, success, latency):
+        """记录一次请求结果
+
+        Args:
+            success: 上游是否正常响应
+            latency: 请求耗时（秒）
+        """
+        failed = not success or (self.slow_call > 0 and latency > self.slow_call)
+        now = time.monotonic()
+        with self._lock:
+            if success:
+                self._latencies.append(latency)
+
+            if self.state == HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self._calls.clear()
+                    self._failures = 0
+                return
+
+            self._calls.append((now, failed))
+            self._failures += failed
+            self._trim(now)
+            total = len(self._calls)
+            if (self.state == CLOSED and total >= self.min_requests
+                    and self._failures / total >= self.error_rate):
+                self._open(now)
+
+    def abandon(self):
+        """请求被取消、没有结果可记录时调用，释放半开状态下的探测名额"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+
+    def _open(self, now):
+        self.state = OPEN
+        self._opened_until = now + self.cooldown
+        print(f'[Breaker] Circuit opened for {self.host} ({self.cooldown}s)')
+
+    def p95(self):
+        """最近成功请求的 p95 延迟（秒），样本不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < _MIN_LATENCY_SAMPLES:
+            return None
+        return samples[int(len(samples) * 0.95) - 1]
+
+    def stats(self):
+        """熔断器统计信息"""
+        with self._lock:
+            self._trim(time.monotonic())
+            return {
+                'state': self.state,
+                'requests': len(self._calls),
+                'failures': self._failures
+            }
+
+
+class BreakerRegistry:
+    """按上游主机管理熔断器"""
+
+    def __init__(self):
+        self.settings = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def configure(self, **settings):
+        """设置新建熔断器使用的参数，并清空已有熔断器"""
+        with self._lock:
+            self.settings = settings
+            self._breakers.clear()
+
+    def get(self, host):
+        """获取主机对应的熔断器"""
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.get(host)
+                if breaker is None:
+                    breaker = self._breakers[host] = CircuitBreaker(host, **self.settings)
+        return breaker
+
+    def stats(self):
+        """所有主机的熔断器统计信息"""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {host: breaker.stats() for host, breaker in breakers.items()}
+
+
+circuit_breakers = BreakerRegistry()
+
+# 对冲请求使用的线程池与名额：(进程号, 线程池, 信号量)，fork 后在 worker 中首次使用时创建
+_hedge_executor = (None, None, None)
+_hedge_executor_lock = threading.Lock()
+_hedge_workers = 8
+
+
+def _get_hedge_executor():
+    """返回 (线程池, 名额信号量)，关闭对冲时返回 (None, None)"""
+    global _hedge_executor
+    pid = os.getpid()
+    owner, executor, slots = _hedge_executor
+    if owner != pid and _hedge_workers > 0:
+        with _hedge_executor_lock:
+            owner, executor, slots = _hedge_executor
+            if owner != pid:
+                executor = ThreadPoolExecutor(max_workers=_hedge_workers, thread_name_prefix='proxy-hedge')
+                slots = threading.BoundedSemaphore(_hedge_workers)
+                _hedge_executor = (pid, executor, slots)
+    return executor, slots
+
+
+def _submit(executor, slots, fn):
+    """占用一个名额在线程池中执行 fn，没有空闲名额时返回 None（不排队）"""
+    if not slots.acquire(blocking=False):
+        return None
+
+    def run():
+        try:
+            return fn()
+        finally:
+            slots.release()
+    return executor.submit(run)
+
+
+def _discard(future):
+    """未被采用的请求完成后关闭其响应，释放连接"""
+    def close(f):
+        if not f.cancelled() and f.exception() is None:
+            close_result = getattr(f.result(), 'close', None)
+            if close_result is not None:
+                close_result()
+    future.add_done_callback(close)
+
+
+def hedged_call(fn, delay, timeout=None):
+    """执行 fn，若 delay 秒内未完成则再并发执行一次，返回先完成的结果
+
+    线程池名额用尽时不再对冲（也不排队等待），直接在当前线程执行或只等待首个请求。
+
+    Args:
+        fn: 无参可调用对象
+        delay: 发出第二个请求前的等待时间（秒），None 表示不对冲
+        timeout: 等待结果的总时长上限（秒），None 表示不限制
+
+    Returns:
+        fn() 的返回值（先完成者；两者都失败时抛出首个请求的异常）
+
+    Raises:
+        requests.exceptions.ReadTimeout: 超过 timeout 仍未得到结果
+    """
+    executor, slots = _get_hedge_executor() if delay is not None else (None, None)
+    primary = _submit(executor, slots, fn) if executor is not None else None
+    if primary is None:
+        return fn()
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    done, _ = wait([primary], timeout=delay if deadline is None else min(delay, timeout))
+    if done:
+        return primary.result()
+
+    hedge = None
+    if deadline is None or time.monotonic() < deadline:
+        hedge = _submit(executor, slots, fn)
+    if hedge is not None:
+        print(f'[Breaker] Hedging request after {delay:.3f}s')
+    pending = {primary, hedge} - {None}
+    while pending:
+        remaining = None if deadline is None else deadline - time.monotonic()
+        if remaining is not None and remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    _discard(other)
+                return future.result()
+    if not pending:
+        return primary.result()
+    for future in pending:
+        _discard(future)
+    raise requests.exceptions.ReadTimeout(f'Hedged request did not complete within {timeout}s')
+
+
+def init_breakers(app):
+    """根据应用配置初始化熔断器与对冲线程池
+
+    Args:
+        app: Flask应用实例
+    """
+    global _hedge_workers
+    circuit_breakers.configure(
+        window=app.config.get('PROXY_BREAKER_WINDOW', 60),
+        min_requests=app.config.get('PROXY_BREAKER_MIN_REQUESTS', 10),
+        error_rate=app.config.get('PROXY_BREAKER_ERROR_RATE', 0.5),
+        slow_call=app.config.get('PROXY_BREAKER_SLOW_CALL', 5),
+        cooldown=app.config.get('PROXY_BREAKER_COOLDOWN', 30)
+    )
+    _hedge_workers = app.config.get('PROXY_HEDGE_WORKERS', 8)
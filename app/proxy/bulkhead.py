@@ -0,0 +1,154 @@
+"""
+代理并发隔离（bulkhead）模块
+
+用一组槽位文件实现跨 worker 的计数信号量：限额为 N 时对应 N 个槽位文件，
+持有其中任意一个文件的 flock 即占用一个并发名额，进程退出时自动释放。
+分别限制单个端点、单个上游主机以及全部代理请求的并发数，
+使慢上游无法占满所有 worker，本地合集请求始终有可用的 worker。
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from contextlib import asynccontextmanager, contextmanager
+from app.storage.filelock import FileLock
+
+# 等待空闲槽位时的轮询间隔（秒）
+_POLL_INTERVAL = 0.05
+
+
+def default_bulkhead_dir():
+    """槽位文件默认目录：优先使用内存文件系统 /dev/shm"""
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'image-forward-bulkhead')
+
+
+class Bulkhead:
+    """跨进程计数信号量
+
+    Args:
+        name: 名称（如 'endpoint:xxx'、'host:example.com'）
+        limit: 最大并发数
+        directory: 槽位文件目录
+    """
+
+    def __init__(self, name, limit, directory):
+        self.name = name
+        self.limit = limit
+        prefix = hashlib.sha1(name.encode('utf-8')).hexdigest()[:16]
+        self._slot_paths = [os.path.join(directory, f'{prefix}.{i}.slot') for i in range(limit)]
+
+    def try_acquire(self):
+        """尝试占用一个空闲槽位
+
+        Returns:
+            FileLock or None: 占用的槽位锁，没有空闲槽位时返回 None
+        """
+        for path in self._slot_paths:
+            lock = FileLock(path)
+            if lock.acquire(blocking=False):
+                return lock
+        return None
+
+
+class BulkheadRegistry:
+    """按端点、上游主机和全局维护并发限额"""
+
+    def __init__(self):
+        self.directory = None
+        self.global_limit = 0
+        self.host_limits = {}
+        self.wait = 0
+        self._bulkheads = {}
+
+    def configure(self, directory=None, global_limit=0, host_limits=None, wait=0):
+        """更新限额配置
+
+        Args:
+            directory: 槽位文件目录，为空时使用 default_bulkhead_dir()
+            global_limit: 全部代理请求的并发上限，0 表示不限制
+            host_limits: {上游主机: 并发上限}
+            wait: 名额已满时最长等待时间（秒），0 表示立即拒绝
+        """
+        self.directory = directory or default_bulkhead_dir()
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self.global_limit = global_limit
+        self.host_limits = dict(host_limits or {})
+        self.wait = wait
+        self._bulkheads = {}
+
+    def _get(self, name, limit):
+        key = (name, limit)
+        bulkhead = self._bulkheads.get(key)
+        if bulkhead is None:
+            bulkhead = self._bulkheads[key] = Bulkhead(name, limit, self.directory)
+        return bulkhead
+
+    def _bulkheads_for(self, endpoint, endpoint_limit, host):
+        # 固定按 端点 -> 主机 -> 全局 的顺序获取，避免相互等待
+        wanted = []
+        if endpoint and endpoint_limit:
+            wanted.append(self._get(f'endpoint:{endpoint}', int(endpoint_limit)))
+        host_limit = self.host_limits.get(host)
+        if host_limit:
+            wanted.append(self._get(f'host:{host}', host_limit))
+        if self.global_limit:
+            wanted.append(self._get('global', self.global_limit))
+        return wanted
+
+    @contextmanager
+    def admit(self, endpoint, endpoint_limit, host):
+        """在限额内执行代理请求
+
+        Args:
+            endpoint: 端点名称
+            endpoint_limit: 端点的 proxySettings.maxConcurrency
+            host: 上游主机
+
+        Yields:
+            bool: 是否获得名额；为 False 时调用方应直接拒绝请求
+        """
+        held = []
+        try:
+            if self.directory is not None:
+                deadline = time.monotonic() + self.wait
+                for bulkhead in self._bulkheads_for(endpoint, endpoint_limit, host):
+                    lock = bulkhead.try_acquire()
+                    while lock is None and time.monotonic() < deadline:
+                        time.sleep(_POLL_INTERVAL)
+                        lock = bulkhead.try_acquire()
+                    if lock is None:
+                        print(f'[Bulkhead] {bulkhead.name} is full ({bulkhead.limit}), rejecting')
+                        yield False
+                        return
+                    held.append(lock)
+            yield True
+        finally:
+            for lock in reversed(held):
+                lock.release()
+
+    @asynccontextmanager
+    async def admit_async(self, endpoint, endpoint_limit, host):
+        """admit 的异步版本，等待名额时不阻塞事件循环"""
+        held = []
+        try:
+            if self.directory is not None:
+                deadline = time.monotonic() + self.wait
+                for bulkhead in self._bulkheads_for(endpoint, endpoint_limit, host):
+                    lock = bulkhead.try_acquire()
+                    while lock is None and time.monotonic() < deadline:
+                        await asyncio.sleep(_POLL_INTERVAL)
+                        lock = bulkhead.try_acquire()
+                    if lock is None:
+                        print(f'[Bulkhead] {bulkhead.name} is full ({bulkhead.limit}), rejecting')
+                        yield False
+                        return
+                    held.append(lock)
+            yield True
+        finally:
+            for lock in reversed(held):
+                lock.release()
+
+
+proxy_bulkheads = BulkheadRegistry()
@@ -0,0 +1,123 @@
+"""
+代理响应缓存模块
+
+有界 LRU 缓存，按最终目标 URL 缓存提取出的图片 URL 或 JSON 结果。
+条目过期后仍可在 staleTtl 时间内返回旧值，同时由一个后台线程刷新。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """带过期与 stale-while-revalidate 的 LRU 缓存
+
+    Args:
+        max_entries: 最大条目数
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def configure(self, max_entries):
+        """调整最大条目数"""
+        with self._lock:
+            self.max_entries = max_entries
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def store(self, key, result, ttl, stale_ttl=0):
+        """写入缓存（不可缓存的结果会被忽略）"""
+        if not getattr(result, 'cacheable', True):
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (result, now + ttl, now + ttl + stale_ttl)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def lookup(self, key):
+        """查询缓存
+
+        Returns:
+            tuple: (缓存值, 状态)，状态为 'fresh' 或 'stale'；未命中时为 (None, None)
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            result, fresh_until, stale_until = entry
+            if now >= stale_until:
+                del self._entries[key]
+                return None, None
+            self._entries.move_to_end(key)
+            return result, 'fresh' if now < fresh_until else 'stale'
+
+    def begin_refresh(self, key):
+        """登记后台刷新，同一键已有刷新在进行时返回 False"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key):
+        """后台刷新结束"""
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def _refresh(self, key, fetch, ttl, stale_ttl):
+        try:
+            self.store(key, fetch(), ttl, stale_ttl)
+        except Exception as e:
+            print(f'[ProxyCache] Refresh failed for {key}: {e}')
+        finally:
+            self.end_refresh(key)
+
+    def peek(self, key):
+        """返回缓存中的值（无论是否过期），不存在时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def get_or_fetch(self, key, fetch, ttl, stale_ttl=0):
+        """获取缓存值，未命中时同步获取
+
+        Args:
+            key: 缓存键
+            fetch: 无参可调用对象，返回新值
+            ttl: 新鲜期（秒）
+            stale_ttl: 过期后仍可返回旧值的时间（秒）
+
+        Returns:
+            缓存值或 fetch() 的返回值
+        """
+        result, state = self.lookup(key)
+        if state == 'fresh':
+            return result
+        if state == 'stale':
+            # 只允许一个后台刷新
+            if self.begin_refresh(key):
+                threading.Thread(
+                    target=self._refresh, args=(key, fetch, ttl, stale_ttl), daemon=True
+                ).start()
+            return result
+
+        result = fetch()
+        self.store(key, result, ttl, stale_ttl)
+        return result
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+
+proxy_cache = ResponseCache()
@@ -0,0 +1,252 @@
+"""
+共享 HTTP 客户端模块
+
+每个 worker 进程持有一个带连接池的 requests.Session，复用到上游 API 的
+TCP/TLS 连接；支持按上游主机配置连接池大小、按端点配置超时，以及 DNS 解析结果缓存
+（仅作用于该 Session 的连接，有容量上限）。
+"""
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+# 默认超时（连接超时, 读取超时），单位秒
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 15
+
+# DNS 缓存默认最多保存的主机数
+DEFAULT_DNS_CACHE_SIZE = 256
+
+
+class DnsCache:
+    """有界的 DNS 解析结果缓存（LRU，条目带 TTL）
+
+    只被共享 Session 的连接使用，不影响进程中其他库的解析。
+
+    Args:
+        ttl: 缓存时间（秒），0 表示关闭
+        max_entries: 最多缓存的 (主机, 端口) 数
+    """
+
+    def __init__(self, ttl=0, max_entries=DEFAULT_DNS_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, ttl, max_entries=DEFAULT_DNS_CACHE_SIZE):
+        """更新缓存配置并清空已有条目"""
+        with self._lock:
+            self.ttl = ttl
+            self.max_entries = max(1, max_entries)
+            self._entries.clear()
+
+    def resolve(self, host, port):
+        """解析主机，返回去重后的 IP 地址列表（按 getaddrinfo 顺序）
+
+        Raises:
+            socket.gaierror: 解析失败（失败结果不缓存）
+        """
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                if cached[0] > now:
+                    self._entries.move_to_end(key)
+                    return cached[1]
+                del self._entries[key]
+
+        addresses = []
+        for _, _, _, _, sockaddr in socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM):
+            if sockaddr[0] not in addresses:
+                addresses.append(sockaddr[0])
+
+        with self._lock:
+            self._entries[key] = (now + self.ttl, addresses)
+            self._entries.move_to_end(key)
+            # 先丢弃最久未使用一端已过期的条目，再按容量淘汰
+            while self._entries:
+                oldest_key, (expires_at, _) = next(iter(self._entries.items()))
+                if expires_at > now and len(self._entries) <= self.max_entries:
+                    break
+                del self._entries[oldest_key]
+        return addresses
+
+    def discard(self, host, port):
+        """删除缓存条目（连接全部失败时重新解析）"""
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+dns_cache = DnsCache()
+
+
+class _DnsCachingMixin:
+    """建立连接时使用 dns_cache 的解析结果
+
+    只替换用于建立 TCP 连接的 _dns_host，TLS 的 SNI 与证书校验仍使用原主机名。
+    多个地址依次尝试，全部失败时丢弃缓存。
+    """
+
+    def _new_conn(self):
+        host = self._dns_host
+        if dns_cache.ttl <= 0:
+            return super()._new_conn()
+        try:
+            addresses = dns_cache.resolve(host, self.port)
+        except socket.gaierror:
+            # 交给 urllib3 按原流程解析并抛出对应的异常
+            return super()._new_conn()
+        error = None
+        try:
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    error = e
+        finally:
+            self._dns_host = host
+        dns_cache.discard(host, self.port)
+        if error is None:
+            return super()._new_conn()
+        raise error
+
+
+class _DnsCachingHTTPConnection(_DnsCachingMixin, HTTPConnection):
+    pass
+
+
+class _DnsCachingHTTPSConnection(_DnsCachingMixin, HTTPSConnection):
+    pass
+
+
+class _DnsCachingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _DnsCachingHTTPConnection
+
+
+class _DnsCachingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _DnsCachingHTTPSConnection
+
+
+class DnsCachingAdapter(HTTPAdapter):
+    """连接上游时使用 dns_cache 的 HTTPAdapter"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _DnsCachingHTTPConnectionPool,
+            'https': _DnsCachingHTTPSConnectionPool,
+        }
+
+
+def parse_host_pool_sizes(value):
+    """解析 'host1=20,host2:8443=5' 形式的按主机连接池配置"""
+    sizes = {}
+    for item in (value or '').split(','):
+        host, sep, size = item.strip().partition('=')
+        if sep and host and size.strip().isdigit():
+            sizes[host.strip().lower()] = int(size)
+    return sizes
+
+
+class HttpClient:
+    """按进程共享的连接池 HTTP 客户端
+
+    gunicorn fork 出 worker 后首次使用时才创建 Session，避免在进程间共享连接。
+    """
+
+    def __init__(self):
+        self.pool_size = 10
+        self.host_pool_sizes = {}
+        self.connect_timeout = DEFAULT_CONNECT_TIMEOUT
+        self.read_timeout = DEFAULT_READ_TIMEOUT
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, pool_size=10, host_pool_sizes=None, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                  read_timeout=DEFAULT_READ_TIMEOUT):
+        """更新连接池与默认超时配置，下次请求时重建 Session"""
+        with self._lock:
+            self.pool_size = pool_size
+            self.host_pool_sizes = dict(host_pool_sizes or {})
+            self.connect_timeout = connect_timeout
+            self.read_timeout = read_timeout
+            self._session = None
+
+    def _build_session(self):
+        session = requests.Session()
+        # 代理场景不应在不同用户请求之间共享上游 Cookie
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        default_adapter = DnsCachingAdapter(pool_connections=max(self.pool_size, 1), pool_maxsize=self.pool_size)
+        session.mount('http://', default_adapter)
+        session.mount('https://', default_adapter)
+        for host, size in self.host_pool_sizes.items():
+            adapter = DnsCachingAdapter(pool_connections=1, pool_maxsize=size)
+            # 以 '/' 结尾避免匹配到同前缀的其他主机；非默认端口需写成 host:port
+            session.mount(f'http://{host}/', adapter)
+            session.mount(f'https://{host}/', adapter)
+        return session
+
+    @property
+    def session(self):
+        """当前进程的 Session"""
+        pid = os.getpid()
+        session = self._session
+        if session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._build_session()
+                    self._pid = pid
+                session = self._session
+        return session
+
+    def timeout_for(self, proxy_settings=None):
+        """根据端点的 proxySettings 计算 (连接超时, 读取超时)
+
+        Args:
+            proxy_settings: 端点配置中的 proxySettings，可包含 connectTimeout / readTimeout
+        """
+        proxy_settings = proxy_settings or {}
+        connect = proxy_settings.get('connectTimeout') or self.connect_timeout
+        read = proxy_settings.get('readTimeout') or self.read_timeout
+        return (float(connect), float(read))
+
+    def get(self, url, timeout=None, **kwargs):
+        """发送 GET 请求，未指定超时时使用默认超时"""
+        if timeout is None:
+            timeout = (self.connect_timeout, self.read_timeout)
+        return self.session.get(url, timeout=timeout, **kwargs)
+
+
+http_client = HttpClient()
+
+
+def init_http_client(app):
+    """根据应用配置初始化共享 HTTP 客户端
+
+    Args:
+        app: Flask应用实例
+    """
+    http_client.configure(
+        pool_size=app.config.get('HTTP_POOL_SIZE', 10),
+        host_pool_sizes=parse_host_pool_sizes(app.config.get('HTTP_HOST_POOL_SIZES', '')),
+        connect_timeout=app.config.get('PROXY_CONNECT_TIMEOUT', DEFAULT_CONNECT_TIMEOUT),
+        read_timeout=app.config.get('PROXY_READ_TIMEOUT', DEFAULT_READ_TIMEOUT)
+    )
+    dns_cache.configure(
+        app.config.get('DNS_CACHE_TTL', 0),
+        app.config.get('DNS_CACHE_SIZE', DEFAULT_DNS_CACHE_SIZE)
+    )
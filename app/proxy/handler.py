@@ -0,0 +1,214 @@
+"""
+代理请求处理模块
+请求目标 API，从返回的 JSON 中提取图片 URL 并重定向
+"""
+from flask import redirect, jsonify
+from urllib.parse import urlsplit
+import requests
+import re
+import time
+from app.proxy.breaker import circuit_breakers, hedged_call
+from app.proxy.bulkhead import proxy_bulkheads
+from app.proxy.client import http_client
+from app.proxy.cache import proxy_cache
+from app.proxy.singleflight import proxy_singleflight
+
+# 可识别为图片的 URL
+_IMAGE_URL_PATTERN = re.compile(r'\.(jpeg|jpg|gif|png|webp|bmp|svg)', re.I)
+
+
+class ProxyResult:
+    """上游请求的处理结果，与 Flask 响应解耦以便缓存和复用
+
+    Attributes:
+        kind: 'image'（提取到图片 URL）、'json'、'text'、'error' 或 'unavailable'（熔断中）
+        value: 图片 URL、JSON 数据、文本、错误信息或熔断剩余秒数
+        status: HTTP 状态码
+    """
+
+    __slots__ = ('kind', 'value', 'status')
+
+    def __init__(self, kind, value, status=200):
+        self.kind = kind
+        self.value = value
+        self.status = status
+
+    @property
+    def cacheable(self):
+        return self.kind in ('image', 'json')
+
+
+def get_value_by_dot_notation(obj, path):
+    """通过点号路径获取嵌套对象的值"""
+    if not path:
+        return None
+    try:
+        parts = path.split('.')
+        current = obj
+        for part in parts:
+            if isinstance(current, dict):
+                current = current.get(part)
+            else:
+                return None
+        return current
+    except:
+        return None
+
+def _request_upstream(target_url, proxy_settings, breaker):
+    """请求上游，配置了 hedge 时在 p95 延迟后发出对冲请求"""
+    timeout = http_client.timeout_for(proxy_settings)
+    delay = breaker.p95() if proxy_settings.get('hedge') else None
+    return hedged_call(lambda: http_client.get(target_url, timeout=timeout), delay, timeout=timeout[1])
+
+def fetch_proxy_result(target_url, proxy_settings):
+    """请求目标 API 并提取图片 URL
+
+    Args:
+        target_url: 目标 URL
+        proxy_settings: 端点的 proxySettings
+
+    Returns:
+        ProxyResult: 处理结果
+    """
+    host = urlsplit(target_url).netloc
+    breaker = circuit_breakers.get(host)
+    if not breaker.allow():
+        print(f'[Proxy] Circuit open for {host}, failing fast')
+        return ProxyResult('unavailable', breaker.retry_after(), 503)
+
+    started = time.monotonic()
+    try:
+        print(f'[Proxy] Requesting: {target_url}')
+        resp = _request_upstream(target_url, proxy_settings, breaker)
+    except requests.exceptions.Timeout:
+        breaker.record(False, time.monotonic() - started)
+        return ProxyResult('error', {'error': 'Proxy request timeout'}, 504)
+    except requests.exceptions.RequestException as e:
+        breaker.record(False, time.monotonic() - started)
+        print(f'[Proxy] Failed: {str(e)}')
+        return ProxyResult('error', {'error': 'Proxy setup failed'}, 500)
+    except BaseException:
+        breaker.record(False, time.monotonic() - started)
+        raise
+    breaker.record(resp.status_code < 500, time.monotonic() - started)
+    return build_proxy_result(resp, proxy_settings)
+
+def build_proxy_result(resp, proxy_settings):
+    """从上游响应中提取图片 URL
+
+    Args:
+        resp: 上游响应（requests 或 httpx 的 Response）
+        proxy_settings: 端点的 proxySettings
+
+    Returns:
+        ProxyResult: 处理结果
+    """
+    is_json = resp.headers.get('content-type', '').startswith('application/json')
+
+    if resp.status_code >= 400:
+        try:
+            body = resp.json() if is_json else {'error': f'Target API error ({resp.status_code})'}
+        except ValueError:
+            body = {'error': f'Target API error ({resp.status_code})'}
+        return ProxyResult('error', body, resp.status_code)
+
+    # 尝试提取图片 URL
+    image_url = None
+    if proxy_settings.get('imageUrlField') and is_json:
+        try:
+            data = resp.json()
+            image_url = get_value_by_dot_notation(data, proxy_settings['imageUrlField'])
+        except:
+            pass
+
+    # 检查是否是有效的图片 URL
+    if isinstance(image_url, str) and _IMAGE_URL_PATTERN.search(image_url):
+        return ProxyResult('image', image_url)
+
+    # 返回原始 JSON
+    try:
+        return ProxyResult('json', resp.json())
+    except:
+        return ProxyResult('text', resp.text, resp.status_code)
+
+def proxy_response_parts(result, proxy_settings):
+    """决定 ProxyResult 对应的响应（同步与异步入口共用）
+
+    Returns:
+        tuple: (类型, 内容, 状态码, 额外响应头)，类型为 'redirect'、'json' 或 'text'
+    """
+    if result.kind == 'image':
+        return 'redirect', result.value, 302, {}
+
+    if result.kind == 'error':
+        return 'json', result.value, result.status, {}
+
+    # 根据 fallback 设置返回
+    fallback = proxy_settings.get('fallbackAction', 'returnJson')
+
+    if result.kind == 'unavailable':
+        # 上游熔断中：快速失败并告知客户端何时重试
+        body = {'error': 'Upstream temporarily unavailable'}
+        if fallback != 'error':
+            body['retryAfter'] = result.value
+        return 'json', body, result.status, {'Retry-After': str(result.value)}
+
+    if fallback == 'error':
+        return 'json', {'error': 'Could not extract image URL'}, 404, {}
+
+    if result.kind == 'json':
+        return 'json', result.value, 200, {}
+    return 'text', result.value, result.status, {}
+
+def render_proxy_result(result, proxy_settings):
+    """把 ProxyResult 转换为 Flask 响应"""
+    kind, value, status, headers = proxy_response_parts(result, proxy_settings)
+    if kind == 'redirect':
+        print(f'[Proxy] Redirecting to: {value}')
+        return redirect(value)
+    if kind == 'json':
+        return jsonify(value), status, headers
+    return value, status
+
+def _bulkheaded_fetch(target_url, proxy_settings, endpoint):
+    """在端点、上游主机和全局并发限额内请求上游，名额已满时快速失败"""
+    host = urlsplit(target_url).netloc
+    with proxy_bulkheads.admit(endpoint, proxy_settings.get('maxConcurrency'), host) as admitted:
+        if not admitted:
+            return ProxyResult('unavailable', 1, 503)
+        return fetch_proxy_result(target_url, proxy_settings)
+
+def _coalesced_fetch(key, target_url, proxy_settings, endpoint):
+    """合并同一目标的并发上游请求"""
+    connect_timeout, read_timeout = http_client.timeout_for(proxy_settings)
+    return proxy_singleflight.do(
+        key,
+        lambda: _bulkheaded_fetch(target_url, proxy_settings, endpoint),
+        timeout=connect_timeout + read_timeout,
+        encode=lambda r: [r.kind, r.value, r.status],
+        decode=lambda data: ProxyResult(*data)
+    )
+
+def get_proxy_result(target_url, proxy_settings, endpoint=None):
+    """获取代理结果，配置了 cacheTtl 时经过响应缓存
+
+    Args:
+        target_url: 目标 URL
+        proxy_settings: 端点的 proxySettings
+        endpoint: 端点名称（用于按端点限制并发）
+    """
+    key = (target_url, proxy_settings.get('imageUrlField'))
+    ttl = proxy_settings.get('cacheTtl')
+    if not ttl:
+        return _coalesced_fetch(key, target_url, proxy_settings, endpoint)
+
+    return proxy_cache.get_or_fetch(
+        key,
+        lambda: _coalesced_fetch(key, target_url, proxy_settings, endpoint),
+        ttl=float(ttl),
+        stale_ttl=float(proxy_settings.get('staleTtl') or 0)
+    )
+
+def handle_proxy_request(target_url, proxy_settings, endpoint=None):
+    """处理代理请求"""
+    return render_proxy_result(get_proxy_result(target_url, proxy_settings, endpoint), proxy_settings)
@@ -0,0 +1,239 @@
+"""
+端点调度计划模块
+
+每个配置版本只把 apiUrls 中的端点编译一次为 EndpointPlan：
+参数校验所需的合法值集合、默认值、目标 URL 前缀等都预先计算好，
+请求时只需一次字典查找加上计划执行。
+"""
+import threading
+from urllib.parse import urlencode, quote
+from flask import current_app, jsonify, redirect
+from app.database import get_config_snapshot
+from app.proxy.handler import handle_proxy_request
+from app.proxy.prefetch import sync_prefetch_pools
+from app.proxy.stream import handle_stream_request
+
+# 已编译的调度计划：(配置版本, {端点名称: EndpointPlan})
+_plans = (None, {})
+_plans_lock = threading.Lock()
+
+
+class EndpointPlan:
+    """单个 API 端点的预编译调度计划
+
+    Args:
+        name: 端点名称
+        entry: apiUrls 中的端点配置
+        config: 完整配置（用于读取 baseTag 等全局设置）
+    """
+
+    __slots__ = (
+        'name', 'method', 'construction', 'url', 'url_prefix', 'params', 'param_names',
+        'defaults', 'default_target', 'proxy_settings', 'field_default', 'default_model',
+        'pollinations_suffix', 'redirect_body', 'redirect_location', 'prefetch_pool'
+    )
+
+    def __init__(self, name, entry, config):
+        self.name = name
+        self.method = entry.get('method')
+        self.construction = entry.get('urlConstruction')
+        self.url = entry.get('url', '')
+        self.proxy_settings = entry.get('proxySettings', {})
+        # 由 sync_prefetch_pools 在配置了 proxySettings.prefetch 时设置
+        self.prefetch_pool = None
+
+        # 通用参数：(参数名, 合法值集合或 None, 是否必填, 默认值)
+        query_params = entry.get('queryParams', [])
+        self.params = tuple(
+            (
+                p.get('name'),
+                frozenset(p['validValues']) if p.get('validValues') else None,
+                bool(p.get('required')),
+                p.get('defaultValue')
+            )
+            for p in query_params
+        )
+        self.param_names = frozenset(p[0] for p in self.params)
+        self.defaults = {p[0]: p[3] for p in self.params if p[3] is not None}
+
+        separator = '&' if '?' in self.url else '?'
+        self.url_prefix = f"{self.url}{separator}"
+
+        # 请求未携带任何已声明参数时的目标 URL（存在必填参数时为 None）
+        self.default_target = None
+        if self.url and not any(p[2] for p in self.params):
+            self.default_target = (
+                f"{self.url_prefix}{urlencode(self.defaults)}" if self.defaults else self.url
+            )
+
+        # 特殊 URL 构造所需的预计算值
+        self.field_default = self.proxy_settings.get('imageUrlFieldFromParamDefault') or 'url'
+        self.default_model = next(
+            (p.get('defaultValue') for p in query_params if p.get('name') == 'model'), 'flux'
+        )
+        self.pollinations_suffix = (
+            f"%2c{config.get('baseTag', '')}?&model={entry.get('modelName', '')}&nologo=true"
+        )
+
+        # 无参数重定向端点：预先生成重定向响应的正文和 Location
+        self.redirect_body = None
+        self.redirect_location = None
+        if self.method not in ('proxy', 'stream') and not self.construction and not self.params and self.url:
+            response = redirect(self.url)
+            self.redirect_body = response.get_data()
+            self.redirect_location = response.headers['Location']
+
+    def _cached_redirect(self):
+        return current_app.response_class(
+            self.redirect_body,
+            status=302,
+            headers={'Location': self.redirect_location},
+            mimetype='text/html'
+        )
+
+    def resolve_target(self, args):
+        """根据请求参数计算目标 URL
+
+        Args:
+            args: 请求查询参数
+
+        Returns:
+            tuple: (目标 URL, 错误列表)
+        """
+        if self.default_target is not None and self.param_names.isdisjoint(args.keys()):
+            return self.default_target, []
+
+        validated_params = {}
+        errors = []
+        for param_name, valid_values, required, default in self.params:
+            value = args.get(param_name)
+            if value is not None:
+                if valid_values is not None and value not in valid_values:
+                    errors.append(f"Invalid value for '{param_name}'")
+                else:
+                    validated_params[param_name] = value
+            elif required:
+                errors.append(f"Missing required parameter: {param_name}")
+            elif default is not None:
+                validated_params[param_name] = default
+
+        if errors or not validated_params:
+            return self.url, errors
+        return f"{self.url_prefix}{urlencode(validated_params)}", errors
+
+    def resolve(self, args):
+        """根据请求参数决定调度动作，不产生 Flask 响应（同步与异步入口共用）
+
+        Args:
+            args: 请求查询参数
+
+        Returns:
+            tuple: ('redirect', URL, None)、('error', 错误信息, 状态码)、
+                ('proxy', 目标 URL, proxySettings) 或 ('stream', 目标 URL, proxySettings)
+        """
+        if self.redirect_location is not None:
+            return 'redirect', self.redirect_location, None
+
+        if self.construction == 'special_forward':
+            url = args.get('url')
+            field = args.get('field') or self.field_default
+            if not url:
+                return 'error', {'error': 'Missing url parameter'}, 400
+            return 'proxy', url, {**self.proxy_settings, 'imageUrlField': field}
+
+        if self.construction == 'special_pollinations':
+            tags = args.get('tags')
+            if not tags:
+                return 'error', {'error': 'Missing tags parameter'}, 400
+            return 'redirect', f"{self.url}{quote(tags)}{self.pollinations_suffix}", None
+
+        if self.construction == 'special_draw_redirect':
+            tags = args.get('tags')
+            model = args.get('model', self.default_model)
+            if not tags:
+                return 'error', {'error': 'Missing tags parameter'}, 400
+            return 'redirect', f'/{model}?tags={quote(tags)}', None
+
+        # 通用处理
+        target_url, errors = self.resolve_target(args)
+        if errors:
+            return 'error', {'error': 'Invalid parameters', 'details': errors}, 400
+
+        if not target_url:
+            return 'error', {'error': 'Configuration URL missing'}, 500
+
+        # 根据方法处理
+        if self.method == 'proxy':
+            # 默认参数的请求优先使用预取池中的图片 URL
+            if self.prefetch_pool is not None and target_url == self.default_target:
+                image_url = self.prefetch_pool.pop()
+                if image_url:
+                    return 'redirect', image_url, None
+            return 'proxy', target_url, self.proxy_settings
+
+        if self.method == 'stream':
+            return 'stream', target_url, self.proxy_settings
+
+        # 默认重定向
+        return 'redirect', target_url, None
+
+    def dispatch(self, args):
+        """执行调度计划
+
+        Args:
+            args: 请求查询参数
+
+        Returns:
+            Flask 响应
+        """
+        if self.redirect_body is not None:
+            return self._cached_redirect()
+
+        action, value, extra = self.resolve(args)
+        if action == 'redirect':
+            return redirect(value)
+        if action == 'error':
+            return jsonify(value), extra
+        if action == 'stream':
+            return handle_stream_request(value, extra, self.name)
+        return handle_proxy_request(value, extra, self.name)
+
+
+def _compile_plans(config):
+    """把配置中所有带 method 的端点编译为调度计划"""
+    plans = {}
+    for name, entry in config.get('apiUrls', {}).items():
+        if entry.get('method'):
+            plans[name] = EndpointPlan(name, entry, config)
+    return plans
+
+
+def get_endpoint_plans():
+    """获取所有端点的调度计划，配置版本变化时重新编译
+
+    Returns:
+        dict: {端点名称: EndpointPlan}
+    """
+    global _plans
+    snapshot = get_config_snapshot()
+    version, plans = _plans
+    if version != snapshot.version:
+        with _plans_lock:
+            version, plans = _plans
+            if version != snapshot.version:
+                plans = _compile_plans(snapshot.data)
+                sync_prefetch_pools(plans)
+                _plans = (snapshot.version, plans)
+    return plans
+
+
+def get_endpoint_plan(name):
+    """获取端点的调度计划
+
+    Args:
+        name: 端点名称
+
+    Returns:
+        EndpointPlan or None: 不是 API 端点时返回 None
+    """
+    return get_endpoint_plans().get(name)
@@ -0,0 +1,164 @@
+"""
+图片 URL 预取池模块
+
+对于每次调用返回一张随机图片的代理端点，后台线程预先请求上游并把解析出的
+图片 URL 放入有界队列；请求到来时直接从队列中取出重定向，队列为空时再实时请求。
+队列中的 URL 超过最长保留时间（上游签名链接可能已过期）后在取出时丢弃并重新填充。
+"""
+import queue
+import threading
+import time
+from app.proxy.handler import fetch_proxy_result
+
+# 连续失败时的最大退避时间（秒）
+_MAX_BACKOFF = 30
+# 预取 URL 默认的最长保留时间（秒），可用 proxySettings.prefetchMaxAge 覆盖，0 表示不限制
+DEFAULT_PREFETCH_MAX_AGE = 300
+
+# 端点名称 -> PrefetchPool
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PrefetchPool:
+    """单个端点的预取池
+
+    Args:
+        name: 端点名称
+        target_url: 预取使用的目标 URL
+        proxy_settings: 端点的 proxySettings
+        depth: 队列深度
+        concurrency: 后台填充线程数
+        max_age: 预取 URL 的最长保留时间（秒），0 表示不限制
+    """
+
+    def __init__(self, name, target_url, proxy_settings, depth, concurrency=1,
+                 max_age=DEFAULT_PREFETCH_MAX_AGE):
+        self.name = name
+        self.target_url = target_url
+        self.proxy_settings = proxy_settings
+        self.depth = depth
+        self.concurrency = concurrency
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.expired = 0
+        self._queue = queue.Queue(maxsize=depth)
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    @property
+    def signature(self):
+        """用于判断配置变化后能否继续复用该预取池"""
+        return (self.target_url, self.proxy_settings, self.depth, self.concurrency, self.max_age)
+
+    def start(self):
+        """启动后台填充线程"""
+        for i in range(self.concurrency):
+            thread = threading.Thread(
+                target=self._fill_loop, name=f'prefetch-{self.name}-{i}', daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """停止后台填充线程"""
+        self._stopped.set()
+        self._wake.set()
+
+    def _fill_loop(self):
+        failures = 0
+        while not self._stopped.is_set():
+            if self._queue.full():
+                self._wake.wait(timeout=1)
+                self._wake.clear()
+                continue
+
+            result = fetch_proxy_result(self.target_url, self.proxy_settings)
+            if result.kind == 'image':
+                failures = 0
+                try:
+                    self._queue.put_nowait((time.monotonic(), result.value))
+                except queue.Full:
+                    pass
+            else:
+                # 上游未返回图片 URL 时退避，避免持续打满上游
+                self.errors += 1
+                failures += 1
+                self._stopped.wait(min(_MAX_BACKOFF, 2 ** failures))
+
+    def pop(self):
+        """取出一个预取的图片 URL，队列为空或只剩过期 URL 时返回 None"""
+        url = None
+        while True:
+            try:
+                fetched_at, url = self._queue.get_nowait()
+            except queue.Empty:
+                self.misses += 1
+                url = None
+                break
+            if self.max_age <= 0 or time.monotonic() - fetched_at <= self.max_age:
+                self.hits += 1
+                break
+            self.expired += 1
+        self._wake.set()
+        return url
+
+    def stats(self):
+        """预取池统计信息"""
+        return {
+            'size': self._queue.qsize(),
+            'depth': self.depth,
+            'concurrency': self.concurrency,
+            'hits': self.hits,
+            'misses': self.misses,
+            'errors': self.errors,
+            'expired': self.expired,
+            'maxAge': self.max_age
+        }
+
+
+def sync_prefetch_pools(plans):
+    """根据新编译的调度计划创建、复用或停止预取池
+
+    Args:
+        plans: {端点名称: EndpointPlan}
+    """
+    with _pools_lock:
+        wanted = {}
+        for name, plan in plans.items():
+            depth = int(plan.proxy_settings.get('prefetch') or 0)
+            if plan.method != 'proxy' or depth <= 0 or not plan.default_target:
+                continue
+            concurrency = max(1, int(plan.proxy_settings.get('prefetchConcurrency') or 1))
+            max_age = plan.proxy_settings.get('prefetchMaxAge')
+            max_age = DEFAULT_PREFETCH_MAX_AGE if max_age is None else max(0, float(max_age))
+            pool = _pools.get(name)
+            candidate = PrefetchPool(
+                name, plan.default_target, plan.proxy_settings, depth, concurrency, max_age
+            )
+            if pool is None or pool.signature != candidate.signature:
+                if pool is not None:
+                    pool.stop()
+                candidate.start()
+                pool = candidate
+            wanted[name] = pool
+            plan.prefetch_pool = pool
+
+        for name, pool in _pools.items():
+            if name not in wanted:
+                pool.stop()
+        _pools.clear()
+        _pools.update(wanted)
+
+
+def get_prefetch_stats():
+    """获取当前进程中所有预取池的统计信息
+
+    Returns:
+        dict: {端点名称: 统计信息}
+    """
+    with _pools_lock:
+        return {name: pool.stats() for name, pool in _pools.items()}
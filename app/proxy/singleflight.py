@@ -0,0 +1,175 @@
+"""
+代理请求合并（single-flight）模块
+
+同一 worker 内，对同一目标的并发请求只发出一次上游调用，其余请求等待并共享结果。
+配置了共享目录时还会跨 worker 合并：以目标的哈希为名加文件锁，
+持锁者请求上游并把结果连同随机代号写入结果文件，等待锁的其他 worker 拿到锁后
+若发现结果代号与开始等待时不同，就直接读取而不再请求上游。
+持锁者完成后删除锁文件，拿到锁的进程会确认锁文件未被替换。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from app.storage.filelock import FileLock
+
+# 共享目录中结果文件的保留时间（秒）
+_RESULT_MAX_AGE = 60
+# 每完成多少次跨进程调用清理一次过期文件
+_CLEANUP_EVERY = 256
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """按键合并并发调用
+
+    Args:
+        shared_dir: 跨 worker 合并使用的目录，为空时只在进程内合并
+    """
+
+    def __init__(self, shared_dir=None):
+        self.shared_dir = None
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._shared_calls = 0
+        self.configure(shared_dir)
+
+    def configure(self, shared_dir):
+        """设置跨 worker 合并目录"""
+        if shared_dir:
+            os.makedirs(shared_dir, mode=0o700, exist_ok=True)
+        self.shared_dir = shared_dir or None
+
+    def do(self, key, fn, timeout=None, encode=None, decode=None):
+        """执行 fn，同一键的并发调用共享同一次执行结果
+
+        Args:
+            key: 合并键（需可哈希，跨进程时使用其 repr）
+            fn: 无参可调用对象
+            timeout: 跨 worker 等待其他进程的最长时间（秒）
+            encode: 把结果转换为可 JSON 序列化对象的函数（跨 worker 时需要）
+            decode: encode 的逆操作
+
+        Returns:
+            fn() 的返回值
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            if self.shared_dir and encode is not None and decode is not None:
+                call.result = self._do_shared(key, fn, timeout, encode, decode)
+            else:
+                call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    @staticmethod
+    def _read_shared(result_path):
+        """读取结果文件，返回 (代号, 编码后的结果)，文件不存在或损坏时返回 (None, None)"""
+        try:
+            with open(result_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data['generation'], data['result']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None, None
+
+    def _do_shared(self, key, fn, timeout, encode, decode):
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        lock_path = os.path.join(self.shared_dir, f'{digest}.lock')
+        result_path = os.path.join(self.shared_dir, f'{digest}.json')
+        # 开始等待前的结果代号；拿到锁后代号变化，说明其他 worker 在等待期间完成了同一请求
+        seen, _ = self._read_shared(result_path)
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            lock = FileLock(lock_path)
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if not lock.acquire(timeout=remaining):
+                # 等待超时时不再依赖其他 worker，自己请求上游
+                return fn()
+            generation, encoded = self._read_shared(result_path)
+            if generation is not None and generation != seen:
+                try:
+                    result = decode(encoded)
+                except (ValueError, KeyError, TypeError):
+                    pass
+                else:
+                    lock.release()
+                    return result
+            if lock.is_current():
+                break
+            # 锁文件已被持锁者删除，重新打开该路径再等待
+            lock.release()
+
+        try:
+            result = fn()
+            try:
+                tmp_path = f'{result_path}.{os.getpid()}.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'generation': uuid.uuid4().hex, 'result': encode(result)}, f)
+                os.replace(tmp_path, result_path)
+            except (OSError, TypeError, ValueError) as e:
+                print(f'[SingleFlight] Failed to share result: {e}')
+            return result
+        finally:
+            # 每个键的锁文件在持锁时删除，不会随请求过的目标增多而堆积
+            lock.unlink()
+            lock.release()
+            self._maybe_cleanup()
+
+    def _maybe_cleanup(self):
+        with self._lock:
+            self._shared_calls += 1
+            if self._shared_calls % _CLEANUP_EVERY:
+                return
+        cutoff = time.time() - _RESULT_MAX_AGE
+        try:
+            with os.scandir(self.shared_dir) as it:
+                for entry in it:
+                    try:
+                        if entry.stat().st_mtime >= cutoff:
+                            continue
+                        if entry.name.endswith(('.json', '.tmp')):
+                            os.remove(entry.path)
+                        elif entry.name.endswith('.lock'):
+                            # 进程异常退出时遗留的锁文件：只删除无人持有的
+                            lock = FileLock(entry.path)
+                            if lock.acquire(blocking=False):
+                                try:
+                                    if lock.is_current():
+                                        lock.unlink()
+                                finally:
+                                    lock.release()
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+
+
+proxy_singleflight = SingleFlight()
@@ -0,0 +1,127 @@
+"""
+流式代理模块
+
+method 为 stream 的端点由服务端请求图片并按块转发给客户端，适用于客户端无法跟随
+重定向或图片所在主机禁止外链的情况。配置了 imageUrlField 时先从 API 返回的 JSON
+中提取图片 URL（经过响应缓存与请求合并），再转发该图片。
+每个请求只在内存中保留一个数据块；客户端断开时关闭上游连接。
+"""
+import time
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+import requests
+from flask import current_app, jsonify, request
+from app.proxy.breaker import circuit_breakers
+from app.proxy.bulkhead import proxy_bulkheads
+from app.proxy.client import http_client
+from app.proxy.handler import ProxyResult, get_proxy_result, render_proxy_result
+
+# 每次转发的数据块大小（字节）
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# 转发给客户端的上游响应头；响应体按原始字节转发，
+# 上游忽略 Accept-Encoding 仍然压缩时 Content-Encoding 与 Content-Length 依然匹配
+FORWARDED_HEADERS = ('Content-Type', 'Content-Length', 'Content-Encoding', 'ETag')
+
+# 透传给上游的条件请求头，使上游的 304 能直接返回给客户端
+CONDITIONAL_HEADERS = ('If-None-Match',)
+
+
+def upstream_request_headers(request_headers):
+    """构造请求上游时使用的请求头
+
+    要求上游不压缩，使转发的 Content-Length 与实际字节一致。
+    """
+    headers = {'Accept-Encoding': 'identity'}
+    for name in CONDITIONAL_HEADERS:
+        value = request_headers.get(name)
+        if value:
+            headers[name] = value
+    return headers
+
+
+def relay_headers(upstream_headers):
+    """从上游响应头中挑选需要转发给客户端的部分"""
+    headers = {name: upstream_headers[name] for name in FORWARDED_HEADERS if name in upstream_headers}
+    headers.setdefault('Content-Type', 'application/octet-stream')
+    return headers
+
+
+def resolve_image_url(target_url, proxy_settings, endpoint=None):
+    """确定要转发的图片 URL
+
+    Returns:
+        tuple: (图片 URL, None)；无法提取图片 URL 时为 (None, ProxyResult)
+    """
+    if not proxy_settings.get('imageUrlField'):
+        return target_url, None
+    result = get_proxy_result(target_url, proxy_settings, endpoint)
+    if result.kind != 'image':
+        return None, result
+    return result.value, None
+
+
+def handle_stream_request(target_url, proxy_settings, endpoint=None):
+    """处理流式代理请求
+
+    Args:
+        target_url: 目标 URL
+        proxy_settings: 端点的 proxySettings
+        endpoint: 端点名称（用于按端点限制并发）
+
+    Returns:
+        Flask 响应
+    """
+    image_url, failure = resolve_image_url(target_url, proxy_settings, endpoint)
+    if failure is not None:
+        return render_proxy_result(failure, proxy_settings)
+
+    host = urlsplit(image_url).netloc
+    breaker = circuit_breakers.get(host)
+    if not breaker.allow():
+        return render_proxy_result(ProxyResult('unavailable', breaker.retry_after(), 503), proxy_settings)
+
+    # 并发名额在整个转发过程中保持占用，响应关闭时释放
+    stack = ExitStack()
+    if not stack.enter_context(proxy_bulkheads.admit(endpoint, proxy_settings.get('maxConcurrency'), host)):
+        stack.close()
+        return render_proxy_result(ProxyResult('unavailable', 1, 503), proxy_settings)
+
+    started = time.monotonic()
+    try:
+        print(f'[Stream] Requesting: {image_url}')
+        upstream = http_client.get(
+            image_url,
+            timeout=http_client.timeout_for(proxy_settings),
+            headers=upstream_request_headers(request.headers),
+            stream=True
+        )
+    except requests.exceptions.RequestException as e:
+        breaker.record(False, time.monotonic() - started)
+        stack.close()
+        if isinstance(e, requests.exceptions.Timeout):
+            return jsonify({'error': 'Proxy request timeout'}), 504
+        print(f'[Stream] Failed: {str(e)}')
+        return jsonify({'error': 'Proxy setup failed'}), 500
+    except BaseException:
+        breaker.record(False, time.monotonic() - started)
+        stack.close()
+        raise
+    breaker.record(upstream.status_code < 500, time.monotonic() - started)
+    stack.callback(upstream.close)
+
+    if upstream.status_code >= 400:
+        stack.close()
+        return jsonify({'error': f'Target API error ({upstream.status_code})'}), upstream.status_code
+
+    # 与 ASGI 网关的 aiter_raw 一致，不解压上游内容
+    body = upstream.raw.stream(STREAM_CHUNK_SIZE, decode_content=False) if upstream.status_code != 304 else ()
+    response = current_app.response_class(
+        body,
+        status=upstream.status_code,
+        headers=relay_headers(upstream.headers),
+        direct_passthrough=True
+    )
+    # 响应发送完毕或客户端断开时，WSGI 服务器会调用 close()
+    response.call_on_close(stack.close)
+    return response
@@ -1,10 +1,15 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app, send_from_directory, jsonify
-from app.storage import storage_manager
+from app.storage import image_cache, storage_manager
+from app.storage.archives import ARCHIVE_EXTENSIONS
+from app.storage.index import IMAGE_EXTENSIONS
+from app.storage.uploads import ARCHIVE_FILE_PREFIX, ChunkedUpload, UploadTooLarge, parse_upload_form, purge_stale_uploads
 from app.auth.auth import login, logout, login_required
 from app.database import get_all_api_endpoints, add_api_endpoint, update_api_endpoint, delete_api_endpoint
+from app.database import COLLECTION_DELIVERY_MODES, get_collection_settings, update_collection_settings
+from app.proxy import get_endpoint_plans, get_prefetch_stats
+from app.jobs import job_manager
 from werkzeug.utils import secure_filename
 import os
-import threading
 import re
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -18,9 +23,16 @@ def index():
     background_opacity = current_app.config.get('BACKGROUND_OPACITY')
     return render_template('admin.html',
                            collections=collections,
+                           image_cache_stats=image_cache.stats(),
                            background_image_filename=background_image_filename,
                            background_opacity=background_opacity)
 
+@admin_bp.route('/stats/image-cache')
+@login_required
+def image_cache_stats():
+    """热点图片内存缓存统计（仅反映处理本次请求的 worker 进程）"""
+    return jsonify(image_cache.stats())
+
 @admin_bp.route('/login', methods=['GET', 'POST'])
 def login_page():
     """登录页面"""
@@ -124,6 +136,16 @@ def update_settings():
 
     return redirect(url_for('admin.index'))
 
+def _submit_job(operation, collection_name, params=None):
+    """提交后台任务并提示结果；同一合集已有相同任务时不重复提交"""
+    job, created = job_manager.submit(operation, collection_name, params)
+    description = job_manager.describe(operation)
+    if created:
+        flash(f'已提交后台任务 #{job["id"]}：{description} {collection_name}。', 'success')
+    else:
+        flash(f'合集 {collection_name} 已有进行中的{description}任务 #{job["id"]}。', 'info')
+    return job
+
 @admin_bp.route('/collection/create', methods=['POST'])
 @login_required
 def create_collection():
@@ -148,11 +170,10 @@ def delete_collection():
     if not collection_name:
         flash('参数错误！', 'danger')
         return redirect(url_for('admin.index'))
-    result = storage_manager.delete_collection(collection_name)
-    if result:
-        flash(f'合集 "{collection_name}" 删除成功！', 'success')
-    else:
-        flash(f'删除合集 "{collection_name}" 失败！', 'danger')
+    if not storage_manager.collection_exists(collection_name):
+        flash(f'合集 "{collection_name}" 不存在！', 'danger')
+        return redirect(url_for('admin.index'))
+    _submit_job('delete', collection_name)
     return redirect(url_for('admin.index'))
 
 @admin_bp.route('/collection/<collection_name>')
@@ -175,9 +196,25 @@ def manage_collection(collection_name):
         collection_name=collection_name,
         images=image_urls,
         links=links,
-        all_collections=all_collections
+        all_collections=all_collections,
+        settings=get_collection_settings(collection_name)
     )
 
+@admin_bp.route('/collection/<collection_name>/settings', methods=['POST'])
+@login_required
+def update_collection_settings_route(collection_name):
+    """更新合集设置：随机图片的返回方式"""
+    if not storage_manager.collection_exists(collection_name):
+        abort(404)
+    delivery = request.form.get('delivery', 'direct')
+    if delivery not in COLLECTION_DELIVERY_MODES:
+        flash('无效的返回方式！', 'danger')
+    elif update_collection_settings(collection_name, {'delivery': delivery}):
+        flash('合集设置已保存！', 'success')
+    else:
+        flash('保存合集设置失败！', 'danger')
+    return redirect(url_for('admin.manage_collection', collection_name=collection_name))
+
 @admin_bp.route('/collection/<collection_name>/move-image', methods=['POST'])
 @login_required
 def move_image(collection_name):
@@ -211,56 +248,66 @@ def move_image(collection_name):
 @admin_bp.route('/collection/<collection_name>/upload', methods=['POST'])
 @login_required
 def upload_image(collection_name):
+    """上传图片：文件边接收边写入合集目录下的临时文件，超过单文件上限的部分不再写入"""
     if not storage_manager.collection_exists(collection_name):
         abort(404)
-    if 'images[]' not in request.files:
-        flash('没有上传文件！', 'danger')
-        return redirect(url_for('admin.manage_collection', collection_name=collection_name))
-    files = request.files.getlist('images[]')
-    if not files or all(not f.filename for f in files): # 更简洁的检查
-        flash('没有选择文件！', 'danger')
+    collection_path = os.path.join(storage_manager.base_dir, collection_name)
+    max_file_size = current_app.config.get('MAX_CONTENT_LENGTH', 20 * 1024 * 1024)
+    try:
+        _, request_files, sinks = parse_upload_form(
+            request,
+            collection_path,
+            IMAGE_EXTENSIONS,
+            max_file_size,
+            current_app.config.get('UPLOAD_MAX_REQUEST_SIZE')
+        )
+    except ValueError as e:
+        current_app.logger.warning(f"解析上传表单失败: {e}")
+        flash('上传内容无法解析，请重试！', 'danger')
         return redirect(url_for('admin.manage_collection', collection_name=collection_name))
 
-    success_count = 0
-    failed_count = 0
-    errors = []
-    allowed_extensions = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'psd', 'tif'}
+    try:
+        files = request_files.getlist('images[]')
+        if not files or all(not f.filename for f in files): # 更简洁的检查
+            flash('没有选择文件！', 'danger')
+            return redirect(url_for('admin.manage_collection', collection_name=collection_name))
+
+        success_count = 0
+        failed_count = 0
+        errors = []
 
-    for file in files:
-        if file and file.filename: # 确保文件存在且有文件名
+        for file in files:
+            if not file.filename: # 确保有文件名
+                continue
             original_filename = secure_filename(file.filename) # 安全处理文件名
             ext = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else ''
+            sink = file.stream
 
-            if ext not in allowed_extensions:
+            if ext not in IMAGE_EXTENSIONS:
                 failed_count += 1
                 errors.append(f"不支持的文件类型: {original_filename}")
                 current_app.logger.warning(f"文件类型不支持: {original_filename}")
                 continue
 
-            # 检查文件大小
-            file_content = file.read() # 一次性读取
-            if len(file_content) > current_app.config.get('MAX_CONTENT_LENGTH', 20 * 1024 * 1024):
+            # 大小在接收过程中已经统计，超限的文件没有完整写入磁盘
+            if sink.oversized:
                 failed_count += 1
-                errors.append(f"文件过大: {original_filename}，最大允许20MB")
+                errors.append(f"文件过大: {original_filename}，最大允许{max_file_size // (1024 * 1024)}MB")
                 current_app.logger.warning(f"文件过大: {original_filename}")
-                file.seek(0) # 为下一个可能的处理器重置指针（虽然这里直接continue）
                 continue
 
-            file.seek(0) # 重置指针以供保存
-            try:
-                # storage_manager.add_image_to_collection 应该使用原始文件名或安全处理后的文件名
-                saved_filename = storage_manager.add_image_to_collection(collection_name, file)
-                if saved_filename:
-                    success_count += 1
-                    current_app.logger.info(f"成功上传文件: {saved_filename} 到合集 {collection_name}")
-                else:
-                    failed_count += 1
-                    errors.append(f"文件 {original_filename} 保存失败（可能已存在或存储错误）。")
-                    current_app.logger.error(f"文件保存失败: {original_filename}")
-            except Exception as e:
+            saved_filename = storage_manager.finalize_upload(collection_name, sink.path, file.filename)
+            if saved_filename:
+                success_count += 1
+                current_app.logger.info(f"成功上传文件: {saved_filename} 到合集 {collection_name}")
+            else:
                 failed_count += 1
-                errors.append(f"文件 {original_filename} 上传出错: {str(e)}")
-                current_app.logger.error(f"文件上传异常: {original_filename}, 错误: {str(e)}")
+                errors.append(f"文件 {original_filename} 保存失败（可能已存在或存储错误）。")
+                current_app.logger.error(f"文件保存失败: {original_filename}")
+    finally:
+        # 清理未被采用的临时文件
+        for sink in sinks:
+            sink.discard()
 
     if success_count > 0:
         flash(f'成功上传 {success_count} 张图片！', 'success')
@@ -273,6 +320,158 @@ def upload_image(collection_name):
 
     return redirect(url_for('admin.manage_collection', collection_name=collection_name))
 
+def _get_chunked_upload(collection_name, upload_id):
+    """获取分块上传会话，合集或会话不存在时返回 404"""
+    if not storage_manager.collection_exists(collection_name):
+        abort(404)
+    try:
+        upload = ChunkedUpload(os.path.join(storage_manager.base_dir, collection_name), upload_id)
+    except ValueError:
+        abort(404)
+    meta = upload.load()
+    if meta is None:
+        abort(404)
+    return upload, meta
+
+@admin_bp.route('/collection/<collection_name>/uploads', methods=['POST'])
+@login_required
+def create_chunked_upload(collection_name):
+    """创建分块上传会话
+
+    请求体 JSON：{"filename": 原始文件名, "size": 文件字节数}
+    返回 {"uploadId", "offset", "chunkSize"}，之后按 offset 逐块 PUT 到 /uploads/<uploadId>。
+    """
+    if not storage_manager.collection_exists(collection_name):
+        abort(404)
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get('filename') or '')
+    size = data.get('size')
+    secured = secure_filename(filename)
+    ext = secured.rsplit('.', 1)[1].lower() if '.' in secured else ''
+    if ext not in IMAGE_EXTENSIONS:
+        return jsonify({'error': f'不支持的文件类型: {secured or filename}'}), 400
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({'error': '缺少文件大小'}), 400
+    max_file_size = current_app.config.get('MAX_CONTENT_LENGTH', 20 * 1024 * 1024)
+    if size > max_file_size:
+        return jsonify({'error': f'文件过大: {secured}'}), 413
+
+    collection_path = os.path.join(storage_manager.base_dir, collection_name)
+    purge_stale_uploads(collection_path, current_app.config.get('UPLOAD_SESSION_TTL', 86400))
+    upload = ChunkedUpload.create(collection_path, filename, size)
+    return jsonify({
+        'uploadId': upload.upload_id,
+        'offset': 0,
+        'chunkSize': current_app.config.get('UPLOAD_CHUNK_SIZE', 2 * 1024 * 1024)
+    }), 201
+
+@admin_bp.route('/collection/<collection_name>/uploads/<upload_id>', methods=['GET'])
+@login_required
+def get_chunked_upload(collection_name, upload_id):
+    """查询分块上传已接收的字节数，用于断点续传"""
+    upload, meta = _get_chunked_upload(collection_name, upload_id)
+    return jsonify({
+        'uploadId': upload_id,
+        'size': meta['size'],
+        'offset': upload.offset(),
+        'chunkSize': current_app.config.get('UPLOAD_CHUNK_SIZE', 2 * 1024 * 1024)
+    })
+
+@admin_bp.route('/collection/<collection_name>/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def put_chunked_upload(collection_name, upload_id):
+    """上传一个分块（请求体为原始字节，查询参数 offset 为分块起始位置）
+
+    offset 与服务端已接收的字节数不一致时返回 409 和正确的 offset；
+    收到全部字节后保存图片并返回 {"done": true, "filename"}。
+    """
+    upload, meta = _get_chunked_upload(collection_name, upload_id)
+    offset = request.args.get('offset', type=int)
+    length = request.content_length
+    if offset is None or length is None:
+        return jsonify({'error': '缺少 offset 或 Content-Length'}), 400
+    if length > current_app.config.get('UPLOAD_CHUNK_SIZE', 2 * 1024 * 1024) * 2:
+        return jsonify({'error': '分块过大'}), 413
+    try:
+        received = upload.append(request.stream, offset, length, meta['size'])
+    except UploadTooLarge:
+        return jsonify({'error': '分块超出文件大小'}), 413
+    # 重发已接收的分块时 received 恰好等于 offset + length，按成功处理
+    if received != offset + length:
+        return jsonify({'error': 'offset 不匹配', 'offset': received}), 409
+    if received < meta['size']:
+        return jsonify({'offset': received})
+
+    filename = storage_manager.finalize_upload(collection_name, upload.part_path, meta['filename'])
+    upload.remove()
+    if not filename:
+        return jsonify({'error': '保存失败'}), 500
+    current_app.logger.info(f"分块上传完成: {filename} 到合集 {collection_name}")
+    return jsonify({'done': True, 'filename': filename, 'offset': received})
+
+@admin_bp.route('/collection/<collection_name>/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def delete_chunked_upload(collection_name, upload_id):
+    """取消分块上传"""
+    upload, _ = _get_chunked_upload(collection_name, upload_id)
+    upload.remove()
+    return jsonify({'deleted': True})
+
+@admin_bp.route('/collection/<collection_name>/import', methods=['POST'])
+@login_required
+def import_archive(collection_name):
+    """上传 ZIP / TAR 压缩包并提交后台导入任务
+
+    压缩包边接收边写入合集目录下的临时文件，由后台任务逐个成员解压导入后删除。
+    """
+    if not storage_manager.collection_exists(collection_name):
+        abort(404)
+    redirect_url = url_for('admin.manage_collection', collection_name=collection_name)
+    if any(job['operation'] == 'import_archive' for job in job_manager.list(collection_name, active_only=True)):
+        flash(f'合集 {collection_name} 已有进行中的导入任务，请等待完成后再上传。', 'info')
+        return redirect(redirect_url)
+
+    collection_path = os.path.join(storage_manager.base_dir, collection_name)
+    # 没有进行中的导入任务时，遗留的压缩包（如任务重试次数用尽）也一并清理
+    purge_stale_uploads(collection_path, current_app.config.get('UPLOAD_SESSION_TTL', 86400), archives=True)
+    max_size = current_app.config.get('ARCHIVE_MAX_SIZE', 10 * 1024 * 1024 * 1024)
+    try:
+        _, request_files, sinks = parse_upload_form(
+            request, collection_path, ARCHIVE_EXTENSIONS, max_size, max_size + 1024 * 1024
+        )
+    except ValueError as e:
+        current_app.logger.warning(f"解析压缩包上传失败: {e}")
+        flash('上传内容无法解析，请重试！', 'danger')
+        return redirect(redirect_url)
+
+    try:
+        file = request_files.get('archive')
+        if file is None or not file.filename:
+            flash('没有选择压缩包！', 'danger')
+            return redirect(redirect_url)
+        if file.stream.oversized:
+            flash(f'压缩包过大，最大允许{max_size // (1024 * 1024)}MB', 'danger')
+            return redirect(redirect_url)
+        if file.stream.path is None:
+            # 扩展名不在允许列表中的文件不会写入磁盘
+            flash(f'不支持的压缩包类型: {file.filename}，仅支持 zip、tar、tar.gz、tar.bz2、tar.xz', 'danger')
+            return redirect(redirect_url)
+        archive_path = file.stream.keep(prefix=ARCHIVE_FILE_PREFIX)
+    finally:
+        for sink in sinks:
+            sink.discard()
+
+    job, created = job_manager.submit(
+        'import_archive', collection_name, {'archive': os.path.basename(archive_path), 'filename': file.filename}
+    )
+    if created:
+        flash(f'已提交后台任务 #{job["id"]}：导入压缩包 {file.filename}。', 'success')
+    else:
+        # 检查之后恰好有其他导入任务被提交
+        os.remove(archive_path)
+        flash(f'合集 {collection_name} 已有进行中的导入任务 #{job["id"]}，请等待完成后再上传。', 'info')
+    return redirect(redirect_url)
+
 @admin_bp.route('/collection/<collection_name>/add-links', methods=['POST'])
 @login_required
 def add_links(collection_name):
@@ -294,41 +493,28 @@ def add_links(collection_name):
 @admin_bp.route('/collection/<collection_name>/cache', methods=['POST'])
 @login_required
 def cache_collection(collection_name):
-    """启动对指定合集外部链接的缓存任务（后台执行）"""
+    """提交缓存合集外部链接的后台任务"""
     if not storage_manager.collection_exists(collection_name):
         abort(404)
-    
-    # 获取真实的 app 对象，以便传递给后台线程
-    app = current_app._get_current_object()
-
-    # 定义一个包装函数，在 app 上下文中执行缓存任务
-    def cache_wrapper(app, collection_name):
-        with app.app_context():
-            storage_manager.cache_external_images(collection_name)
-
-    current_app.logger.info(f"--- Cache request for '{collection_name}' received. Preparing background thread. ---")
-    # 创建并启动一个后台线程来执行包装好的任务
-    thread = threading.Thread(target=cache_wrapper, args=(app, collection_name))
-    thread.start()
-    current_app.logger.info(f"--- Background thread for '{collection_name}' started. Redirecting user now. ---")
-    
-    flash(f'已在后台启动对合集 {collection_name} 的缓存任务。请稍后刷新查看结果。', 'success')
+    _submit_job('cache', collection_name)
     return redirect(url_for('admin.manage_collection', collection_name=collection_name))
 
 @admin_bp.route('/collection/<collection_name>/rename-long-filenames', methods=['POST'])
 @login_required
 def rename_long_filenames(collection_name):
-    """批量重命名合集中文件名过长的图片"""
+    """提交批量重命名长文件名的后台任务"""
     if not storage_manager.collection_exists(collection_name):
         abort(404)
-    
-    renamed_count = storage_manager.rename_long_filenames_in_collection(collection_name)
-    
-    if renamed_count > 0:
-        flash(f'成功重命名 {renamed_count} 张图片！', 'success')
-    else:
-        flash('没有需要重命名的图片（所有文件名都已符合要求）。', 'info')
-    
+    _submit_job('rename', collection_name)
+    return redirect(url_for('admin.manage_collection', collection_name=collection_name))
+
+@admin_bp.route('/collection/<collection_name>/validate-links', methods=['POST'])
+@login_required
+def validate_links(collection_name):
+    """提交检查合集外链的后台任务"""
+    if not storage_manager.collection_exists(collection_name):
+        abort(404)
+    _submit_job('validate_links', collection_name, {'remove': request.form.get('remove') == 'on'})
     return redirect(url_for('admin.manage_collection', collection_name=collection_name))
 
 @admin_bp.route('/collection/<collection_name>/delete-image', methods=['POST'])
@@ -360,9 +546,53 @@ def delete_link(collection_name):
     if result:
         flash('外链删除成功！', 'success')
     else:
-        flash('删除外链失败！', 'danger')
+        flash('删除外链失败，外链不存在或已被删除！', 'danger')
     return redirect(url_for('admin.manage_collection', collection_name=collection_name))
 
+# =====================
+# 后台任务路由
+# =====================
+
+def _job_view(job):
+    """任务记录转换为返回给前端的字段"""
+    return {
+        'id': job['id'],
+        'operation': job['operation'],
+        'description': job_manager.describe(job['operation']),
+        'collection': job['collection'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'total': job['total'],
+        'message': job['message'],
+        'result': job['result'],
+        'attempts': job['attempts'],
+        'createdAt': job['created_at'],
+        'startedAt': job['started_at'],
+        'finishedAt': job['finished_at']
+    }
+
+@admin_bp.route('/jobs')
+@login_required
+def list_jobs():
+    """任务列表
+
+    查询参数：collection 只返回该合集的任务，active=1 只返回排队或运行中的任务，limit 最大条数。
+    管理页面在有进行中的任务时定期轮询该接口，不占用长连接。
+    """
+    collection = request.args.get('collection') or None
+    active_only = request.args.get('active') == '1'
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify({'jobs': [_job_view(job) for job in job_manager.list(collection, active_only, limit)]})
+
+@admin_bp.route('/jobs/<int:job_id>')
+@login_required
+def get_job(job_id):
+    """单个任务的状态"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(_job_view(job))
+
 @admin_bp.route('/picture/<path:filename>')
 def serve_picture(filename):
     """提供图片文件服务, 包括合集图片和背景图片"""
@@ -394,10 +624,14 @@ def serve_picture(filename):
 def api_endpoints():
     """API 端点管理页面"""
     endpoints = get_all_api_endpoints()
+    # 确保预取池与当前配置同步（统计信息仅反映处理本次请求的 worker 进程）
+    get_endpoint_plans()
+    prefetch_stats = get_prefetch_stats()
     background_image_filename = current_app.config.get('BACKGROUND_IMAGE_PATH')
     background_opacity = current_app.config.get('BACKGROUND_OPACITY')
     return render_template('api_endpoints.html',
                            endpoints=endpoints,
+                           prefetch_stats=prefetch_stats,
                            background_image_filename=background_image_filename,
                            background_opacity=background_opacity)
 
@@ -457,16 +691,12 @@ def update_api_endpoint_route(name):
         flash('目标 URL 不能为空！', 'danger')
         return redirect(url_for('admin.api_endpoints'))
     
+    # 只更新表单中的字段，保留 queryParams、proxySettings（含预取设置）等
     endpoint_config = {
         'group': group or '默认分组',
         'description': description,
         'url': url,
-        'method': method,
-        'type': 'image',
-        'queryParams': [],
-        'proxySettings': {
-            'fallbackAction': 'returnJson'
-        }
+        'method': method
     }
     
     if update_api_endpoint(name, endpoint_config):
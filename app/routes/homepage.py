@@ -0,0 +1,251 @@
+"""
+首页数据缓存
+
+/api/homepage-data 的内容（LLM 提示词与卡片 HTML）只在配置版本或存储版本变化时
+重新生成，平时直接返回内存中序列化好的 JSON。站点地址与图片 URL 上防缓存的时间戳
+随请求变化，生成时以占位符代替，返回前再替换为当前请求的值。
+"""
+import hashlib
+import json
+import threading
+import time
+from flask import current_app, request
+from app.storage import storage_manager
+from app.database import get_config_snapshot
+
+# 生成内容时代替 base_url 的占位符
+BASE_URL_PLACEHOLDER = '__IMAGE_FORWARD_BASE_URL__'
+# 生成内容时代替图片 URL 中 ?t= 时间戳的占位符
+TIMESTAMP_PLACEHOLDER = '__IMAGE_FORWARD_TIMESTAMP__'
+
+# 合集封面尚未生成时显示的占位图
+COVER_PLACEHOLDER = (
+    "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' width='200' height='150'%3E"
+    "%3Crect fill='%23f0f0f0' width='200' height='150'/%3E"
+    "%3Ctext fill='%23999' x='50%25' y='50%25' text-anchor='middle' dy='.3em'%3E%E5%B0%81%E9%9D%A2%E7%94%9F%E6%88%90%E4%B8%AD%3C/text%3E%3C/svg%3E"
+)
+
+# 分组优先级
+GROUP_ORDER = {'AI绘图': 1, '二次元图片': 2, '三次元图片': 3, '表情包': 4, '默认分组': 99}
+
+
+def build_homepage_payload(config):
+    """生成首页数据（其中的站点地址为 BASE_URL_PLACEHOLDER，时间戳为 TIMESTAMP_PLACEHOLDER）
+
+    Args:
+        config: 当前配置
+
+    Returns:
+        dict: {'llmPrompt': ..., 'groupsHtml': ...}
+    """
+    base_url = BASE_URL_PLACEHOLDER
+
+    # 按分组归类 API 端点
+    grouped_apis = {}
+    api_urls = config.get('apiUrls', {})
+
+    for key, entry in api_urls.items():
+        group = entry.get('group') or '默认分组'
+        if group not in grouped_apis:
+            grouped_apis[group] = []
+        grouped_apis[group].append({'key': key, **entry})
+
+    # 生成 LLM 提示词
+    all_apis = [{'key': k, **v} for k, v in api_urls.items()]
+    all_apis.sort(key=lambda x: (GROUP_ORDER.get(x.get('group', '默认分组'), 50), x['key']))
+
+    # 每个合集只查询一次信息，提示词和卡片共用
+    collections = []
+    for name in storage_manager.get_all_collections():
+        info = storage_manager.get_collection_info(name)
+        if info and info.get('has_content'):
+            collections.append((name, info))
+
+    path_functions = []
+    for e in all_apis:
+        desc = e.get('description') or e.get('group') or '默认分组'
+        if e.get('group') == 'AI绘图':
+            path_functions.append(f"{desc}:/{e['key']}?tags=<tags>")
+        else:
+            path_functions.append(f"{desc}:/{e['key']}")
+
+    # 添加图片合集到路径列表
+    for name, _ in collections:
+        path_functions.append(f"{name}:/{name}")
+
+    llm_prompt = f"""    picture_url: |
+    {{ 
+    根据用户请求，选择合适的图片API路径，生成并返回完整URL。仅输出最终URL。
+    基础URL：{base_url}
+    可用路径：
+{chr(10).join('    - ' + p for p in path_functions)}
+    }}"""
+
+    # 生成分组 HTML
+    sorted_groups = sorted(grouped_apis.keys(), key=lambda x: GROUP_ORDER.get(x, 99))
+    groups_html = ''
+    timestamp = TIMESTAMP_PLACEHOLDER
+
+    for group_name in sorted_groups:
+        endpoints = grouped_apis[group_name]
+        endpoints.sort(key=lambda x: x['key'])
+
+        cards_html = ''
+        for entry in endpoints:
+            api_url = f"{base_url}/{entry['key']}"
+            desc = entry.get('description') or entry['key']
+            cards_html += f'''
+            <div class="api-card">
+                <div class="api-card-image" onclick="refreshImage(this, '{api_url}')">
+                    <div class="media-loader"><div class="loader-spinner"></div><span>加载中...</span></div>
+                    <img src="{api_url}?t={timestamp}" alt="{desc}" loading="lazy" onload="hideLoader(this)" onerror="handleMediaError(this, '{api_url}')">
+                    <div class="image-overlay"><span class="refresh-hint"><i class="bi bi-arrow-clockwise"></i> 点击刷新</span></div>
+                    <span class="api-badge">{desc}</span>
+                </div>
+                <div class="api-card-info">
+                    <p class="api-hint">👆点击图片可刷新预览</p>
+                    <p class="api-url">{api_url}</p>
+                </div>
+            </div>'''
+
+        groups_html += f'<div class="group-section"><h3 class="group-title-home">{group_name}</h3><div class="cards-row">{cards_html}</div></div>'
+
+    # 生成图片合集 HTML
+    collections_html = ''
+    collection_cards = ''
+    for name, info in collections:
+        collection_url = f"{base_url}/{name}"
+        count_text = f"{info.get('total_count', 0)} 张图片"
+        # 封面在后台生成，就绪后存储版本变化会触发首页数据重建
+        if info.get('cover'):
+            image_src = f"{base_url}/picture/{name}/{info['cover']}?t={timestamp}"
+        else:
+            image_src = COVER_PLACEHOLDER
+
+        collection_cards += f'''
+            <div class="api-card">
+                <div class="api-card-image" onclick="refreshImage(this, '{collection_url}')">
+                    <div class="media-loader"><div class="loader-spinner"></div><span>加载中...</span></div>
+                    <img src="{image_src}" alt="{name}" loading="lazy" onload="hideLoader(this)" onerror="handleMediaError(this, '{collection_url}')">
+                    <div class="image-overlay"><span class="refresh-hint"><i class="bi bi-arrow-clockwise"></i> 点击刷新</span></div>
+                    <span class="api-badge">{name}</span>
+                </div>
+                <div class="api-card-info">
+                    <p class="api-hint">📁 {count_text}</p>
+                    <p class="api-url">{collection_url}</p>
+                </div>
+            </div>'''
+
+    if collection_cards:
+        collections_html = f'<div class="group-section"><h3 class="group-title-home">📷 本地图片合集</h3><div class="cards-row">{collection_cards}</div></div>'
+
+    return {
+        'llmPrompt': llm_prompt,
+        'groupsHtml': groups_html + collections_html
+    }
+
+
+class HomepagePayload:
+    """序列化后的首页数据
+
+    Attributes:
+        key: 生成时的 (配置版本, 存储版本)
+        body: 含占位符的 JSON 文本
+        digest: body 的摘要，用于生成 ETag
+    """
+
+    __slots__ = ('key', 'body', 'digest')
+
+    def __init__(self, key, body):
+        self.key = key
+        self.body = body
+        self.digest = hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
+
+    def render(self, base_url):
+        """替换占位符，返回 (JSON 文本, ETag)
+
+        时间戳只用于让浏览器重新请求图片，不计入 ETag，否则条件请求永远不会命中。
+        """
+        escaped = json.dumps(base_url)[1:-1]
+        body = self.body.replace(BASE_URL_PLACEHOLDER, escaped)
+        body = body.replace(TIMESTAMP_PLACEHOLDER, str(int(time.time() * 1000)))
+        site = hashlib.sha1(base_url.encode('utf-8')).hexdigest()[:8]
+        return body, f'{self.digest}-{site}'
+
+
+class HomepageCache:
+    """首页数据缓存：版本变化时在后台重建
+
+    每隔合集索引的校验间隔（COLLECTION_INDEX_TTL）在后台检查一次存储版本，
+    以感知其他 worker 对合集的修改。
+    """
+
+    def __init__(self):
+        self._payload = None
+        self._checked_at = 0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _build(self):
+        snapshot = get_config_snapshot()
+        key = (snapshot.version, storage_manager.get_storage_version())
+        payload = self._payload
+        if payload is not None and payload.key == key:
+            return payload
+        body = json.dumps(build_homepage_payload(snapshot.data), ensure_ascii=False)
+        payload = self._payload = HomepagePayload(key, body)
+        return payload
+
+    def _refresh(self, app):
+        try:
+            with app.app_context():
+                self._build()
+        except Exception as e:
+            app.logger.error(f"重建首页数据失败: {e}")
+        finally:
+            self._checked_at = time.monotonic()
+            self._refreshing = False
+
+    def get(self):
+        """获取首页数据，首次调用时同步生成
+
+        Returns:
+            HomepagePayload
+        """
+        payload = self._payload
+        if payload is None:
+            with self._lock:
+                payload = self._payload or self._build()
+                self._checked_at = time.monotonic()
+            return payload
+
+        stale = (
+            payload.key[0] != get_config_snapshot().version
+            or payload.key[1][1] != storage_manager.index.version
+            or time.monotonic() - self._checked_at >= storage_manager.index.revalidate_interval
+        )
+        if stale:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(
+                    target=self._refresh,
+                    args=(current_app._get_current_object(),),
+                    daemon=True
+                ).start()
+        return payload
+
+
+homepage_cache = HomepageCache()
+
+
+def homepage_response():
+    """返回首页数据响应，支持 If-None-Match 条件请求"""
+    base_url = f"{request.scheme}://{request.host}"
+    body, etag = homepage_cache.get().render(base_url)
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    # 浏览器每次都需要携带 ETag 重新校验
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
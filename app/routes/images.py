@@ -0,0 +1,135 @@
+"""
+本地图片发送
+
+合集图片统一经由 send_image 发送：
+- ETag 为图片内容哈希（强校验），配合 Last-Modified 处理 If-None-Match / If-Modified-Since 返回 304
+- 支持 Range 请求返回 206，If-Range 与 ETag 不一致时返回完整内容
+- Cache-Control 由各路由指定：随机图片不可缓存，固定地址的图片长期缓存
+- 配置 IMAGE_OFFLOAD 后只返回 X-Accel-Redirect / X-Sendfile 响应头，由前端代理零拷贝发送文件，
+  条件请求和 Range 也由代理处理（此时 ETag 由代理按文件大小和 mtime 生成）
+- 配置 IMAGE_CACHE_SIZE 后小图片的内容缓存在内存中，命中时只 stat 不读文件
+
+selection_seed 解析合集随机地址的 seed / date / rotate 参数，WSGI 路由与 ASGI 网关共用。
+"""
+import io
+import mimetypes
+import os
+import time
+from urllib.parse import quote
+from flask import abort, current_app, send_file
+from app.storage import image_cache, storage_manager
+from app.storage.index import COVER_FILE_PREFIX, IMAGE_EXTENSIONS
+
+# 随机图片：每次请求结果不同，禁止任何缓存
+CACHE_NO_STORE = 'no-store'
+# 固定地址的图片：内容与文件名绑定，允许长期缓存
+CACHE_IMMUTABLE = 'public, max-age=31536000, immutable'
+# IMAGE_OFFLOAD 的可选值，空字符串表示由 worker 发送
+OFFLOAD_MODES = ('', 'x-accel', 'x-sendfile')
+
+
+def selection_seed(args):
+    """解析确定性选择参数
+
+    - seed=<字符串>：相同种子总是返回同一张图片（合集内容变化后重新选择）
+    - date=<字符串>：按日期选择，留空时使用当天（UTC），缓存到当天结束
+    - rotate=<秒数>：每隔指定秒数换一张图片，缓存到本轮结束；可与 seed / date 组合
+
+    Returns:
+        tuple: (种子, Cache-Control)；没有选择参数时种子为 None，响应不可缓存
+    """
+    seed = args.get('seed')
+    max_age = current_app.config.get('SEED_CACHE_MAX_AGE', 3600)
+    now = time.time()
+    if 'date' in args:
+        date = args.get('date') or time.strftime('%Y-%m-%d', time.gmtime(now))
+        if not args.get('date'):
+            max_age = min(max_age, 86400 - int(now) % 86400)
+        seed = f"{seed or ''}\0date:{date}"
+    if 'rotate' in args:
+        period = args.get('rotate', type=int)
+        if not period or period <= 0:
+            abort(400, description="rotate 必须是正整数（秒）")
+        bucket = int(now) // period
+        max_age = min(max_age, period - int(now) % period)
+        seed = f"{seed or ''}\0rotate:{period}:{bucket}"
+    if seed is None:
+        return None, CACHE_NO_STORE
+    return seed, f'public, max-age={max_age}'
+
+
+def is_servable_image(filename):
+    """文件名是否为可以对外发送的图片（合集图片或后台生成的封面）"""
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    if ext not in IMAGE_EXTENSIONS:
+        return False
+    return not filename.startswith('.') or filename == f'{COVER_FILE_PREFIX}.{ext}'
+
+
+def send_image(collection_name, filename, cache_control):
+    """发送合集中的图片
+
+    Args:
+        collection_name: 合集名称
+        filename: 图片文件名
+        cache_control: Cache-Control 响应头
+
+    Returns:
+        Response: 200 / 206 / 304 响应
+
+    Raises:
+        FileNotFoundError: 图片不存在
+    """
+    path = os.path.join(storage_manager.base_dir, collection_name, filename)
+    stat_result = os.stat(path)
+    offload = current_app.config.get('IMAGE_OFFLOAD')
+    if offload:
+        return _offload_response(offload, path, collection_name, filename, cache_control)
+    etag = storage_manager.get_image_etag(collection_name, filename, stat_result)
+    if image_cache.enabled and image_cache.accepts(stat_result.st_size):
+        data = image_cache.get(path, stat_result)
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+            image_cache.put(path, stat_result, data)
+        response = send_file(
+            io.BytesIO(data), download_name=filename, conditional=True, etag=etag,
+            last_modified=stat_result.st_mtime
+        )
+    else:
+        response = send_file(path, conditional=True, etag=etag, last_modified=stat_result.st_mtime)
+    # werkzeug 只在处理 Range 请求时才声明，完整响应也告知客户端支持分段下载
+    response.headers.setdefault('Accept-Ranges', 'bytes')
+    response.headers['Cache-Control'] = cache_control
+    response.headers.pop('Expires', None)
+    return response
+
+
+def _offload_response(mode, path, collection_name, filename, cache_control):
+    """只带内部重定向响应头的空响应，文件由前端代理发送"""
+    response = current_app.response_class(
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    )
+    if mode == 'x-accel':
+        prefix = current_app.config.get('IMAGE_OFFLOAD_PREFIX', '/_protected_picture')
+        response.headers['X-Accel-Redirect'] = f'{prefix}/{quote(collection_name)}/{quote(filename)}'
+    else:
+        response.headers['X-Sendfile'] = os.path.abspath(path)
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def send_picture(path):
+    """按 /picture/<合集>/<文件名> 发送图片，只发送合集目录下的图片文件"""
+    parts = path.split('/')
+    # 合集名不能是隐藏目录（如后台任务表所在的 .jobs），也不接受 .. 等路径穿越
+    if len(parts) != 2 or not parts[0] or parts[0].startswith('.') or '\\' in path:
+        abort(404)
+    collection_name, filename = parts
+    if not is_servable_image(filename):
+        abort(404)
+    try:
+        return send_image(collection_name, filename, CACHE_IMMUTABLE)
+    except (FileNotFoundError, NotADirectoryError):
+        current_app.logger.debug(f"serve_picture: '{path}' not found")
+        abort(404)
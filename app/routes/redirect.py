@@ -1,10 +1,10 @@
-from flask import Blueprint, send_file, redirect, abort, current_app, request, jsonify
+from flask import Blueprint, redirect, abort, current_app, request, url_for
 from app.storage import storage_manager
-from app.database import get_current_config
+from app.routes.images import selection_seed, send_image
+from app.proxy import get_endpoint_plan
+from app.database import get_collection_settings
+from werkzeug.exceptions import HTTPException
 import os
-import requests
-import re
-from urllib.parse import urlencode, quote
 
 redirect_bp = Blueprint('redirect', __name__)
 
@@ -12,135 +12,6 @@ redirect_bp = Blueprint('redirect', __name__)
 RESERVED_PATHS = {'config', 'admin', 'admin-login', 'admin-logout', 'api', 
                   'css', 'js', 'picture', 'view', 'project_bg', 'static'}
 
-def get_value_by_dot_notation(obj, path):
-    """通过点号路径获取嵌套对象的值"""
-    if not path:
-        return None
-    try:
-        parts = path.split('.')
-        current = obj
-        for part in parts:
-            if isinstance(current, dict):
-                current = current.get(part)
-            else:
-                return None
-        return current
-    except:
-        return None
-
-def handle_proxy_request(target_url, proxy_settings):
-    """处理代理请求"""
-    try:
-        print(f'[Proxy] Requesting: {target_url}')
-        resp = requests.get(target_url, timeout=15)
-        
-        if resp.status_code >= 400:
-            return jsonify(resp.json() if resp.headers.get('content-type', '').startswith('application/json') else {'error': f'Target API error ({resp.status_code})'}), resp.status_code
-        
-        # 尝试提取图片 URL
-        image_url = None
-        if proxy_settings.get('imageUrlField') and resp.headers.get('content-type', '').startswith('application/json'):
-            try:
-                data = resp.json()
-                image_url = get_value_by_dot_notation(data, proxy_settings['imageUrlField'])
-            except:
-                pass
-        
-        # 检查是否是有效的图片 URL
-        if isinstance(image_url, str) and re.search(r'\.(jpeg|jpg|gif|png|webp|bmp|svg)', image_url, re.I):
-            print(f'[Proxy] Redirecting to: {image_url}')
-            return redirect(image_url)
-        
-        # 根据 fallback 设置返回
-        fallback = proxy_settings.get('fallbackAction', 'returnJson')
-        if fallback == 'error':
-            return jsonify({'error': 'Could not extract image URL'}), 404
-        
-        # 返回原始 JSON
-        try:
-            return jsonify(resp.json())
-        except:
-            return resp.text, resp.status_code
-            
-    except requests.exceptions.Timeout:
-        return jsonify({'error': 'Proxy request timeout'}), 504
-    except requests.exceptions.RequestException as e:
-        print(f'[Proxy] Failed: {str(e)}')
-        return jsonify({'error': 'Proxy setup failed'}), 500
-
-def handle_api_forward(name, config_entry, config):
-    """处理 API 转发请求"""
-    print(f'[Router] Handling API /{name}')
-    
-    # 处理特殊 URL 构造
-    url_construction = config_entry.get('urlConstruction')
-    
-    if url_construction == 'special_forward':
-        url = request.args.get('url')
-        field = request.args.get('field') or config_entry.get('proxySettings', {}).get('imageUrlFieldFromParamDefault') or 'url'
-        if not url:
-            return jsonify({'error': 'Missing url parameter'}), 400
-        proxy_settings = {**config_entry.get('proxySettings', {}), 'imageUrlField': field}
-        return handle_proxy_request(url, proxy_settings)
-    
-    if url_construction == 'special_pollinations':
-        tags = request.args.get('tags')
-        if not tags:
-            return jsonify({'error': 'Missing tags parameter'}), 400
-        base_tag = config.get('baseTag', '')
-        model_name = config_entry.get('modelName', '')
-        prompt_url = f"{config_entry.get('url', '')}{quote(tags)}%2c{base_tag}?&model={model_name}&nologo=true"
-        return redirect(prompt_url)
-    
-    if url_construction == 'special_draw_redirect':
-        tags = request.args.get('tags')
-        query_params = config_entry.get('queryParams', [])
-        default_model = next((p.get('defaultValue') for p in query_params if p.get('name') == 'model'), 'flux')
-        model = request.args.get('model', default_model)
-        if not tags:
-            return jsonify({'error': 'Missing tags parameter'}), 400
-        return redirect(f'/{model}?tags={quote(tags)}')
-    
-    # 通用处理
-    validated_params = {}
-    errors = []
-    
-    for param in config_entry.get('queryParams', []):
-        param_name = param.get('name')
-        value = request.args.get(param_name)
-        
-        if value is not None:
-            valid_values = param.get('validValues')
-            if valid_values and value not in valid_values:
-                errors.append(f"Invalid value for '{param_name}'")
-            else:
-                validated_params[param_name] = value
-        elif param.get('required'):
-            errors.append(f"Missing required parameter: {param_name}")
-        elif param.get('defaultValue') is not None:
-            validated_params[param_name] = param['defaultValue']
-    
-    if errors:
-        return jsonify({'error': 'Invalid parameters', 'details': errors}), 400
-    
-    target_url = config_entry.get('url', '')
-    if not target_url:
-        return jsonify({'error': 'Configuration URL missing'}), 500
-    
-    # 拼接查询参数
-    if validated_params:
-        separator = '&' if '?' in target_url else '?'
-        target_url = f"{target_url}{separator}{urlencode(validated_params)}"
-    
-    print(f'[Router] Target: {target_url}')
-    
-    # 根据方法处理
-    if config_entry.get('method') == 'proxy':
-        return handle_proxy_request(target_url, config_entry.get('proxySettings', {}))
-    
-    # 默认重定向
-    return redirect(target_url)
-
 @redirect_bp.route('/<name>')
 def dynamic_route(name):
     """统一动态路由：处理 API 转发和图片合集
@@ -156,13 +27,10 @@ def dynamic_route(name):
     if name in RESERVED_PATHS or '.' in name or name == 'favicon.ico':
         abort(404)
     
-    # 获取配置
-    config = get_current_config()
-    config_entry = config.get('apiUrls', {}).get(name)
-    
-    # 优先检查 API 端点
-    if config_entry and config_entry.get('method'):
-        return handle_api_forward(name, config_entry, config)
+    # 优先检查 API 端点（调度计划按配置版本预编译）
+    plan = get_endpoint_plan(name)
+    if plan is not None:
+        return plan.dispatch(request.args)
     
     # 检查是否是图片合集
     if storage_manager.collection_exists(name):
@@ -172,29 +40,42 @@ def dynamic_route(name):
     abort(404)
 
 def handle_collection_redirect(collection_name):
-    """处理图片合集随机重定向"""
+    """处理图片合集随机重定向（带选择参数时结果可重复并可被缓存）"""
+    seed, cache_control = selection_seed(request.args)
     # 从合集中随机获取一个资源
-    resource_type, resource_path = storage_manager.get_random_resource(collection_name)
+    resource_type, resource_path = storage_manager.get_random_resource(collection_name, seed=seed)
     
     if not resource_type or not resource_path:
         abort(404, description=f"合集 '{collection_name}' 中没有可用的资源")
     
     # 根据资源类型处理请求
-    if resource_type == 'local':
-        # 检查文件是否存在，提供更清晰的错误信息
-        if not os.path.exists(resource_path):
+    if resource_type == 'local' and get_collection_settings(collection_name).get('delivery') == 'redirect':
+        # 重定向到固定地址：图片内容可被浏览器和 CDN 长期缓存，只有重定向本身按选择参数缓存
+        filename = os.path.basename(resource_path)
+        response = redirect(url_for('main.serve_picture', filename=f'{collection_name}/{filename}'))
+        response.headers['Cache-Control'] = cache_control
+        return response
+    elif resource_type == 'local':
+        # 本地图片：直接返回文件（文件列表来自内存索引，不再预先检查文件是否存在）
+        # 真随机时响应不可缓存；ETag 让 If-Range 续传不会拼接不同的图片
+        try:
+            return send_image(collection_name, os.path.basename(resource_path), cache_control)
+        except FileNotFoundError:
+            # 索引已过期（文件被其他进程删除），丢弃索引以便下次重新扫描
+            storage_manager.index.invalidate(collection_name)
             current_app.logger.error(f"文件不存在: {resource_path}")
             abort(404, description=f"图片文件不存在: {os.path.basename(resource_path)}")
-        
-        # 本地图片：直接返回文件
-        try:
-            return send_file(resource_path)
+        except HTTPException:
+            # 如 Range 超出文件长度时的 416
+            raise
         except Exception as e:
             current_app.logger.error(f"发送文件错误: {str(e)}")
             abort(500, description=f"无法加载图片: {os.path.basename(resource_path)}")
     elif resource_type == 'external':
         # 外部链接：通过HTTP重定向
-        return redirect(resource_path)
+        response = redirect(resource_path)
+        response.headers['Cache-Control'] = cache_control
+        return response
     else:
         # 未知资源类型
-        abort(500, description="系统错误：未知的资源类型")
\ No newline at end of file
+        abort(500, description="系统错误：未知的资源类型")
@@ -1,3 +1,12 @@
+from app.storage.bytecache import image_cache
 from app.storage.manager import StorageManager
 
-storage_manager = StorageManager()
\ No newline at end of file
+storage_manager = StorageManager()
+
+
+def init_storage(app):
+    """初始化存储模块：按配置设置热点图片内存缓存"""
+    image_cache.configure(
+        app.config.get('IMAGE_CACHE_SIZE', 0),
+        app.config.get('IMAGE_CACHE_MAX_ITEM_SIZE', 512 * 1024)
+    )
@@ -0,0 +1,229 @@
+"""
+压缩包导入模块
+
+把上传的 ZIP / TAR 压缩包逐个成员解压到合集目录，不把压缩包或成员整体读入内存：
+- ZIP 按目录逐个打开成员，TAR（含 gz / bz2 / xz 压缩）以流模式顺序读取
+- 只导入扩展名在允许列表中的普通文件，忽略目录层级、隐藏文件和符号链接
+- 命名规则与上传图片一致：文件名安全处理，不含扩展名超过 8 个字符的改为顺序编号，重名时追加序号；
+  导入前只列出一次目录，顺序编号按批预留，结束后归还未用完的编号
+- 每个成员先写入隐藏临时文件，再以不覆盖已有文件的方式改名为最终文件名
+"""
+import os
+import shutil
+import tarfile
+import uuid
+import zipfile
+from werkzeug.utils import secure_filename
+from app.storage.sequence import SequenceCounter
+from app.storage.uploads import UPLOAD_FILE_PREFIX
+
+# 支持的压缩包扩展名（小写，不含点号）
+ARCHIVE_EXTENSIONS = {'zip', 'tar', 'tgz', 'gz', 'tbz2', 'bz2', 'txz', 'xz'}
+
+# 解压时每次复制的字节数
+_COPY_CHUNK_SIZE = 1024 * 1024
+# 顺序编号每批预留数量的上限
+_MAX_RESERVE_BATCH = 4096
+
+
+def _iter_zip(path):
+    """逐个产出 ZIP 成员 (成员名, 大小, 打开函数)，先产出成员总数"""
+    with zipfile.ZipFile(path) as archive:
+        members = archive.infolist()
+        yield len(members)
+        for info in members:
+            if info.is_dir():
+                yield info.filename, None, None
+                continue
+            # 外部属性高 16 位为 Unix 文件类型，跳过符号链接
+            if (info.external_attr >> 16) & 0o170000 == 0o120000:
+                yield info.filename, None, None
+                continue
+            yield info.filename, info.file_size, lambda info=info: archive.open(info)
+
+
+def _iter_tar(path):
+    """以流模式逐个产出 TAR 成员 (成员名, 大小, 打开函数)，成员总数未知"""
+    with tarfile.open(path, mode='r|*') as archive:
+        yield None
+        for member in archive:
+            if not member.isfile():
+                yield member.name, None, None
+                continue
+            yield member.name, member.size, lambda member=member: archive.extractfile(member)
+
+
+def open_archive(path):
+    """打开压缩包
+
+    Returns:
+        tuple: (成员总数或 None, 成员迭代器)
+
+    Raises:
+        ValueError: 不是 ZIP 或 TAR 压缩包
+    """
+    if zipfile.is_zipfile(path):
+        members = _iter_zip(path)
+    else:
+        try:
+            with tarfile.open(path, mode='r|*'):
+                pass
+        except tarfile.TarError:
+            raise ValueError('不支持的压缩包格式，仅支持 ZIP 和 TAR（含 gz / bz2 / xz 压缩）')
+        members = _iter_tar(path)
+    total = next(members)
+    return total, members
+
+
+class ArchiveImporter:
+    """把压缩包中的图片批量导入合集目录
+
+    Args:
+        collection_path: 合集目录路径
+        allowed_extensions: 允许导入的扩展名（小写，不含点号）
+        max_file_size: 单个文件大小上限（字节），超过的成员跳过
+        max_length: 文件名（不含扩展名）最大长度，超过的改为顺序编号
+        logger: 日志记录器
+    """
+
+    def __init__(self, collection_path, allowed_extensions, max_file_size, max_length=8, logger=None):
+        self.collection_path = collection_path
+        self.allowed_extensions = allowed_extensions
+        self.max_file_size = max_file_size
+        self.max_length = max_length
+        self.logger = logger
+        self.counter = SequenceCounter(collection_path)
+        # 已占用的文件名与数字编号，导入前列出一次目录
+        self._taken = set()
+        self._numbers = set()
+        # 每个文件名追加序号时的下一个候选值
+        self._suffixes = {}
+        self._next_number = self._end = 0
+        self._batch = 64
+
+    def _load_existing(self):
+        with os.scandir(self.collection_path) as entries:
+            for entry in entries:
+                self._taken.add(entry.name)
+                stem = os.path.splitext(entry.name)[0]
+                if stem.isdigit():
+                    self._numbers.add(int(stem))
+
+    def _next_sequential(self, extension):
+        while True:
+            if self._next_number >= self._end:
+                self._next_number = self.counter.reserve(self._batch)
+                self._end = self._next_number + self._batch
+                self._batch = min(self._batch * 2, _MAX_RESERVE_BATCH)
+            number = self._next_number
+            self._next_number += 1
+            if number not in self._numbers:
+                filename = f'{number}{extension}'
+                if filename not in self._taken:
+                    return filename
+
+    def _target_name(self, filename):
+        """按上传规则为成员选择目标文件名"""
+        stem, extension = os.path.splitext(filename)
+        if len(stem) > self.max_length:
+            return self._next_sequential(extension)
+        if filename not in self._taken:
+            return filename
+        # 重名时追加序号，记住每个文件名用到的序号，避免重复尝试
+        counter = self._suffixes.get(filename, 1)
+        while f'{stem}_{counter}{extension}' in self._taken:
+            counter += 1
+        self._suffixes[filename] = counter + 1
+        return f'{stem}_{counter}{extension}'
+
+    def _place(self, temp_path, filename):
+        """把临时文件改名为目标文件名（不覆盖已有文件），返回最终文件名"""
+        while True:
+            target = self._target_name(filename)
+            save_path = os.path.join(self.collection_path, target)
+            try:
+                # link 在目标已存在时失败，与同时进行的上传不会互相覆盖
+                os.link(temp_path, save_path)
+                os.remove(temp_path)
+                break
+            except FileExistsError:
+                pass
+            except OSError:
+                # 文件系统不支持硬链接
+                if not os.path.exists(save_path):
+                    os.replace(temp_path, save_path)
+                    break
+            # 目标是导入开始后才出现的文件
+            self._taken.add(target)
+        self._taken.add(target)
+        return target
+
+    def run(self, archive_path, skip=0, on_item=None):
+        """导入压缩包
+
+        Args:
+            archive_path: 压缩包路径
+            skip: 跳过前 skip 个成员（任务重试时从上次的进度继续）
+            on_item: 每处理一个成员后调用 on_item(已处理数, 成员总数或 None, 已导入数)
+
+        Returns:
+            dict: 导入、跳过（类型不支持）、超过大小上限、失败的成员数
+                {'imported', 'skipped', 'oversized', 'failed'}
+
+        Raises:
+            ValueError: 不支持的压缩包格式
+        """
+        total, members = open_archive(archive_path)
+        self._load_existing()
+        stats = {'imported': 0, 'skipped': 0, 'oversized': 0, 'failed': 0}
+        temp_path = os.path.join(self.collection_path, f'{UPLOAD_FILE_PREFIX}{uuid.uuid4().hex}.part')
+        processed = 0
+        try:
+            for name, size, open_member in members:
+                processed += 1
+                if processed <= skip:
+                    continue
+                self._import_member(name, size, open_member, temp_path, stats)
+                if on_item:
+                    on_item(processed, total, stats['imported'])
+            if on_item and total is None:
+                # TAR 读完后才知道成员总数
+                on_item(processed, processed, stats['imported'])
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+            # 压缩包在中途损坏：保留已导入的文件
+            if self.logger:
+                self.logger.error(f"压缩包 '{archive_path}' 在第 {processed} 个成员处损坏: {e}")
+            stats['failed'] += 1
+        finally:
+            members.close()
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            self.counter.release(self._end, self._next_number)
+        return stats
+
+    def _import_member(self, name, size, open_member, temp_path, stats):
+        if open_member is None:
+            # 目录、符号链接等非普通文件
+            return
+        base = name.replace('\\', '/').rsplit('/', 1)[-1]
+        filename = secure_filename(base)
+        ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        if base.startswith('.') or '__MACOSX/' in name or ext not in self.allowed_extensions:
+            stats['skipped'] += 1
+            return
+        if size > self.max_file_size:
+            stats['oversized'] += 1
+            return
+        try:
+            with open_member() as src, open(temp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, _COPY_CHUNK_SIZE)
+            self._place(temp_path, filename)
+        except (OSError, RuntimeError, zipfile.BadZipFile) as e:
+            # 单个成员损坏或加密时跳过
+            if self.logger:
+                self.logger.warning(f"导入压缩包成员 '{name}' 失败: {e}")
+            stats['failed'] += 1
+            return
+        stats['imported'] += 1
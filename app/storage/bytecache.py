@@ -0,0 +1,123 @@
+"""
+热点图片内存缓存模块
+
+每个 worker 进程在内存中缓存小图片的内容，命中时不再打开和读取文件：
+- 只缓存不超过单张大小上限的图片，所有条目合计不超过总内存预算
+- 按最近最少使用（LRU）顺序淘汰，淘汰时按字节数而不是条目数计算
+- 条目记录文件的 (大小, mtime_ns, inode)，与本次请求的 stat 结果不一致时视为失效
+- 统计命中率、常驻字节数和淘汰次数，用于调整缓存大小
+"""
+import threading
+from collections import OrderedDict
+
+
+class ImageByteCache:
+    """按字节数限制的 LRU 图片内容缓存
+
+    Args:
+        max_bytes: 总内存预算（字节），0 表示关闭
+        max_item_bytes: 单张图片大小上限（字节）
+    """
+
+    def __init__(self, max_bytes=0, max_item_bytes=512 * 1024):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._entries = OrderedDict()
+        self._resident = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def configure(self, max_bytes, max_item_bytes):
+        """调整内存预算与单张大小上限"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self.max_item_bytes = max_item_bytes
+            self._evict(0)
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def accepts(self, size):
+        """该大小的图片是否会被缓存"""
+        return 0 < size <= min(self.max_item_bytes, self.max_bytes)
+
+    @staticmethod
+    def _stat_key(stat_result):
+        return (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino)
+
+    def _evict(self, incoming):
+        """淘汰最久未使用的条目，直到能容纳 incoming 字节（调用方需持有锁）"""
+        while self._entries and self._resident + incoming > self.max_bytes:
+            _, (data, _) = self._entries.popitem(last=False)
+            self._resident -= len(data)
+            self._evictions += 1
+
+    def get(self, path, stat_result):
+        """查询缓存
+
+        Args:
+            path: 图片路径
+            stat_result: 本次请求的 os.stat 结果
+
+        Returns:
+            bytes or None: 命中时返回图片内容
+        """
+        key = self._stat_key(stat_result)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[1] == key:
+                self._entries.move_to_end(path)
+                self._hits += 1
+                return entry[0]
+            if entry is not None:
+                # 文件已被修改或替换
+                del self._entries[path]
+                self._resident -= len(entry[0])
+            self._misses += 1
+            return None
+
+    def put(self, path, stat_result, data):
+        """写入缓存，超过单张大小上限或读取期间文件发生变化时忽略
+
+        Args:
+            path: 图片路径
+            stat_result: 读取前的 os.stat 结果
+            data: 图片内容
+        """
+        if len(data) != stat_result.st_size or not self.accepts(len(data)):
+            return
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self._resident -= len(previous[0])
+            self._evict(len(data))
+            self._entries[path] = (data, self._stat_key(stat_result))
+            self._resident += len(data)
+
+    def stats(self):
+        """当前进程的缓存统计"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'residentBytes': self._resident,
+                'maxBytes': self.max_bytes,
+                'maxItemBytes': self.max_item_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hitRatio': self._hits / lookups if lookups else 0.0,
+                'evictions': self._evictions
+            }
+
+    def clear(self):
+        """清空缓存（统计保留）"""
+        with self._lock:
+            self._entries.clear()
+            self._resident = 0
+
+
+image_cache = ImageByteCache()
@@ -0,0 +1,169 @@
+"""
+合集封面后台生成模块
+
+只有外链的合集需要下载第一个外链作为封面。下载在后台线程池中进行，
+页面请求只读取已经生成的封面文件，封面未就绪时由调用方显示占位图。
+- 同一合集同时只有一个生成任务：进程内按合集名去重，跨 worker 由合集目录下的文件锁去重
+- 线程池大小限制同时进行的下载数
+- 封面以隐藏文件 .cover.<ext> 持久化在合集目录中，不计入合集图片
+- 下载失败后在 COVER_RETRY_INTERVAL 秒内不再重试
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from app.proxy.client import http_client
+from app.storage.downloader import image_extension_for
+from app.storage.filelock import FileLock
+from app.storage.index import COVER_FILE_PREFIX, IMAGE_EXTENSIONS
+
+# 生成封面时持有的锁文件
+COVER_LOCK_FILENAME = '.cover.lock'
+
+
+def find_cover(collection_path):
+    """返回合集目录中已生成的封面文件名，不存在时返回 None"""
+    for ext in sorted(IMAGE_EXTENSIONS):
+        filename = f'{COVER_FILE_PREFIX}.{ext}'
+        if os.path.isfile(os.path.join(collection_path, filename)):
+            return filename
+    return None
+
+
+def download_cover(collection_path, url, timeout, max_bytes):
+    """下载图片并保存为合集封面（临时文件 + 原子重命名）
+
+    Args:
+        collection_path: 合集目录路径
+        url: 图片链接
+        timeout: 请求超时（秒）
+        max_bytes: 封面文件大小上限
+
+    Returns:
+        str: 封面文件名
+
+    Raises:
+        requests.exceptions.RequestException: 请求失败
+        ValueError: 响应不是图片或超过大小上限
+        OSError: 写入失败
+    """
+    response = http_client.get(url, timeout=timeout, stream=True)
+    try:
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '')
+        if content_type and not content_type.lower().startswith(('image/', 'application/octet-stream')):
+            raise ValueError(f'不是图片 ({content_type})')
+
+        filename = f'{COVER_FILE_PREFIX}.{image_extension_for(url, content_type)}'
+        temp_path = os.path.join(collection_path, f'{filename}.{os.getpid()}.tmp')
+        size = 0
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ValueError(f'超过大小上限 {max_bytes} 字节')
+                    f.write(chunk)
+            os.replace(temp_path, os.path.join(collection_path, filename))
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        return filename
+    finally:
+        response.close()
+
+
+class CoverQueue:
+    """合集封面生成队列（每个 worker 进程一份，线程池在首次使用时创建）"""
+
+    def __init__(self):
+        self._pending = set()
+        self._failed = {}
+        self._lock = threading.Lock()
+        self._executor = (None, None)
+
+    def _get_executor(self, max_workers):
+        pid = os.getpid()
+        owner, executor = self._executor
+        if owner != pid:
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='cover')
+            self._executor = (pid, executor)
+            # fork 后继承的状态属于父进程的线程池
+            self._pending = set()
+        return executor
+
+    def request(self, app, collection_name, collection_path, url, on_ready):
+        """请求为合集生成封面，立即返回
+
+        Args:
+            app: Flask 应用实例
+            collection_name: 合集名称
+            collection_path: 合集目录路径
+            url: 作为封面的图片链接
+            on_ready: 封面保存后调用的函数，参数为合集名称
+
+        Returns:
+            bool: 是否提交了新任务（已在生成或最近失败过时为 False）
+        """
+        retry_interval = app.config.get('COVER_RETRY_INTERVAL', 300)
+        with self._lock:
+            executor = self._get_executor(app.config.get('COVER_WORKERS', 2))
+            if collection_name in self._pending:
+                return False
+            failed_at = self._failed.get(collection_name)
+            if failed_at is not None and time.monotonic() - failed_at < retry_interval:
+                return False
+            self._pending.add(collection_name)
+        executor.submit(self._run, app, collection_name, collection_path, url, on_ready)
+        return True
+
+    def _run(self, app, collection_name, collection_path, url, on_ready):
+        try:
+            with app.app_context():
+                if self._generate(app, collection_name, collection_path, url):
+                    on_ready(collection_name)
+        finally:
+            with self._lock:
+                self._pending.discard(collection_name)
+
+    def _generate(self, app, collection_name, collection_path, url):
+        """下载封面，返回是否生成了新封面"""
+        lock = FileLock(os.path.join(collection_path, COVER_LOCK_FILENAME))
+        try:
+            if not lock.acquire(blocking=False):
+                # 其他 worker 正在生成，完成后索引校验会发现新封面
+                return False
+        except OSError:
+            # 合集已被删除
+            return False
+
+        try:
+            # 其他 worker 可能刚刚生成完毕，本进程的索引尚未校验到
+            if find_cover(collection_path):
+                return True
+            app.logger.info(f"合集 '{collection_name}': 后台从 '{url}' 下载封面。")
+            filename = download_cover(
+                collection_path,
+                url,
+                timeout=app.config.get('COVER_TIMEOUT', 10),
+                max_bytes=app.config.get('MAX_CONTENT_LENGTH', 20 * 1024 * 1024)
+            )
+        except (requests.exceptions.RequestException, ValueError, OSError) as e:
+            app.logger.error(f"下载合集 '{collection_name}' 的封面 '{url}' 失败: {e}")
+            with self._lock:
+                self._failed[collection_name] = time.monotonic()
+            return False
+        finally:
+            lock.release()
+
+        with self._lock:
+            self._failed.pop(collection_name, None)
+        app.logger.info(f"合集 '{collection_name}' 的封面已保存为 '{filename}'。")
+        return True
+
+
+cover_queue = CoverQueue()
@@ -0,0 +1,432 @@
+"""
+外链批量下载模块
+
+把合集的外部链接并发下载到合集目录：
+- 线程池限制总并发数，另按上游主机排队，只在该主机有空闲名额时才派发下载
+- 失败的下载退避时不占用主机名额；4xx（408、429 除外）不重试
+- 合集目录下的 .cache_manifest.json 记录 URL -> 文件名，重复运行时跳过已缓存的链接
+- 下载先写入 .dl-<hash>.part 临时文件，中断后再次下载时用 Range 请求续传，
+  完成后以不覆盖已有文件的方式原子地改名为最终文件名
+"""
+import hashlib
+import heapq
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlsplit
+import requests
+from werkzeug.utils import secure_filename
+from app.proxy.client import http_client
+from app.storage.filelock import FileLock
+from app.storage.index import IMAGE_EXTENSIONS
+
+# URL -> 文件名 清单
+MANIFEST_FILENAME = '.cache_manifest.json'
+MANIFEST_LOCK_FILENAME = '.cache_manifest.lock'
+
+# 缓存任务运行期间持有的锁文件，同一合集同时只运行一个下载任务
+DOWNLOAD_LOCK_FILENAME = '.cache_download.lock'
+
+# 未完成下载的临时文件前缀
+PART_FILE_PREFIX = '.dl-'
+
+# 每完成多少个下载保存一次清单
+_MANIFEST_FLUSH_EVERY = 20
+
+# 4xx 中值得重试的状态码（请求超时、请求过多）
+_RETRYABLE_CLIENT_ERRORS = (408, 429)
+
+# Content-Type 到图片扩展名的映射
+_CONTENT_TYPE_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+    'image/bmp': 'bmp',
+}
+
+
+def image_extension_for(url, content_type):
+    """根据 Content-Type 或链接路径确定图片扩展名（不含点号），默认为 jpg"""
+    mime = (content_type or '').split(';', 1)[0].strip().lower()
+    if mime in _CONTENT_TYPE_EXTENSIONS:
+        return _CONTENT_TYPE_EXTENSIONS[mime]
+    ext = os.path.splitext(urlsplit(url).path)[1][1:].lower()
+    return ext if ext in IMAGE_EXTENSIONS else 'jpg'
+
+
+class HostScheduler:
+    """按上游主机调度并发任务
+
+    每个主机一个待处理队列，只有该主机的并发名额空闲时才把它的任务交给线程池，
+    某个主机的大量链接不会占满全部线程；需要重试的任务先归还名额，退避结束后再排队。
+
+    Args:
+        workers: 同时进行的任务总数
+        per_host: 单个主机同时进行的任务数
+    """
+
+    def __init__(self, workers, per_host):
+        self.workers = max(1, workers)
+        self.per_host = max(1, per_host)
+
+    def run(self, urls, task, thread_name_prefix=None):
+        """执行全部任务，按完成顺序逐个产出 (url, 结果)
+
+        Args:
+            urls: 链接列表
+            task: task(url, 第几次尝试) -> (结果, 重试等待秒数)，等待秒数为 None 表示不再重试
+            thread_name_prefix: 线程名前缀
+
+        Yields:
+            tuple: (url, 结果)
+        """
+        queues = {}
+        for url in urls:
+            queues.setdefault(urlsplit(url).netloc.lower(), deque()).append((url, 1))
+        active = dict.fromkeys(queues, 0)
+        delayed = []
+        sequence = 0
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=thread_name_prefix or '') as executor:
+            while True:
+                now = time.monotonic()
+                while delayed and delayed[0][0] <= now:
+                    _, _, host, url, attempt = heapq.heappop(delayed)
+                    queues.setdefault(host, deque()).append((url, attempt))
+
+                for host, queue in list(queues.items()):
+                    while queue and active[host] < self.per_host and len(running) < self.workers:
+                        url, attempt = queue.popleft()
+                        active[host] += 1
+                        running[executor.submit(task, url, attempt)] = (host, url, attempt)
+                    if not queue:
+                        del queues[host]
+
+                if not running:
+                    if not delayed:
+                        return
+                    time.sleep(max(0, delayed[0][0] - time.monotonic()))
+                    continue
+
+                timeout = max(0, delayed[0][0] - time.monotonic()) if delayed else None
+                finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    host, url, attempt = running.pop(future)
+                    active[host] -= 1
+                    result, retry_after = future.result()
+                    if retry_after is None:
+                        yield url, result
+                    else:
+                        sequence += 1
+                        heapq.heappush(delayed, (time.monotonic() + retry_after, sequence, host, url, attempt + 1))
+
+
+class DownloadManifest:
+    """合集目录下的 URL -> 文件名 清单
+
+    读改写在文件锁内进行并以临时文件 + 原子重命名保存，
+    多个 worker（下载任务与重命名操作）同时修改时不会丢失记录。
+
+    Args:
+        collection_path: 合集目录路径
+    """
+
+    def __init__(self, collection_path):
+        self.path = os.path.join(collection_path, MANIFEST_FILENAME)
+        self.lock_path = os.path.join(collection_path, MANIFEST_LOCK_FILENAME)
+
+    def load(self):
+        """读取清单，文件不存在或损坏时返回空字典"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def update(self, added=None, renamed=None):
+        """合并修改并保存
+
+        Args:
+            added: {URL: 文件名}，新缓存的链接
+            renamed: {旧文件名: 新文件名}，合集内被重命名的文件
+        """
+        with FileLock(self.lock_path):
+            data = self.load()
+            if renamed:
+                for url, filename in data.items():
+                    if filename in renamed:
+                        data[url] = renamed[filename]
+            if added:
+                data.update(added)
+            tmp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+
+class BulkDownloader:
+    """合集外链批量下载器
+
+    Args:
+        collection_path: 合集目录路径
+        workers: 同时进行的下载总数
+        per_host: 单个上游主机同时进行的下载数
+        timeout: (连接超时, 读取超时)
+        retries: 每个链接的最多尝试次数（失败后从已下载的位置续传）
+        logger: 日志记录器
+        on_progress: 每次保存清单后调用的无参函数（如刷新合集索引）
+        on_item: 每处理完一个链接后调用 on_item(已处理数, 待处理总数, 成功数)
+    """
+
+    def __init__(self, collection_path, workers=8, per_host=2, timeout=(5, 30), retries=3,
+                 logger=None, on_progress=None, on_item=None):
+        self.collection_path = collection_path
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.retries = max(1, retries)
+        self.logger = logger
+        self.on_progress = on_progress
+        self.on_item = on_item
+        self.manifest = DownloadManifest(collection_path)
+        self._scheduler = HostScheduler(self.workers, per_host)
+        self._lock = threading.Lock()
+        self._completed = {}
+
+    def _log(self, level, message):
+        if self.logger is not None:
+            getattr(self.logger, level)(message)
+
+    def pending_urls(self, urls):
+        """去重并排除清单中已缓存（文件仍存在）的链接"""
+        manifest = self.manifest.load()
+        pending = []
+        seen = set()
+        for url in urls:
+            if url in seen:
+                continue
+            seen.add(url)
+            filename = manifest.get(url)
+            if filename and os.path.isfile(os.path.join(self.collection_path, filename)):
+                continue
+            pending.append(url)
+        return pending
+
+    def run(self, urls):
+        """下载全部未缓存的链接
+
+        Args:
+            urls: 外部链接列表
+
+        Returns:
+            int: 成功下载的图片数量
+        """
+        pending = self.pending_urls(urls)
+        self._log('info', f"共 {len(pending)} 个链接待缓存（跳过 {len(urls) - len(pending)} 个）。")
+        if not pending:
+            return 0
+
+        downloaded = 0
+        results = self._scheduler.run(pending, self._download_one, thread_name_prefix='cache-download')
+        for done, (_, filename) in enumerate(results, 1):
+            if filename is not None:
+                downloaded += 1
+            if self.on_item is not None:
+                self.on_item(done, len(pending), downloaded)
+        self._flush(force=True)
+        return downloaded
+
+    def _download_one(self, url, attempt):
+        """尝试下载单个链接
+
+        Returns:
+            tuple: (保存的文件名或 None, 重试等待秒数或 None)
+        """
+        try:
+            filename = self._fetch(url)
+        except (requests.exceptions.RequestException, OSError) as e:
+            self._log('warning', f"下载 '{url}' 失败 (第 {attempt}/{self.retries} 次): {e}")
+            status = getattr(getattr(e, 'response', None), 'status_code', None)
+            if status is not None and 400 <= status < 500 and status not in _RETRYABLE_CLIENT_ERRORS:
+                return None, None
+            return None, (attempt if attempt < self.retries else None)
+        except Exception as e:
+            self._log('error', f"处理链接 '{url}' 时发生未知错误: {e}")
+            return None, None
+        with self._lock:
+            self._completed[url] = filename
+        self._flush()
+        self._log('info', f"成功下载并保存 '{filename}'。")
+        return filename, None
+
+    def _part_paths(self, url):
+        digest = hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]
+        base = os.path.join(self.collection_path, f'{PART_FILE_PREFIX}{digest}')
+        return f'{base}.part', f'{base}.json'
+
+    def _fetch(self, url):
+        part_path, meta_path = self._part_paths(url)
+        headers = {'Accept-Encoding': 'identity'}
+
+        # 已有部分内容且记录了校验值时续传，If-Range 保证上游文件未变化
+        offset = 0
+        meta = {}
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            offset = os.path.getsize(part_path)
+        except (OSError, ValueError):
+            meta = {}
+        if offset and meta.get('validator'):
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = meta['validator']
+        else:
+            offset = 0
+
+        response = http_client.get(url, timeout=self.timeout, stream=True, headers=headers)
+        try:
+            if response.status_code == 416 and offset and offset == meta.get('length'):
+                # 上一次已经下载完整，只是没来得及改名
+                return self._finish(url, part_path, meta_path, meta.get('contentType'))
+            response.raise_for_status()
+
+            if response.status_code == 206:
+                if not offset or not response.headers.get('Content-Range', '').startswith(f'bytes {offset}-'):
+                    self._discard_part(part_path, meta_path)
+                    raise OSError('上游返回的续传范围不匹配，重新下载')
+                mode = 'ab'
+            else:
+                offset = 0
+                mode = 'wb'
+                etag = response.headers.get('ETag', '')
+                meta = {
+                    'url': url,
+                    'validator': (etag if etag and not etag.startswith('W/') else None)
+                    or response.headers.get('Last-Modified'),
+                    'length': int(response.headers['Content-Length'])
+                    if response.headers.get('Content-Length', '').isdigit() else None,
+                    'contentType': response.headers.get('Content-Type'),
+                }
+                with open(meta_path, 'w', encoding='utf-8') as f:
+                    json.dump(meta, f)
+
+            with open(part_path, mode) as f:
+                for chunk in response.iter_content(chunk_size=64 * 1024):
+                    f.write(chunk)
+                size = f.tell()
+        finally:
+            response.close()
+
+        if meta.get('length') is not None and size != meta['length']:
+            raise OSError(f'下载不完整 ({size}/{meta["length"]} 字节)，稍后续传')
+        return self._finish(url, part_path, meta_path, meta.get('contentType'))
+
+    @staticmethod
+    def _discard_part(part_path, meta_path):
+        for path in (part_path, meta_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _target_name(self, url, content_type):
+        """根据链接生成文件名（安全处理，缺少图片扩展名时按 Content-Type 补全）"""
+        original = secure_filename(os.path.basename(urlsplit(url).path))
+        stem, ext = os.path.splitext(original)
+        if not stem:
+            stem = f"downloaded_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}"
+        if ext[1:].lower() not in IMAGE_EXTENSIONS:
+            ext = f'.{image_extension_for(url, content_type)}'
+        return stem, ext
+
+    def _finish(self, url, part_path, meta_path, content_type):
+        """把下载完成的临时文件改名为不与已有文件冲突的最终文件名"""
+        stem, ext = self._target_name(url, content_type)
+        counter = 0
+        while True:
+            filename = f'{stem}_{counter}{ext}' if counter else f'{stem}{ext}'
+            final_path = os.path.join(self.collection_path, filename)
+            try:
+                # link 在目标已存在时失败，不会覆盖其他下载或上传的文件
+                os.link(part_path, final_path)
+                break
+            except FileExistsError:
+                pass
+            except OSError:
+                # 文件系统不支持硬链接
+                if not os.path.exists(final_path):
+                    os.replace(part_path, final_path)
+                    break
+            counter += 1
+        self._discard_part(part_path, meta_path)
+        return filename
+
+    def _flush(self, force=False):
+        """把已完成的下载写入清单"""
+        with self._lock:
+            if not self._completed or (not force and len(self._completed) < _MANIFEST_FLUSH_EVERY):
+                return
+            completed, self._completed = self._completed, {}
+        try:
+            self.manifest.update(added=completed)
+        except OSError as e:
+            self._log('error', f"保存下载清单失败: {e}")
+            with self._lock:
+                completed.update(self._completed)
+                self._completed = completed
+            return
+        if self.on_progress is not None:
+            self.on_progress()
+
+
+def check_link(url, timeout):
+    """检查外链是否仍然指向可访问的图片
+
+    先发送 HEAD 请求，上游不支持 HEAD 时改用 GET（只读取响应头）。
+
+    Returns:
+        str or None: 失效原因，链接有效时返回 None
+    """
+    try:
+        response = http_client.session.head(url, timeout=timeout, allow_redirects=True)
+        if response.status_code in (403, 405, 501):
+            response = http_client.get(url, timeout=timeout, stream=True)
+            response.close()
+    except requests.exceptions.RequestException as e:
+        return f'请求失败: {e.__class__.__name__}'
+    if response.status_code >= 400:
+        return f'HTTP {response.status_code}'
+    content_type = response.headers.get('Content-Type', '').lower()
+    if content_type and not content_type.startswith(('image/', 'video/', 'application/octet-stream')):
+        return f'不是图片 ({content_type})'
+    return None
+
+
+def check_links(urls, workers=8, per_host=2, timeout=(5, 15), on_item=None):
+    """并发检查一组外链
+
+    Args:
+        urls: 外链列表
+        workers: 总并发数
+        per_host: 单个主机的并发数
+        timeout: (连接超时, 读取超时)
+        on_item: 每检查完一个链接后调用 on_item(已检查数, 总数, 失效数)
+
+    Returns:
+        list: [(失效链接, 原因), ...]，顺序与输入一致
+    """
+    reasons = {}
+    results = HostScheduler(workers, per_host).run(
+        urls, lambda url, attempt: (check_link(url, timeout), None), thread_name_prefix='link-check'
+    )
+    for done, (url, reason) in enumerate(results, 1):
+        if reason is not None:
+            reasons[url] = reason
+        if on_item is not None:
+            on_item(done, len(urls), len(reasons))
+    return [(url, reasons[url]) for url in urls if url in reasons]
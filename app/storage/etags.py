@@ -0,0 +1,130 @@
+"""
+图片内容哈希模块
+
+为合集中的图片计算基于内容的强 ETag，结果持久化在合集目录的 .etags 文件中：
+- 每行一条 JSON 记录 {"n": 文件名, "s": 大小, "m": mtime_ns, "h": 哈希}，后写入的记录覆盖先前的
+- 文件大小或 mtime 变化后记录失效，下次访问时重新计算
+- 各 worker 只追加新记录，其他 worker 通过 .etags 的 mtime 变化感知并重新加载
+- 失效记录累计过多时在文件锁内重写
+"""
+import hashlib
+import json
+import os
+import threading
+from app.storage.filelock import FileLock
+
+# 内容哈希记录文件名（隐藏文件，不会被识别为图片）
+ETAGS_FILENAME = '.etags'
+ETAGS_LOCK_FILENAME = '.etags.lock'
+
+# 计算哈希时每次读取的字节数
+_READ_CHUNK_SIZE = 1024 * 1024
+# 记录行数超过有效记录数的倍数时重写文件
+_COMPACT_RATIO = 2
+_COMPACT_MIN_LINES = 256
+
+
+def hash_file(path):
+    """计算文件内容的哈希（blake2b，32 位十六进制）"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentHashes:
+    """单个合集的内容哈希表
+
+    Args:
+        collection_path: 合集目录路径
+    """
+
+    def __init__(self, collection_path):
+        self.collection_path = collection_path
+        self.path = os.path.join(collection_path, ETAGS_FILENAME)
+        self.lock_path = os.path.join(collection_path, ETAGS_LOCK_FILENAME)
+        self._table = {}
+        self._lines = 0
+        self._loaded_mtime = None
+        self._lock = threading.Lock()
+
+    def _reload(self):
+        """.etags 被其他进程修改后重新加载（调用方需持有锁）"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime == self._loaded_mtime:
+            return
+        table, lines = {}, 0
+        if mtime is not None:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                        table[record['n']] = (record['s'], record['m'], record['h'])
+                    except (ValueError, KeyError, TypeError):
+                        # 写入中断留下的半行
+                        continue
+        self._table, self._lines, self._loaded_mtime = table, lines, mtime
+
+    def get(self, filename, stat_result):
+        """返回图片的内容哈希，记录缺失或失效时计算并保存
+
+        Args:
+            filename: 图片文件名
+            stat_result: 图片的 os.stat 结果，用于判断记录是否仍然有效
+
+        Returns:
+            str: 内容哈希
+        """
+        key = (stat_result.st_size, stat_result.st_mtime_ns)
+        record = self._table.get(filename)
+        if record is not None and record[:2] == key:
+            return record[2]
+        with self._lock:
+            self._reload()
+            record = self._table.get(filename)
+            if record is not None and record[:2] == key:
+                return record[2]
+
+        digest = hash_file(os.path.join(self.collection_path, filename))
+        with self._lock:
+            self._table[filename] = key + (digest,)
+            try:
+                self._append(filename, key, digest)
+            except OSError:
+                # 合集目录只读或已被删除时只保留内存中的记录
+                pass
+        return digest
+
+    def _append(self, filename, key, digest):
+        line = json.dumps({'n': filename, 's': key[0], 'm': key[1], 'h': digest}, ensure_ascii=False) + '\n'
+        with FileLock(self.lock_path):
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self._lines += 1
+            if self._lines > max(_COMPACT_MIN_LINES, len(self._table) * _COMPACT_RATIO):
+                self._compact()
+            self._loaded_mtime = os.stat(self.path).st_mtime_ns
+
+    def _compact(self):
+        """只保留仍然存在的图片的最新记录（调用方需持有文件锁）"""
+        self._loaded_mtime = None
+        self._reload()
+        live = {}
+        for filename, record in self._table.items():
+            try:
+                stat_result = os.stat(os.path.join(self.collection_path, filename))
+            except OSError:
+                continue
+            if record[:2] == (stat_result.st_size, stat_result.st_mtime_ns):
+                live[filename] = record
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for filename, (size, mtime, digest) in live.items():
+                f.write(json.dumps({'n': filename, 's': size, 'm': mtime, 'h': digest}, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, self.path)
+        self._table, self._lines = live, len(live)
@@ -0,0 +1,117 @@
+"""
+跨进程文件锁
+
+基于 fcntl.flock 实现，gunicorn 的多个 worker 之间互斥；进程退出时锁自动释放。
+在不支持 fcntl 的平台（Windows）上退化为进程内的线程锁。
+"""
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# 无 fcntl 时按路径共享的进程内锁
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def _local_lock(path):
+    with _local_locks_guard:
+        lock = _local_locks.get(path)
+        if lock is None:
+            lock = _local_locks[path] = threading.Lock()
+        return lock
+
+
+class FileLock:
+    """独占文件锁，可用作上下文管理器
+
+    每个实例只应在一个线程中使用；不同线程/进程各自创建实例即可互斥。
+
+    Args:
+        path: 锁文件路径（不存在时自动创建）
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._local = None
+
+    def acquire(self, blocking=True, timeout=None, poll_interval=0.05):
+        """获取锁
+
+        Args:
+            blocking: 是否阻塞等待
+            timeout: 最长等待秒数，None 表示一直等待
+            poll_interval: 带超时等待时的轮询间隔
+
+        Returns:
+            bool: 是否成功获取
+        """
+        if fcntl is None:
+            self._local = _local_lock(self.path)
+            if not blocking:
+                return self._local.acquire(False)
+            return self._local.acquire(True, -1 if timeout is None else timeout)
+
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if blocking and timeout is None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                deadline = time.monotonic() + (timeout or 0)
+                while True:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if not blocking or time.monotonic() >= deadline:
+                            os.close(fd)
+                            return False
+                        time.sleep(poll_interval)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return True
+
+    def release(self):
+        """释放锁"""
+        if self._local is not None:
+            self._local.release()
+            self._local = None
+        if self._fd is not None:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+
+    def is_current(self):
+        """持锁期间判断锁文件是否仍是该路径上的文件
+
+        其他进程可能在持锁时删除锁文件；在已删除的文件上拿到的锁不再与新打开该路径的进程互斥。
+        """
+        if self._fd is None:
+            return True
+        try:
+            return os.fstat(self._fd).st_ino == os.stat(self.path).st_ino
+        except OSError:
+            return False
+
+    def unlink(self):
+        """持锁时删除锁文件，等待同一文件的进程拿到锁后应通过 is_current() 重新打开"""
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
@@ -0,0 +1,218 @@
+"""
+合集内存索引模块
+
+每个 worker 进程持有一份合集文件列表和外链列表的内存副本，
+随机取图时直接从内存中选择，避免每次请求都扫描磁盘。
+"""
+import hashlib
+import os
+import threading
+import time
+from app.storage.etags import ContentHashes
+from app.storage.links import LINKS_INDEX_FILENAME, LINKS_TOMBSTONE_FILENAME, load_link_list
+
+# 合集中识别为图片的扩展名（小写，不含点号）
+IMAGE_EXTENSIONS = frozenset(['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'psd', 'tif'])
+
+# 后台生成的合集封面文件名前缀（隐藏文件，不计入合集图片），完整文件名如 .cover.jpg
+COVER_FILE_PREFIX = '.cover'
+
+
+def _stat_mtime(path):
+    """返回路径的 mtime_ns，不存在时返回 None"""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def scan_collection(collection_path):
+    """单次遍历目录，返回按名称排序的图片文件名列表和后台生成的封面文件名
+
+    Args:
+        collection_path: 合集目录路径
+
+    Returns:
+        tuple: (图片文件名列表, 封面文件名或 None)
+    """
+    images = []
+    cover = None
+    with os.scandir(collection_path) as entries:
+        for entry in entries:
+            name = entry.name
+            ext = name.rsplit('.', 1)[1].lower() if '.' in name else ''
+            # 与 glob 行为一致：忽略隐藏文件
+            if name.startswith('.'):
+                if name == f'{COVER_FILE_PREFIX}.{ext}' and ext in IMAGE_EXTENSIONS:
+                    cover = name
+                continue
+            if ext in IMAGE_EXTENSIONS and entry.is_file():
+                images.append(name)
+    images.sort()
+    return images, cover
+
+
+class CollectionEntry:
+    """单个合集的索引快照"""
+
+    __slots__ = ('images', 'cover', 'links', 'dir_mtime', 'links_mtime', 'checked_at', '_fingerprint')
+
+    def __init__(self, images, cover, links, dir_mtime, links_mtime, checked_at):
+        self.images = images
+        self.cover = cover
+        self.links = links
+        self.dir_mtime = dir_mtime
+        self.links_mtime = links_mtime
+        self.checked_at = checked_at
+        self._fingerprint = None
+
+    def fingerprint(self):
+        """合集内容的版本标识（首次调用时计算）
+
+        由图片文件名列表和外链文件状态决定，各 worker 看到的相同；
+        只有隐藏文件（如封面、ETag 记录）变化时保持不变。
+        """
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            for name in self.images:
+                digest.update(name.encode('utf-8', 'surrogateescape') + b'\n')
+            digest.update(repr(self.links_mtime).encode('ascii'))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+
+class CollectionIndex:
+    """按合集缓存文件列表和外链列表
+
+    条目在以下情况下失效：
+    - 距上次校验超过 revalidate_interval 秒，且目录或外链文件的 mtime 发生变化
+      （用于感知其他 worker 或手工对磁盘的修改）
+    - 本进程内的管理操作显式调用 invalidate()
+
+    在校验间隔内命中缓存时不会产生任何文件系统调用。
+    每次条目内容发生变化时 version 递增，供上层缓存判断是否需要重建。
+
+    图片的内容哈希（用作强 ETag）按合集单独缓存，记录按文件大小和 mtime 校验，
+    不随条目失效而丢弃。
+    """
+
+    def __init__(self, revalidate_interval=2.0):
+        self.revalidate_interval = revalidate_interval
+        self.version = 0
+        self._entries = {}
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def get(self, collection_name, collection_path, links_path):
+        """获取合集的索引条目
+
+        Args:
+            collection_name: 合集名称
+            collection_path: 合集目录路径
+            links_path: 外链文件路径
+
+        Returns:
+            CollectionEntry or None: 合集不存在时返回 None
+        """
+        entry = self._entries.get(collection_name)
+        now = time.monotonic()
+        if entry is not None and now - entry.checked_at < self.revalidate_interval:
+            return entry
+
+        with self._lock:
+            # 其他线程可能已经完成了刷新
+            entry = self._entries.get(collection_name)
+            if entry is not None and now - entry.checked_at < self.revalidate_interval:
+                return entry
+            return self._refresh(collection_name, collection_path, links_path, entry, now)
+
+    def _refresh(self, collection_name, collection_path, links_path, entry, now):
+        """校验并在必要时重建条目（调用方需持有锁）"""
+        try:
+            dir_stat = os.stat(collection_path)
+        except OSError:
+            dir_stat = None
+        if dir_stat is None or not os.path.isdir(collection_path):
+            if self._entries.pop(collection_name, None) is not None:
+                self.version += 1
+            return None
+
+        dir_mtime = dir_stat.st_mtime_ns
+        tombstone_path = os.path.join(collection_path, LINKS_TOMBSTONE_FILENAME)
+        links_mtime = (_stat_mtime(links_path), _stat_mtime(tombstone_path))
+
+        if entry is not None:
+            images, cover = entry.images, entry.cover
+            changed = entry.links_mtime != links_mtime
+            if entry.dir_mtime != dir_mtime:
+                scanned = scan_collection(collection_path)
+                # 只有隐藏文件（锁、ETag 记录等）变化时图片列表不变，不递增版本
+                if scanned != (images, cover):
+                    images, cover = scanned
+                    changed = True
+            links = entry.links if entry.links_mtime == links_mtime else self._load_links(
+                collection_path, links_path, entry.links)
+            if changed:
+                self.version += 1
+        else:
+            images, cover = scan_collection(collection_path)
+            links = self._load_links(collection_path, links_path)
+            self.version += 1
+
+        entry = CollectionEntry(images, cover, links, dir_mtime, links_mtime, now)
+        self._entries[collection_name] = entry
+        return entry
+
+    @staticmethod
+    def _load_links(collection_path, links_path, previous=None):
+        return load_link_list(
+            links_path,
+            os.path.join(collection_path, LINKS_INDEX_FILENAME),
+            os.path.join(collection_path, LINKS_TOMBSTONE_FILENAME),
+            previous
+        )
+
+    def reload_links(self, collection_name, collection_path, links_path):
+        """外链文件追加或删除日志变化后增量刷新外链索引，图片列表保持不变"""
+        with self._lock:
+            entry = self._entries.get(collection_name)
+            if entry is None:
+                return
+            tombstone_path = os.path.join(collection_path, LINKS_TOMBSTONE_FILENAME)
+            links_mtime = (_stat_mtime(links_path), _stat_mtime(tombstone_path))
+            links = self._load_links(collection_path, links_path, entry.links)
+            self._entries[collection_name] = CollectionEntry(
+                entry.images, entry.cover, links, entry.dir_mtime, links_mtime, entry.checked_at
+            )
+            self.version += 1
+
+    def content_hash(self, collection_name, collection_path, filename, stat_result):
+        """获取图片的内容哈希
+
+        Args:
+            collection_name: 合集名称
+            collection_path: 合集目录路径
+            filename: 图片文件名
+            stat_result: 图片的 os.stat 结果
+
+        Returns:
+            str: 内容哈希
+        """
+        hashes = self._hashes.get(collection_name)
+        if hashes is None:
+            with self._lock:
+                hashes = self._hashes.setdefault(collection_name, ContentHashes(collection_path))
+        return hashes.get(filename, stat_result)
+
+    def invalidate(self, collection_name):
+        """丢弃合集的缓存条目，下次访问时重新扫描"""
+        with self._lock:
+            self._entries.pop(collection_name, None)
+            self.version += 1
+
+    def clear(self):
+        """清空全部缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._hashes.clear()
+            self.version += 1
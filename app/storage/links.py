@@ -0,0 +1,378 @@
+"""
+外链文件读取模块
+
+外链文件 `<合集名>.txt` 每行一个链接。为了让超大外链合集的随机取链
+不必把整个文件读入内存，这里维护一个旁路行偏移索引文件（uint64 数组），
+并通过 mmap 按需切片读取单行。
+
+删除外链时不重写整个文件，而是向删除日志追加一条墓碑记录
+（链接哈希 + 删除时外链文件的大小），读取时按哈希集合过滤；
+墓碑数量超过阈值后再整体压缩外链文件。
+"""
+import array
+import hashlib
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+import threading
+
+# 旁路索引所在的合集子目录：重建索引只修改子目录，不会改变合集目录的 mtime
+# （合集目录 mtime 变化会让各 worker 重新扫描图片列表）
+SIDECAR_DIRNAME = '.index'
+# 旁路索引文件（相对合集目录）
+LINKS_INDEX_FILENAME = os.path.join(SIDECAR_DIRNAME, 'links.idx')
+# 旧版本直接放在合集目录内的旁路索引文件
+_LEGACY_INDEX_FILENAME = '.links.idx'
+# 删除日志（墓碑）文件名
+LINKS_TOMBSTONE_FILENAME = '.links.del'
+# 外链文件写入锁文件名（追加、删除与压缩互斥）
+LINKS_LOCK_FILENAME = '.links.lock'
+
+# 索引文件头：魔数、版本、源文件 inode、已索引字节数、源文件 mtime_ns、行数
+_HEADER = struct.Struct('<4sIQQQQ')
+_MAGIC = b'LIDX'
+_VERSION = 1
+
+# 匹配包含非空白字符的行的行首位置
+_NON_BLANK_LINE = re.compile(rb'^[^\S\n]*\S', re.M)
+
+# 随机取链时遇到已删除链接的最大重试次数，超过后退化为遍历
+_CHOICE_ATTEMPTS = 16
+
+
+def link_hash(link):
+    """计算链接的墓碑键"""
+    return hashlib.sha1(link.encode('utf-8')).hexdigest()
+
+
+class _LinkPositions:
+    """链接哈希 -> 最后一次出现的行首偏移
+
+    同一外链文件（inode 不变、只在末尾追加）的各个快照共享一张表，按需扩展到
+    快照的最后一个完整行；covered 为已登记的行数。
+    """
+
+    __slots__ = ('table', 'covered', '_lock')
+
+    def __init__(self):
+        self.table = {}
+        self.covered = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, link_list, key):
+        """返回链接在 link_list 中最后一次出现的行首偏移，不存在时返回 None"""
+        with self._lock:
+            offsets, mm, size = link_list._offsets, link_list._mm, link_list.size
+            while self.covered < len(offsets):
+                start = offsets[self.covered]
+                end = mm.find(b'\n', start, size)
+                if end < 0:
+                    break
+                link = mm[start:end].decode('utf-8', 'replace').strip()
+                self.table[link_hash(link)] = start
+                self.covered += 1
+            position = self.table.get(key)
+        # 较新的快照登记的位置不属于当前快照
+        return position if position is not None and position < size else None
+
+
+class LinkList:
+    """外链文件的只读快照，支持 len()、迭代和随机取链
+
+    快照创建后不会被修改；文件或删除日志变化时由 load_link_list 生成新的快照。
+    len() 和迭代结果都已排除墓碑标记删除的链接。
+    """
+
+    __slots__ = ('_mm', '_offsets', 'size', 'ino', 'mtime_ns', 'tombstones', '_live_count', '_positions')
+
+    def __init__(self, mm=None, offsets=None, size=0, ino=0, mtime_ns=0, tombstones=None, positions=None):
+        self._mm = mm
+        self._offsets = offsets if offsets is not None else array.array('Q')
+        self.size = size
+        self.ino = ino
+        self.mtime_ns = mtime_ns
+        # 链接哈希 -> 删除时外链文件大小；只屏蔽该位置之前出现的同名链接
+        self.tombstones = tombstones or {}
+        self._live_count = None if self.tombstones else len(self._offsets)
+        self._positions = positions if positions is not None else _LinkPositions()
+
+    def _line(self, i):
+        start = self._offsets[i]
+        end = self._mm.find(b'\n', start, self.size)
+        if end < 0:
+            end = self.size
+        return self._mm[start:end].decode('utf-8', 'replace').strip()
+
+    def _is_dead(self, i, link):
+        deleted_at = self.tombstones.get(link_hash(link))
+        return deleted_at is not None and self._offsets[i] < deleted_at
+
+    def is_deleted(self, link):
+        """判断链接是否已被删除（不再出现在当前快照中）"""
+        deleted_at = self.tombstones.get(link_hash(link))
+        return deleted_at is not None and deleted_at >= self.size
+
+    def __contains__(self, link):
+        """判断快照中是否存在未被删除的该链接
+
+        首次调用时为文件建立位置表，之后每次只需查表；同一文件追加内容后的新快照
+        复用该表，只补充新增的行。
+        """
+        if self._mm is None or not link:
+            return False
+        key = link_hash(link)
+        deleted_at = self.tombstones.get(key)
+        position = self._positions.lookup(self, key)
+        if position is not None and (deleted_at is None or position >= deleted_at):
+            return True
+        # 末尾没有换行符的行可能仍在写入，不进入位置表，单独比较
+        for i in range(self._positions.covered, len(self._offsets)):
+            if self._line(i) == link and not self._is_dead(i, link):
+                return True
+        return False
+
+    def __len__(self):
+        if self._live_count is None:
+            self._live_count = sum(1 for _ in self)
+        return self._live_count
+
+    def __iter__(self):
+        if not self.tombstones:
+            for i in range(len(self._offsets)):
+                yield self._line(i)
+            return
+        for i in range(len(self._offsets)):
+            link = self._line(i)
+            if not self._is_dead(i, link):
+                yield link
+
+    def first(self):
+        """返回第一个链接，没有时返回 None"""
+        return next(iter(self), None)
+
+    def choice(self, rng=random):
+        """随机返回一个链接，没有时返回 None
+
+        Args:
+            rng: 随机数生成器，传入按种子初始化的 random.Random 时结果可重复
+        """
+        total = len(self._offsets)
+        if not total:
+            return None
+        if not self.tombstones:
+            return self._line(rng.randrange(total))
+        for _ in range(_CHOICE_ATTEMPTS):
+            i = rng.randrange(total)
+            link = self._line(i)
+            if not self._is_dead(i, link):
+                return link
+        # 大部分链接都已删除，退化为遍历存活链接
+        live = list(self)
+        return rng.choice(live) if live else None
+
+    def with_tombstones(self, tombstones):
+        """返回共享同一份文件映射、但使用新删除日志的快照"""
+        return LinkList(self._mm, self._offsets, self.size, self.ino, self.mtime_ns, tombstones,
+                        self._positions)
+
+    def same_file(self, st):
+        """判断快照是否与给定的 stat 结果对应同一份文件内容"""
+        return (self.ino == st.st_ino and self.size == st.st_size
+                and self.mtime_ns == st.st_mtime_ns)
+
+
+EMPTY_LINKS = LinkList()
+
+
+def _scan_offsets(mm, start, end, offsets):
+    """扫描 [start, end) 范围内非空行的行首偏移并追加到 offsets"""
+    offsets.extend(m.start() for m in _NON_BLANK_LINE.finditer(mm, start, end))
+
+
+def _read_index(index_path):
+    """读取旁路索引文件，返回 (ino, size, mtime_ns, offsets)，无效时返回 None"""
+    try:
+        with open(index_path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                return None
+            magic, version, ino, size, mtime_ns, count = _HEADER.unpack(header)
+            if magic != _MAGIC or version != _VERSION:
+                return None
+            offsets = array.array('Q')
+            offsets.frombytes(f.read(count * offsets.itemsize))
+            if len(offsets) != count:
+                return None
+    except (OSError, ValueError, struct.error):
+        return None
+    if sys.byteorder != 'little':
+        offsets.byteswap()
+    return ino, size, mtime_ns, offsets
+
+
+def _write_index(index_path, link_list):
+    """通过临时文件 + 重命名原子地写入旁路索引文件"""
+    offsets = link_list._offsets
+    if sys.byteorder != 'little':
+        offsets = array.array('Q', offsets)
+        offsets.byteswap()
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    try:
+        sidecar_dir = os.path.dirname(index_path)
+        os.makedirs(sidecar_dir, exist_ok=True)
+        legacy_path = os.path.join(os.path.dirname(sidecar_dir), _LEGACY_INDEX_FILENAME)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+        with open(tmp_path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, link_list.ino, link_list.size,
+                                 link_list.mtime_ns, len(offsets)))
+            offsets.tofile(f)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        # 索引只是加速手段，写入失败时下次重新构建即可
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def read_tombstones(tombstone_path):
+    """读取删除日志，返回 {链接哈希: 删除时外链文件大小}"""
+    tombstones = {}
+    try:
+        with open(tombstone_path, 'r', encoding='ascii') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 2 or not parts[1].isdigit():
+                    continue
+                size = int(parts[1])
+                if size > tombstones.get(parts[0], -1):
+                    tombstones[parts[0]] = size
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+    return tombstones
+
+
+def append_tombstones(tombstone_path, links, links_size):
+    """向删除日志一次追加多条墓碑记录（调用方需持有外链写入锁）"""
+    with open(tombstone_path, 'a', encoding='ascii') as f:
+        f.write(''.join(f"{link_hash(link)} {links_size}\n" for link in links))
+
+
+def load_link_list(links_path, index_path, tombstone_path=None, previous=None):
+    """加载外链文件快照
+
+    优先复用内存中的上一份快照或磁盘上的旁路索引；若文件仅在末尾追加了内容
+    （inode 不变且文件变大），只扫描新增部分，否则完整重建索引。
+
+    Args:
+        links_path: 外链文件路径
+        index_path: 旁路索引文件路径
+        tombstone_path: 删除日志路径（可选）
+        previous: 上一份 LinkList 快照（可选）
+
+    Returns:
+        LinkList: 新的只读快照
+    """
+    tombstones = read_tombstones(tombstone_path) if tombstone_path else {}
+    try:
+        f = open(links_path, 'rb')
+    except FileNotFoundError:
+        return EMPTY_LINKS
+
+    with f:
+        st = os.fstat(f.fileno())
+        if previous is not None and previous.same_file(st):
+            if previous.tombstones == tombstones:
+                return previous
+            return previous.with_tombstones(tombstones)
+        if st.st_size == 0:
+            return LinkList(size=0, ino=st.st_ino, mtime_ns=st.st_mtime_ns)
+        mm = mmap.mmap(f.fileno(), st.st_size, access=mmap.ACCESS_READ)
+
+    # 选择可复用的已有索引：(已索引字节数, 偏移数组, 是否与当前文件完全一致)
+    base = None
+    positions = None
+    if previous is not None and previous.ino == st.st_ino and previous.size < st.st_size:
+        base = (previous.size, previous._offsets, False)
+        positions = previous._positions
+    else:
+        stored = _read_index(index_path)
+        if stored is not None and stored[0] == st.st_ino:
+            ino, size, mtime_ns, offsets = stored
+            if size == st.st_size and mtime_ns == st.st_mtime_ns:
+                base = (size, offsets, True)
+            elif size < st.st_size:
+                base = (size, offsets, False)
+
+    if base is not None and base[2]:
+        return LinkList(mm, base[1], st.st_size, st.st_ino, st.st_mtime_ns, tombstones)
+
+    if base is not None:
+        indexed_size, offsets = base[0], array.array('Q', base[1])
+        # 若上次索引时最后一行没有换行符，从该行行首重新扫描
+        resume = indexed_size
+        if resume > 0 and mm[resume - 1] != 0x0A:
+            resume = mm.rfind(b'\n', 0, resume) + 1
+        while offsets and offsets[-1] >= resume:
+            offsets.pop()
+    else:
+        resume, offsets = 0, array.array('Q')
+
+    _scan_offsets(mm, resume, st.st_size, offsets)
+    link_list = LinkList(mm, offsets, st.st_size, st.st_ino, st.st_mtime_ns, tombstones, positions)
+    _write_index(index_path, link_list)
+    return link_list
+
+
+def compact_links(links_path, index_path, tombstone_path):
+    """按删除日志压缩外链文件（调用方需持有外链写入锁）
+
+    将存活链接写入临时文件后原子重命名覆盖原文件，同时写出新的旁路索引，
+    最后删除删除日志。
+
+    Returns:
+        int: 被移除的链接行数
+    """
+    tombstones = read_tombstones(tombstone_path)
+    if not tombstones:
+        return 0
+
+    tmp_path = f"{links_path}.{os.getpid()}.compact"
+    offsets = array.array('Q')
+    removed = 0
+    position = 0
+    try:
+        with open(links_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            for raw in src:
+                line_start = position
+                position += len(raw)
+                link = raw.decode('utf-8', 'replace').strip()
+                if not link:
+                    continue
+                deleted_at = tombstones.get(link_hash(link))
+                if deleted_at is not None and line_start < deleted_at:
+                    removed += 1
+                    continue
+                offsets.append(dst.tell())
+                dst.write(link.encode('utf-8') + b'\n')
+        os.replace(tmp_path, links_path)
+    except FileNotFoundError:
+        return 0
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    st = os.stat(links_path)
+    _write_index(index_path, LinkList(None, offsets, st.st_size, st.st_ino, st.st_mtime_ns))
+    try:
+        os.remove(tombstone_path)
+    except FileNotFoundError:
+        pass
+    return removed
@@ -1,11 +1,23 @@
+import hashlib
 import os
-import time
 import random
+import threading
+import uuid
 from flask import current_app
 from werkzeug.utils import secure_filename
-import glob
-import requests
-from urllib.parse import urlparse
+from app.storage.archives import ArchiveImporter
+from app.storage.covers import cover_queue
+from app.storage.downloader import (
+    DOWNLOAD_LOCK_FILENAME, MANIFEST_FILENAME, BulkDownloader, DownloadManifest, check_links
+)
+from app.storage.index import CollectionIndex, IMAGE_EXTENSIONS
+from app.storage.sequence import SequenceCounter, plan_sequential_renames
+from app.storage.uploads import UPLOAD_FILE_PREFIX
+from app.storage.filelock import FileLock
+from app.storage.links import (
+    LINKS_INDEX_FILENAME, LINKS_LOCK_FILENAME, LINKS_TOMBSTONE_FILENAME,
+    append_tombstones, compact_links, read_tombstones
+)
 
 class StorageManager:
     """存储管理器，负责处理图片合集的存储和检索"""
@@ -13,6 +25,10 @@ class StorageManager:
     def __init__(self):
         """初始化存储管理器"""
         self.picture_dir = None
+        self._index = None
+        # 正在后台压缩外链文件的合集
+        self._compacting = set()
+        self._compacting_lock = threading.Lock()
     
     @property
     def base_dir(self):
@@ -34,10 +50,68 @@ class StorageManager:
             os.makedirs(self.picture_dir, exist_ok=True)
         return self.picture_dir
     
+    @property
+    def index(self):
+        """获取合集内存索引（每个 worker 进程一份）"""
+        if self._index is None:
+            interval = current_app.config.get('COLLECTION_INDEX_TTL', 2.0)
+            self._index = CollectionIndex(revalidate_interval=interval)
+        return self._index
+    
+    def _links_file_path(self, collection_name):
+        """获取合集外链文件路径"""
+        return os.path.join(self.base_dir, collection_name, f"{collection_name}.txt")
+    
+    def _links_lock(self, collection_name):
+        """获取合集外链文件的跨进程写入锁（追加、删除与压缩互斥）"""
+        return FileLock(os.path.join(self.base_dir, collection_name, LINKS_LOCK_FILENAME))
+    
+    def _get_index_entry(self, collection_name):
+        """获取合集的索引条目，合集不存在时返回 None"""
+        return self.index.get(
+            collection_name,
+            os.path.join(self.base_dir, collection_name),
+            self._links_file_path(collection_name)
+        )
+    
+    def get_image_etag(self, collection_name, filename, stat_result):
+        """获取图片基于内容的强 ETag（内容哈希保存在合集索引和 .etags 文件中）
+        
+        Args:
+            collection_name: 合集名称
+            filename: 图片文件名
+            stat_result: 图片的 os.stat 结果
+        
+        Returns:
+            str: ETag（不含引号）
+        """
+        return self.index.content_hash(
+            collection_name, os.path.join(self.base_dir, collection_name), filename, stat_result
+        )
+    
+    def get_storage_version(self):
+        """存储内容的版本标识，任一合集的增删或内容变化都会使其改变
+
+        会先按校验间隔重新校验所有合集的索引条目，以感知其他 worker 的修改。
+
+        Returns:
+            tuple: (图片根目录 mtime, 索引版本)
+        """
+        for name in self.get_all_collections():
+            self._get_index_entry(name)
+        try:
+            base_mtime = os.stat(self.base_dir).st_mtime_ns
+        except OSError:
+            base_mtime = None
+        return (base_mtime, self.index.version)
+    
     def get_all_collections(self):
         """获取所有图片合集"""
         collections = []
         for item in os.listdir(self.base_dir):
+            # 以 . 开头的目录用于存放内部数据（如后台任务表）
+            if item.startswith('.'):
+                continue
             if os.path.isdir(os.path.join(self.base_dir, item)) and item.lower() != 'background':
                 collections.append(item)
         return collections
@@ -51,22 +125,23 @@ class StorageManager:
         Returns:
             dict: 包含合集信息的字典，如 {has_content, cover, total_count}
         """
-        if not self.collection_exists(collection_name):
+        entry = self._get_index_entry(collection_name)
+        if entry is None:
             return None
         
-        images = self.get_collection_images(collection_name)
-        links = self.get_collection_links(collection_name)
+        local_count = len(entry.images)
+        link_count = len(entry.links)
         
-        has_content = len(images) > 0 or len(links) > 0
+        has_content = local_count > 0 or link_count > 0
         cover = self.get_collection_cover_image_filename(collection_name) if has_content else None
-        total_count = len(images) + len(links)
+        total_count = local_count + link_count
         
         return {
             'has_content': has_content,
             'cover': cover,
             'total_count': total_count,
-            'local_count': len(images),
-            'link_count': len(links)
+            'local_count': local_count,
+            'link_count': link_count
         }
 
     
@@ -84,6 +159,7 @@ class StorageManager:
             return False
         
         os.makedirs(collection_path, exist_ok=True)
+        self.index.invalidate(collection_name)
         return True
     
     def delete_collection(self, collection_name):
@@ -105,6 +181,8 @@ class StorageManager:
             return True
         except Exception:
             return False
+        finally:
+            self.index.invalidate(collection_name)
     
     def collection_exists(self, collection_name):
         """检查合集是否存在
@@ -115,8 +193,12 @@ class StorageManager:
         Returns:
             bool: 存在返回True，不存在返回False
         """
-        collection_path = os.path.join(self.base_dir, collection_name)
-        return os.path.exists(collection_path) and os.path.isdir(collection_path)
+        return self._get_index_entry(collection_name) is not None
+    
+    def is_link_only_collection(self, collection_name):
+        """检查合集是否存在且没有本地图片（随机取图时只会返回外链）"""
+        entry = self._get_index_entry(collection_name)
+        return entry is not None and not entry.images
     
     def get_collection_images(self, collection_name):
         """获取合集中的所有本地图片
@@ -127,23 +209,10 @@ class StorageManager:
         Returns:
             list: 图片文件名列表
         """
-        if not self.collection_exists(collection_name):
+        entry = self._get_index_entry(collection_name)
+        if entry is None:
             return []
-        
-        collection_path = os.path.join(self.base_dir, collection_name)
-        images = []
-        
-        # 常见图片扩展名
-        image_extensions = ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'psd', 'tif']
-        
-        for ext in image_extensions:
-            pattern = os.path.join(collection_path, f'*.{ext}')
-            images.extend(glob.glob(pattern))
-            # 不区分大小写的扩展名
-            pattern = os.path.join(collection_path, f'*.{ext.upper()}')
-            images.extend(glob.glob(pattern))
-        
-        return [os.path.basename(image) for image in images]
+        return list(entry.images)
     
     def get_collection_links(self, collection_name):
         """获取合集中的所有外链
@@ -154,116 +223,46 @@ class StorageManager:
         Returns:
             list: 外链URL列表
         """
-        if not self.collection_exists(collection_name):
-            return []
-        
-        links_file = os.path.join(self.base_dir, collection_name, f"{collection_name}.txt")
-        
-        if not os.path.exists(links_file):
+        entry = self._get_index_entry(collection_name)
+        if entry is None:
             return []
-        
-        with open(links_file, 'r', encoding='utf-8') as f:
-            return [line.strip() for line in f if line.strip()]
+        return list(entry.links)
 
     def get_collection_cover_image_filename(self, collection_name):
-        """获取合集的封面图片文件名。
-        优先选择合集内按名称排序的第一张本地图片。
-        如果本地图片不存在，则尝试下载第一个外部链接作为封面。
+        """获取合集的封面图片文件名（不进行网络请求）。
+        优先选择合集内按名称排序的第一张本地图片，其次是后台从外链生成的封面。
+        两者都不存在时把第一个外链提交给后台封面队列，并返回 None，由页面显示占位图。
 
         Args:
             collection_name: 合集名称
 
         Returns:
-            str: 封面图片的文件名，如果无法确定封面则返回 None
+            str: 封面图片的文件名，如果封面尚未就绪则返回 None
         """
-        if not self.collection_exists(collection_name):
+        entry = self._get_index_entry(collection_name)
+        if entry is None:
             current_app.logger.debug(f"合集 '{collection_name}' 不存在，无法获取封面。")
             return None
 
-        collection_path = os.path.join(self.base_dir, collection_name)
-        
-        # 1. 尝试获取本地图片作为封面
-        image_filenames = self.get_collection_images(collection_name)
-        if image_filenames:
-            # 按文件名排序，取第一张
-            image_filenames.sort()
-            cover_filename = image_filenames[0]
-            current_app.logger.info(f"合集 '{collection_name}' 使用本地图片 '{cover_filename}' 作为封面。")
-            return cover_filename
+        # 1. 尝试获取本地图片作为封面（索引中的列表已按文件名排序，取第一张）
+        if entry.images:
+            return entry.images[0]
 
-        # 2. 如果没有本地图片，尝试从外链下载封面
-        current_app.logger.info(f"合集 '{collection_name}' 没有本地图片，尝试从外链获取封面。")
-        external_links = self.get_collection_links(collection_name)
-        if not external_links:
-            current_app.logger.info(f"合集 '{collection_name}' 也没有外链，无法生成封面。")
-            return None
+        # 2. 后台已从外链生成的封面
+        if entry.cover:
+            return entry.cover
 
-        # 定义从外链下载的封面文件名
-        # 为了避免与用户上传的文件名冲突，使用一个特殊的前缀或固定名称
-        # 提取原始链接的文件名和扩展名可能复杂且不可靠，因此使用固定名称和尝试从content-type获取扩展名
-        
-        default_cover_from_link_basename = "_cover_from_link" # 基础名
-        cover_from_link_filename = None # 完整文件名，稍后确定扩展名
-
-        first_link = external_links[0]
-        
-        # 尝试从链接猜测一个扩展名，如果失败则默认为 .jpg
-        try:
-            link_path = requests.utils.urlparse(first_link).path
-            link_ext = os.path.splitext(link_path)[1].lower()
-            if link_ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp']:
-                 cover_from_link_filename = f"{default_cover_from_link_basename}{link_ext}"
-            else:
-                cover_from_link_filename = f"{default_cover_from_link_basename}.jpg" # 默认
-        except Exception:
-            cover_from_link_filename = f"{default_cover_from_link_basename}.jpg" # 默认
-
-        cover_save_path = os.path.join(collection_path, cover_from_link_filename)
-
-        if os.path.exists(cover_save_path):
-            current_app.logger.info(f"合集 '{collection_name}' 已存在从外链下载的封面 '{cover_from_link_filename}'。")
-            return cover_from_link_filename
-        
-        current_app.logger.info(f"合集 '{collection_name}': 尝试从 '{first_link}' 下载封面到 '{cover_save_path}'。")
-        try:
-            response = requests.get(first_link, timeout=10, stream=True) # stream=True for large files, timeout
-            response.raise_for_status() # Will raise an HTTPError if the HTTP request returned an unsuccessful status code
-
-            # 再次尝试从 Content-Type 获取更准确的扩展名
-            content_type = response.headers.get('content-type')
-            actual_ext = ".jpg" # 默认
-            if content_type:
-                if 'image/jpeg' in content_type:
-                    actual_ext = '.jpg'
-                elif 'image/png' in content_type:
-                    actual_ext = '.png'
-                elif 'image/gif' in content_type:
-                    actual_ext = '.gif'
-                elif 'image/webp' in content_type:
-                    actual_ext = '.webp'
-            
-            # 更新带正确扩展名的文件名和保存路径
-            cover_from_link_filename = f"{default_cover_from_link_basename}{actual_ext}"
-            cover_save_path = os.path.join(collection_path, cover_from_link_filename)
-
-            # 再次检查，如果因为扩展名改变而导致文件已存在
-            if os.path.exists(cover_save_path):
-                current_app.logger.info(f"合集 '{collection_name}' 已存在从外链下载的封面 (更新扩展名后) '{cover_from_link_filename}'。")
-                return cover_from_link_filename
-
-            with open(cover_save_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            current_app.logger.info(f"成功从 '{first_link}' 下载封面并保存为 '{cover_from_link_filename}'。")
-            return cover_from_link_filename
-        except requests.exceptions.RequestException as e:
-            current_app.logger.error(f"下载封面 '{first_link}' 失败: {e}")
-        except IOError as e:
-            current_app.logger.error(f"保存下载的封面到 '{cover_save_path}' 失败: {e}")
-        except Exception as e:
-            current_app.logger.error(f"处理封面下载时发生未知错误: {e}")
-
-        current_app.logger.warning(f"无法为合集 '{collection_name}' 获取或生成封面。")
+        # 3. 提交后台生成任务
+        if not entry.links:
+            return None
+        if cover_queue.request(
+            current_app._get_current_object(),
+            collection_name,
+            os.path.join(self.base_dir, collection_name),
+            entry.links.first(),
+            self.index.invalidate
+        ):
+            current_app.logger.info(f"合集 '{collection_name}' 没有本地图片，已提交后台封面生成任务。")
         return None
     
     def _get_next_sequential_filename(self, collection_name, extension):
@@ -276,22 +275,9 @@ class StorageManager:
         Returns:
             str: 下一个可用的顺序文件名（如 1.png, 2.jpg）
         """
-        collection_path = os.path.join(self.base_dir, collection_name)
-        
-        # 获取现有的所有数字命名的文件
-        existing_numbers = set()
-        for item in os.listdir(collection_path):
-            if os.path.isfile(os.path.join(collection_path, item)):
-                name_without_ext = os.path.splitext(item)[0]
-                if name_without_ext.isdigit():
-                    existing_numbers.add(int(name_without_ext))
-        
-        # 找到下一个可用的数字
-        next_num = 1
-        while next_num in existing_numbers:
-            next_num += 1
-        
-        return f"{next_num}{extension}"
+        # 编号来自合集的持久化计数器，无需列出目录
+        counter = SequenceCounter(os.path.join(self.base_dir, collection_name))
+        return f"{counter.reserve()}{extension}"
     
     def add_image_to_collection(self, collection_name, image_file):
         """添加图片到合集
@@ -306,39 +292,71 @@ class StorageManager:
         if not self.collection_exists(collection_name):
             return None
         
-        # 安全处理文件名
-        filename = secure_filename(image_file.filename)
+        temp_path = os.path.join(self.base_dir, collection_name, f"{UPLOAD_FILE_PREFIX}{uuid.uuid4().hex}.part")
+        try:
+            image_file.save(temp_path)
+        except Exception as e:
+            current_app.logger.error(f"StorageManager: 保存上传文件 '{image_file.filename}' 失败: {e}", exc_info=True)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return None
+        return self.finalize_upload(collection_name, temp_path, image_file.filename)
+    
+    def finalize_upload(self, collection_name, temp_path, original_filename):
+        """把合集目录中已写完的临时文件改名为最终文件名（不覆盖已有文件）
+        
+        文件名经过安全处理；不含扩展名的部分超过8个字符时自动改为顺序数字，重名时追加序号。
+        
+        Args:
+            collection_name: 合集名称
+            temp_path: 合集目录下的临时文件路径
+            original_filename: 上传时的原始文件名
+        
+        Returns:
+            str: 成功返回保存的文件名，失败返回None（临时文件会被删除）
+        """
+        filename = secure_filename(original_filename)
         name_without_ext, extension = os.path.splitext(filename)
+        long_name = len(name_without_ext) > 8
         
         # 如果文件名（不含扩展名）超过8个字符，自动重命名为顺序数字
-        if len(name_without_ext) > 8:
+        if long_name:
             filename = self._get_next_sequential_filename(collection_name, extension)
             current_app.logger.info(f"StorageManager: 文件名过长，自动重命名为 '{filename}'")
         
-        save_path = os.path.join(self.base_dir, collection_name, filename)
-        
-        # 处理重名文件
-        if os.path.exists(save_path):
-            counter = 1
-            while os.path.exists(save_path):
-                filename = f"{name_without_ext}_{counter}{extension}" if len(name_without_ext) <= 8 else self._get_next_sequential_filename(collection_name, extension)
-                save_path = os.path.join(self.base_dir, collection_name, filename)
-                counter += 1
-        
+        collection_path = os.path.join(self.base_dir, collection_name)
+        counter = 1
         try:
-            current_app.logger.debug(f"StorageManager: Attempting to save image '{filename}' to: {save_path}")
-            image_file.save(save_path)
-            # Post-save verification
-            if os.path.exists(save_path):
-                current_app.logger.info(f"StorageManager: Successfully saved and verified image '{filename}' at: {save_path}")
-                return filename
-            else:
-                current_app.logger.error(f"StorageManager: Image save operation for '{filename}' reported success, BUT FILE NOT FOUND at the expected path: {save_path}. Check permissions, disk space, or if the filename contained problematic characters not fully sanitized by secure_filename for this filesystem.")
-                return None
-        except Exception as e:
-            # Log the full exception details for better debugging
-            current_app.logger.error(f"StorageManager: Exception during saving image '{filename}' to '{save_path}'. Error: {e}", exc_info=True)
+            while True:
+                save_path = os.path.join(collection_path, filename)
+                try:
+                    # link 在目标已存在时失败，并发上传同名文件时不会互相覆盖
+                    os.link(temp_path, save_path)
+                    os.remove(temp_path)
+                    break
+                except FileExistsError:
+                    pass
+                except OSError:
+                    # 文件系统不支持硬链接
+                    if not os.path.exists(save_path):
+                        os.replace(temp_path, save_path)
+                        break
+                # 处理重名文件
+                filename = f"{name_without_ext}_{counter}{extension}" if not long_name else self._get_next_sequential_filename(collection_name, extension)
+                counter += 1
+        except OSError as e:
+            current_app.logger.error(f"StorageManager: 保存图片 '{filename}' 到合集 '{collection_name}' 失败: {e}", exc_info=True)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
             return None
+        
+        self.index.invalidate(collection_name)
+        current_app.logger.info(f"StorageManager: Successfully saved image '{filename}' at: {save_path}")
+        return filename
     
     def rename_long_filenames_in_collection(self, collection_name, max_length=8):
         """重命名合集中所有文件名过长的图片为顺序数字
@@ -355,35 +373,44 @@ class StorageManager:
             return 0
         
         collection_path = os.path.join(self.base_dir, collection_name)
-        images = self.get_collection_images(collection_name)
-        renamed_count = 0
-        
-        # 常见图片扩展名
-        image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.psd', '.tif']
+        renamed = {}
         
-        for image_name in images:
-            name_without_ext, extension = os.path.splitext(image_name)
-            
-            # 跳过已经是数字命名的文件和短文件名
-            if name_without_ext.isdigit() or len(name_without_ext) <= max_length:
-                continue
-            
-            # 跳过特殊文件（如封面文件）
-            if name_without_ext.startswith('_'):
+        # 只列出一次目录，同时得到图片列表和已占用的数字编号
+        images = []
+        existing_numbers = set()
+        for item in os.listdir(collection_path):
+            if item.startswith('.'):
                 continue
-            
-            # 获取新的顺序文件名
-            new_filename = self._get_next_sequential_filename(collection_name, extension)
+            name_without_ext, extension = os.path.splitext(item)
+            if name_without_ext.isdigit():
+                existing_numbers.add(int(name_without_ext))
+            if extension[1:].lower() in IMAGE_EXTENSIONS:
+                images.append(item)
+        
+        # 一次性为所有需要重命名的文件预留编号
+        counter = SequenceCounter(collection_path)
+        plan = plan_sequential_renames(sorted(images), counter, existing_numbers, max_length)
+        
+        for image_name, new_filename in plan:
             old_path = os.path.join(collection_path, image_name)
             new_path = os.path.join(collection_path, new_filename)
             
             try:
                 os.rename(old_path, new_path)
-                renamed_count += 1
+                renamed[image_name] = new_filename
                 current_app.logger.info(f"重命名: '{image_name}' -> '{new_filename}'")
             except Exception as e:
                 current_app.logger.error(f"重命名 '{image_name}' 失败: {e}")
         
+        renamed_count = len(renamed)
+        if renamed_count:
+            self.index.invalidate(collection_name)
+            # 保持下载清单指向改名后的文件，避免再次缓存时重复下载
+            if os.path.exists(os.path.join(collection_path, MANIFEST_FILENAME)):
+                try:
+                    DownloadManifest(collection_path).update(renamed=renamed)
+                except OSError as e:
+                    current_app.logger.error(f"更新合集 '{collection_name}' 的下载清单失败: {e}")
         current_app.logger.info(f"合集 '{collection_name}' 共重命名 {renamed_count} 个文件。")
         return renamed_count
     
@@ -400,16 +427,18 @@ class StorageManager:
         if not self.collection_exists(collection_name):
             return 0
         
-        links_file = os.path.join(self.base_dir, collection_name, f"{collection_name}.txt")
+        links_file = self._links_file_path(collection_name)
         
         count = 0
-        with open(links_file, 'a', encoding='utf-8') as f:
+        with self._links_lock(collection_name), open(links_file, 'a', encoding='utf-8') as f:
             for link in links:
                 link = link.strip()
                 if link:
                     f.write(f"{link}\n")
                     count += 1
         
+        # 外链文件只在末尾追加，增量扫描新增行即可
+        self.index.reload_links(collection_name, os.path.join(self.base_dir, collection_name), links_file)
         return count
     
     def delete_image_from_collection(self, collection_name, image_name):
@@ -431,6 +460,7 @@ class StorageManager:
         
         try:
             os.remove(image_path)
+            self.index.invalidate(collection_name)
             return True
         except Exception:
             return False
@@ -438,38 +468,107 @@ class StorageManager:
     def delete_link_from_collection(self, collection_name, link):
         """从合集中删除外链
         
+        不重写外链文件，只向删除日志追加一条墓碑记录；该链接在此之前的所有出现
+        都会被读取方过滤掉。墓碑数量达到 LINK_COMPACT_THRESHOLD 后在后台压缩外链文件。
+        
         Args:
             collection_name: 合集名称
             link: 外链URL
         
         Returns:
-            bool: 成功返回True，失败返回False
+            bool: 成功返回True，合集或外链文件不存在、链接不在合集中或已被删除时返回False
         """
-        if not self.collection_exists(collection_name):
-            return False
+        return self.delete_links_from_collection(collection_name, [link]) == 1
+    
+    def delete_links_from_collection(self, collection_name, links):
+        """从合集中批量删除外链，所有墓碑在一次加锁内追加
         
-        links_file = os.path.join(self.base_dir, collection_name, f"{collection_name}.txt")
-        if not os.path.exists(links_file):
-            return False
+        Args:
+            collection_name: 合集名称
+            links: 外链URL列表
+        
+        Returns:
+            int: 实际删除的外链数（不在合集中或已被删除的不计）
+        """
+        if self._get_index_entry(collection_name) is None:
+            return 0
+        links = list(dict.fromkeys(link.strip() for link in links if link and link.strip()))
+        if not links:
+            return 0
+        
+        collection_path = os.path.join(self.base_dir, collection_name)
+        links_file = self._links_file_path(collection_name)
+        tombstone_file = os.path.join(collection_path, LINKS_TOMBSTONE_FILENAME)
+        
+        with self._links_lock(collection_name):
+            try:
+                links_size = os.path.getsize(links_file)
+            except OSError:
+                return 0
+            # 持锁刷新外链索引，确认链接确实存在，避免为不存在的链接写入墓碑
+            self.index.reload_links(collection_name, collection_path, links_file)
+            entry = self._get_index_entry(collection_name)
+            if entry is None:
+                return 0
+            present = [link for link in links if link in entry.links]
+            if present:
+                append_tombstones(tombstone_file, present, links_size)
+        if not present:
+            return 0
+        
+        self.index.reload_links(collection_name, collection_path, links_file)
+        
+        entry = self._get_index_entry(collection_name)
+        threshold = current_app.config.get('LINK_COMPACT_THRESHOLD', 1000)
+        if entry is not None and len(entry.links.tombstones) >= threshold:
+            self._schedule_link_compaction(collection_name)
+        return len(present)
+    
+    def _schedule_link_compaction(self, collection_name):
+        """在后台线程中压缩合集外链文件，同一合集同时只运行一个压缩任务"""
+        with self._compacting_lock:
+            if collection_name in self._compacting:
+                return
+            self._compacting.add(collection_name)
+        
+        app = current_app._get_current_object()
         
-        links = []
-        removed = False
+        def compact_wrapper():
+            try:
+                with app.app_context():
+                    self.compact_collection_links(collection_name)
+            finally:
+                with self._compacting_lock:
+                    self._compacting.discard(collection_name)
+        
+        threading.Thread(target=compact_wrapper, daemon=True).start()
+    
+    def compact_collection_links(self, collection_name):
+        """按删除日志压缩合集外链文件（临时文件 + 原子重命名）
         
-        # 读取所有链接
-        with open(links_file, 'r', encoding='utf-8') as f:
-            links = [line.strip() for line in f]
+        Args:
+            collection_name: 合集名称
         
-        # 移除指定链接
-        if link in links:
-            links.remove(link)
-            removed = True
+        Returns:
+            int: 被移除的链接行数
+        """
+        collection_path = os.path.join(self.base_dir, collection_name)
+        links_file = self._links_file_path(collection_name)
+        tombstone_file = os.path.join(collection_path, LINKS_TOMBSTONE_FILENAME)
+        if not read_tombstones(tombstone_file):
+            return 0
         
-        # 重写链接文件
-        if removed:
-            with open(links_file, 'w', encoding='utf-8') as f:
-                for l in links:
-                    f.write(f"{l}\n")
+        try:
+            with self._links_lock(collection_name):
+                removed = compact_links(
+                    links_file, os.path.join(collection_path, LINKS_INDEX_FILENAME), tombstone_file
+                )
+        except OSError as e:
+            current_app.logger.error(f"压缩合集 '{collection_name}' 的外链文件失败: {e}")
+            return 0
         
+        self.index.reload_links(collection_name, collection_path, links_file)
+        current_app.logger.info(f"合集 '{collection_name}' 外链文件压缩完成，移除 {removed} 行。")
         return removed
 
     def move_image_to_collection(self, source_collection_name, dest_collection_name, image_name):
@@ -510,38 +609,53 @@ class StorageManager:
         try:
             import shutil
             shutil.move(source_path, dest_path)
+            self.index.invalidate(source_collection_name)
+            self.index.invalidate(dest_collection_name)
             current_app.logger.info(f"成功将 '{source_path}' 移动到 '{dest_path}'")
             return new_filename
         except Exception as e:
             current_app.logger.error(f"移动文件时发生错误: {e}")
             return None
     
-    def get_random_resource(self, collection_name):
+    @staticmethod
+    def _seeded_rng(collection_name, entry, seed):
+        """按种子和合集版本创建随机数生成器
+        
+        合集版本取索引条目的内容标识，各 worker 看到的相同；合集内容变化后同一种子会选中新的资源。
+        """
+        key = f"{collection_name}\0{seed}\0{entry.fingerprint()}"
+        digest = hashlib.sha256(key.encode('utf-8')).digest()
+        return random.Random(int.from_bytes(digest[:8], 'big'))
+    
+    def get_random_resource(self, collection_name, seed=None):
         """从合集中随机获取一个资源（本地图片或外链），实现“本地优先”策略。
         
         Args:
             collection_name: 合集名称
+            seed: 选择种子，相同的种子在合集内容不变时总是选中同一个资源；None 表示真随机
         
         Returns:
             tuple or None: 成功则返回 ('local' 或 'external', 资源路径或URL)，失败则返回 (None, None)。
         """
-        if not self.collection_exists(collection_name):
+        entry = self._get_index_entry(collection_name)
+        if entry is None:
             current_app.logger.debug(f"get_random_resource: Collection '{collection_name}' not found.")
             return None, None
+        rng = random if seed is None else self._seeded_rng(collection_name, entry, seed)
 
         # 1. 优先获取本地图片
-        local_images = self.get_collection_images(collection_name)
+        local_images = entry.images
         if local_images:
-            random_image_name = random.choice(local_images)
+            random_image_name = rng.choice(local_images)
             image_path = os.path.join(self.base_dir, collection_name, random_image_name)
             current_app.logger.debug(f"get_random_resource: Found local image '{random_image_name}' in '{collection_name}'.")
             return 'local', image_path
 
         # 2. 如果没有本地图片，则尝试获取外部链接
         current_app.logger.debug(f"get_random_resource: No local images found in '{collection_name}'. Falling back to external links.")
-        external_links = self.get_collection_links(collection_name)
+        external_links = entry.links
         if external_links:
-            random_link = random.choice(external_links)
+            random_link = external_links.choice(rng)
             current_app.logger.debug(f"get_random_resource: Found external link '{random_link}' in '{collection_name}'.")
             return 'external', random_link
 
@@ -549,11 +663,14 @@ class StorageManager:
         current_app.logger.warning(f"get_random_resource: No resources (local or external) found for collection '{collection_name}'.")
         return None, None
 
-    def cache_external_images(self, collection_name):
-        """缓存合集中的所有外部图片到本地，并处理文件名冲突。
+    def cache_external_images(self, collection_name, on_item=None):
+        """并发下载合集中的所有外部图片到本地。
+        已记录在下载清单中的链接会被跳过，中断的下载在下次运行时续传。
+        同一合集同时只运行一个缓存任务。
         
         Args:
             collection_name: 合集名称
+            on_item: 进度回调 on_item(已处理数, 待处理总数, 成功数)
         
         Returns:
             int: 成功下载的图片数量
@@ -568,57 +685,85 @@ class StorageManager:
             return 0
             
         collection_path = os.path.join(self.base_dir, collection_name)
-        downloaded_count = 0
+        lock = FileLock(os.path.join(collection_path, DOWNLOAD_LOCK_FILENAME))
+        if not lock.acquire(blocking=False):
+            current_app.logger.info(f"合集 '{collection_name}' 已有缓存任务在运行，跳过本次请求。")
+            return 0
         
-        for url in external_links:
-            try:
-                # 从URL中解析出原始文件名
-                original_filename = os.path.basename(urlparse(url).path)
-                if not original_filename:
-                    original_filename = f"downloaded_{random.randint(1000, 9999)}.jpg"
-                
-                # 安全处理文件名并分离基础名和扩展名
-                s_filename = secure_filename(original_filename)
-                name_root, name_ext = os.path.splitext(s_filename)
-                
-                # 检查文件是否存在并处理重名
-                counter = 1
-                save_path = os.path.join(collection_path, s_filename)
-                while os.path.exists(save_path):
-                    # 如果文件已存在，生成带后缀的新文件名
-                    new_filename = f"{name_root}_{counter}{name_ext}"
-                    save_path = os.path.join(collection_path, new_filename)
-                    counter += 1
-
-                current_app.logger.info(f"正在从 '{url}' 下载到 '{save_path}'...")
-                # 增加重试机制，避免临时网络波动或 DNS 解析问题导致 Gunicorn worker 长时间阻塞超时
-                for attempt in range(3):
-                    try:
-                        response = requests.get(url, stream=True, timeout=10)
-                        response.raise_for_status()
-                        with open(save_path, 'wb') as f:
-                            for chunk in response.iter_content(chunk_size=8192):
-                                f.write(chunk)
-                        downloaded_count += 1
-                        current_app.logger.info(f"成功下载并保存 '{os.path.basename(save_path)}'。")
-                        break
-                    except requests.exceptions.Timeout:
-                        current_app.logger.warning(f"下载 '{url}' 超时 (第 {attempt+1} 次重试)...")
-                        if attempt == 2:
-                            raise
-                    except requests.exceptions.RequestException as e:
-                        current_app.logger.error(f"下载图片 '{url}' 失败: {e}")
-                        raise
+        config = current_app.config
+        downloader = BulkDownloader(
+            collection_path,
+            workers=config.get('DOWNLOAD_WORKERS', 8),
+            per_host=config.get('DOWNLOAD_PER_HOST', 2),
+            timeout=(config.get('PROXY_CONNECT_TIMEOUT', 5), config.get('DOWNLOAD_READ_TIMEOUT', 30)),
+            retries=config.get('DOWNLOAD_RETRIES', 3),
+            logger=current_app.logger,
+            on_progress=lambda: self.index.invalidate(collection_name),
+            on_item=on_item
+        )
+        try:
+            downloaded_count = downloader.run(list(external_links))
+        finally:
+            lock.release()
 
-            except requests.exceptions.RequestException as e:
-                current_app.logger.error(f"下载图片 '{url}' 失败: {e}")
-            except IOError as e:
-                current_app.logger.error(f"保存图片到 '{save_path}' 失败: {e}")
-            except Exception as e:
-                current_app.logger.error(f"处理链接 '{url}' 时发生未知错误: {e}")
+        current_app.logger.info(f"合集 '{collection_name}' 的图片缓存完成，共下载 {downloaded_count} 张新图片。")
+        return downloaded_count
 
-            # 每处理一个链接后，短暂停顿，减少阻塞风险
-            time.sleep(1)
+    def validate_collection_links(self, collection_name, remove=False, on_item=None):
+        """检查合集中的外链是否仍然有效
+        
+        Args:
+            collection_name: 合集名称
+            remove: 是否删除失效的外链
+            on_item: 进度回调 on_item(已检查数, 总数, 失效数)
+        
+        Returns:
+            list: [(失效链接, 原因), ...]
+        """
+        links = list(self.get_collection_links(collection_name))
+        if not links:
+            return []
+        
+        config = current_app.config
+        broken = check_links(
+            list(dict.fromkeys(links)),
+            workers=config.get('DOWNLOAD_WORKERS', 8),
+            per_host=config.get('DOWNLOAD_PER_HOST', 2),
+            timeout=(config.get('PROXY_CONNECT_TIMEOUT', 5), config.get('PROXY_READ_TIMEOUT', 15)),
+            on_item=on_item
+        )
+        current_app.logger.info(f"合集 '{collection_name}' 共检查 {len(links)} 个外链，{len(broken)} 个失效。")
+        if remove and broken:
+            self.delete_links_from_collection(collection_name, [link for link, _ in broken])
+        return broken
 
-        current_app.logger.info(f"合集 '{collection_name}' 的图片缓存完成，共下载 {downloaded_count} 张新图片。")
-        return downloaded_count
\ No newline at end of file
+    def import_archive(self, collection_name, archive_path, skip=0, on_item=None):
+        """把压缩包中的图片导入合集
+        
+        Args:
+            collection_name: 合集名称
+            archive_path: 压缩包路径
+            skip: 跳过前 skip 个成员（任务重试时从上次的进度继续）
+            on_item: 进度回调 on_item(已处理数, 成员总数或 None, 已导入数)
+        
+        Returns:
+            dict: {'imported', 'skipped', 'oversized', 'failed'}
+        
+        Raises:
+            ValueError: 不支持的压缩包格式
+        """
+        importer = ArchiveImporter(
+            os.path.join(self.base_dir, collection_name),
+            IMAGE_EXTENSIONS,
+            current_app.config.get('MAX_CONTENT_LENGTH', 20 * 1024 * 1024),
+            logger=current_app.logger
+        )
+        try:
+            stats = importer.run(archive_path, skip=skip, on_item=on_item)
+        finally:
+            self.index.invalidate(collection_name)
+        current_app.logger.info(
+            f"合集 '{collection_name}' 导入压缩包完成：导入 {stats['imported']} 张，"
+            f"跳过 {stats['skipped']} 个，过大 {stats['oversized']} 个，失败 {stats['failed']} 个。"
+        )
+        return stats
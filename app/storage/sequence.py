@@ -0,0 +1,121 @@
+"""
+合集顺序编号模块
+
+每个合集在目录内持久化一个“下一个可用编号”计数器，用于长文件名的自动重命名。
+计数器通过文件锁在多个 gunicorn worker 之间互斥更新，分配编号无需列出目录。
+"""
+import os
+from app.storage.filelock import FileLock
+
+# 计数器文件名（隐藏文件，不会被识别为图片）
+SEQUENCE_FILENAME = '.seq'
+SEQUENCE_LOCK_FILENAME = '.seq.lock'
+
+
+def list_numbered_files(collection_path):
+    """单次列出目录，返回所有以纯数字命名的文件编号集合"""
+    numbers = set()
+    with os.scandir(collection_path) as entries:
+        for entry in entries:
+            stem = os.path.splitext(entry.name)[0]
+            if stem.isdigit() and entry.is_file():
+                numbers.add(int(stem))
+    return numbers
+
+
+class SequenceCounter:
+    """合集的持久化编号计数器
+
+    Args:
+        collection_path: 合集目录路径
+    """
+
+    def __init__(self, collection_path):
+        self.collection_path = collection_path
+        self.path = os.path.join(collection_path, SEQUENCE_FILENAME)
+        self.lock_path = os.path.join(collection_path, SEQUENCE_LOCK_FILENAME)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='ascii') as f:
+                value = f.read().strip()
+            return int(value) if value.isdigit() else None
+        except (FileNotFoundError, UnicodeDecodeError):
+            return None
+
+    def _write(self, value):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='ascii') as f:
+            f.write(str(value))
+        os.replace(tmp_path, self.path)
+
+    def reserve(self, count=1):
+        """原子地预留 count 个连续编号
+
+        计数器文件不存在时，列出一次目录并从现有最大编号之后开始。
+
+        Args:
+            count: 预留数量
+
+        Returns:
+            int: 预留区间的第一个编号
+        """
+        with FileLock(self.lock_path):
+            first = self._read()
+            if first is None:
+                first = max(list_numbered_files(self.collection_path), default=0) + 1
+            self._write(first + count)
+        return first
+
+    def release(self, end, next_unused):
+        """归还预留区间末尾未使用的编号
+
+        只有计数器仍停在 end（期间没有其他预留）时才回退，否则保持不变。
+
+        Args:
+            end: 最后一次预留区间的结束编号（不含）
+            next_unused: 第一个未使用的编号
+        """
+        if next_unused >= end:
+            return
+        with FileLock(self.lock_path):
+            if self._read() == end:
+                self._write(next_unused)
+
+
+def plan_sequential_renames(filenames, counter, existing_numbers, max_length=8):
+    """为文件名过长的图片批量规划顺序编号新文件名
+
+    一次性按需要重命名的数量预留编号，跳过目录中已被占用的数字。
+
+    Args:
+        filenames: 图片文件名列表
+        counter: SequenceCounter 实例
+        existing_numbers: 目录中已存在的数字编号集合
+        max_length: 文件名最大长度（不含扩展名）
+
+    Returns:
+        list: [(旧文件名, 新文件名), ...]
+    """
+    candidates = []
+    for filename in filenames:
+        stem, extension = os.path.splitext(filename)
+        # 跳过已经是数字命名的文件、短文件名和特殊文件（如封面文件）
+        if stem.isdigit() or len(stem) <= max_length or stem.startswith('_'):
+            continue
+        candidates.append((filename, extension))
+
+    plan = []
+    next_number = end = 0
+    for filename, extension in candidates:
+        while True:
+            if next_number >= end:
+                remaining = len(candidates) - len(plan)
+                next_number = counter.reserve(remaining)
+                end = next_number + remaining
+            number = next_number
+            next_number += 1
+            if number not in existing_numbers:
+                break
+        plan.append((filename, f"{number}{extension}"))
+    return plan
@@ -0,0 +1,256 @@
+"""
+图片上传模块
+
+上传内容边接收边写入合集目录下的隐藏临时文件，不在内存中保留整个文件：
+- 表单上传：解析 multipart 时每个文件写入 .upload-<id>.part，超过单文件大小上限后立即停止写入
+- 分块上传：先创建上传会话，再按偏移量逐块 PUT，中断后查询已接收的字节数即可续传
+两种方式完成后都由 StorageManager 以不覆盖已有文件的方式原子地改名为最终文件名。
+"""
+import json
+import os
+import time
+import uuid
+from werkzeug.formparser import FormDataParser
+from werkzeug.utils import secure_filename
+from app.storage.filelock import FileLock
+
+# 上传临时文件前缀（隐藏文件，不会被识别为图片）
+UPLOAD_FILE_PREFIX = '.upload-'
+# 等待后台导入的压缩包前缀；排队时间可能超过上传会话有效期，清理上传临时文件时不会删除
+ARCHIVE_FILE_PREFIX = '.archive-'
+
+# 每次从请求体读取的字节数
+_COPY_CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """上传内容超过单文件大小上限"""
+
+
+class UploadSink:
+    """multipart 解析时单个文件的写入目标
+
+    超过大小上限后删除临时文件并丢弃后续数据（解析器仍需读完该部分请求体）。
+
+    Args:
+        path: 临时文件路径，为 None 时丢弃全部数据（如不支持的文件类型）
+        max_size: 单文件大小上限（字节）
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.size = 0
+        self.oversized = False
+        self._file = open(path, 'w+b') if path else None
+
+    def write(self, data):
+        self.size += len(data)
+        if self._file is None:
+            return len(data)
+        if self.size > self.max_size:
+            self.oversized = True
+            self.discard()
+            return len(data)
+        return self._file.write(data)
+
+    def seek(self, offset, whence=0):
+        # 解析器在文件结束时调用 seek(0)；此后内容只通过 path 访问
+        if self._file is not None:
+            self._file.flush()
+        return 0
+
+    def read(self, size=-1):
+        return b''
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def keep(self, prefix=None):
+        """保留临时文件（之后 discard 不再删除），返回其路径
+
+        Args:
+            prefix: 指定时把文件名中的 UPLOAD_FILE_PREFIX 换成该前缀
+        """
+        self.close()
+        path, self.path = self.path, None
+        if prefix:
+            directory, name = os.path.split(path)
+            kept = os.path.join(directory, prefix + name[len(UPLOAD_FILE_PREFIX):])
+            os.replace(path, kept)
+            path = kept
+        return path
+
+    def discard(self):
+        """关闭并删除临时文件"""
+        self.close()
+        if self.path:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self.path = None
+
+
+def parse_upload_form(request, collection_path, allowed_extensions, max_file_size, max_request_size):
+    """流式解析上传表单
+
+    Args:
+        request: Flask 请求对象（尚未访问过 form / files）
+        collection_path: 合集目录路径，临时文件写在其中以便原子改名
+        allowed_extensions: 允许的扩展名（小写，不含点号），其他类型的文件不写入磁盘
+        max_file_size: 单文件大小上限（字节）
+        max_request_size: 整个请求体的大小上限（字节）
+
+    Returns:
+        tuple: (form, files, sinks)；调用方处理完后需对 sinks 逐个调用 discard() 清理未使用的临时文件
+    """
+    sinks = []
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        # 与保存时一致，按安全处理后的文件名判断类型
+        name = secure_filename(filename or '')
+        ext = name.rsplit('.', 1)[1].lower() if '.' in name else ''
+        path = None
+        if ext in allowed_extensions:
+            path = os.path.join(collection_path, f'{UPLOAD_FILE_PREFIX}{uuid.uuid4().hex}.part')
+        sink = UploadSink(path, max_file_size)
+        sinks.append(sink)
+        return sink
+
+    parser = FormDataParser(stream_factory=stream_factory, max_content_length=max_request_size, silent=False)
+    try:
+        _, form, files = parser.parse(
+            request.stream, request.mimetype, request.content_length, request.mimetype_params
+        )
+    except BaseException:
+        for sink in sinks:
+            sink.discard()
+        raise
+    for sink in sinks:
+        sink.close()
+    return form, files, sinks
+
+
+class ChunkedUpload:
+    """可续传的分块上传会话
+
+    会话信息保存在合集目录下的 .upload-<id>.json，已接收的内容在 .upload-<id>.part 中，
+    因此任意 worker 都可以继续同一个会话。
+
+    Args:
+        collection_path: 合集目录路径
+        upload_id: 会话 ID
+    """
+
+    def __init__(self, collection_path, upload_id):
+        if not upload_id.isalnum():
+            raise ValueError('无效的上传 ID')
+        self.collection_path = collection_path
+        self.upload_id = upload_id
+        base = os.path.join(collection_path, f'{UPLOAD_FILE_PREFIX}{upload_id}')
+        self.part_path = f'{base}.part'
+        self.meta_path = f'{base}.json'
+        self.lock_path = f'{base}.lock'
+
+    @classmethod
+    def create(cls, collection_path, filename, size):
+        """创建上传会话
+
+        Args:
+            collection_path: 合集目录路径
+            filename: 原始文件名
+            size: 文件总大小（字节）
+        """
+        upload = cls(collection_path, uuid.uuid4().hex)
+        with open(upload.part_path, 'wb'):
+            pass
+        with open(upload.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'filename': filename, 'size': size, 'createdAt': time.time()}, f, ensure_ascii=False)
+        return upload
+
+    def load(self):
+        """读取会话信息，会话不存在时返回 None"""
+        try:
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def offset(self):
+        """已接收的字节数"""
+        try:
+            return os.path.getsize(self.part_path)
+        except OSError:
+            return 0
+
+    def append(self, stream, offset, length, total_size):
+        """从请求体追加一个分块
+
+        Args:
+            stream: 请求体
+            offset: 分块在文件中的起始位置，必须等于已接收的字节数
+            length: 分块长度
+            total_size: 文件总大小
+
+        Returns:
+            int: 追加后已接收的字节数；offset 不匹配时不写入并返回当前字节数
+        """
+        if offset + length > total_size:
+            raise UploadTooLarge()
+        with FileLock(self.lock_path):
+            current = self.offset()
+            if offset != current:
+                return current
+            remaining = length
+            with open(self.part_path, 'ab') as f:
+                while remaining > 0:
+                    data = stream.read(min(_COPY_CHUNK_SIZE, remaining))
+                    if not data:
+                        break
+                    f.write(data)
+                    remaining -= len(data)
+                received = f.tell()
+            # 刷新会话时间，避免进行中的会话被当作过期清理
+            os.utime(self.meta_path)
+            return received
+
+    def remove(self):
+        """删除会话及其临时文件"""
+        for path in (self.part_path, self.meta_path, self.lock_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def purge_stale_uploads(collection_path, max_age, archives=False):
+    """删除超过 max_age 秒未更新的上传临时文件和会话
+
+    Args:
+        collection_path: 合集目录路径
+        max_age: 最长保留时间（秒）
+        archives: 是否同时删除等待导入的压缩包（仅在合集没有进行中的导入任务时使用）
+
+    Returns:
+        int: 删除的文件数
+    """
+    removed = 0
+    deadline = time.time() - max_age
+    prefixes = (UPLOAD_FILE_PREFIX, ARCHIVE_FILE_PREFIX) if archives else (UPLOAD_FILE_PREFIX,)
+    try:
+        entries = list(os.scandir(collection_path))
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.name.startswith(prefixes):
+            continue
+        try:
+            if entry.stat().st_mtime < deadline:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
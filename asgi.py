@@ -0,0 +1,14 @@
+"""
+异步入口（ASGI）
+
+API 端点转发在 asyncio 事件循环中处理，单个进程可同时挂起大量上游请求；
+管理后台和本地图片仍由 Flask 应用处理。
+
+运行: uvicorn asgi:app --host 0.0.0.0 --port 46000
+依赖: pip install -r requirements-asgi.txt
+"""
+from app import create_app
+from app.asgi import AsyncGateway
+
+flask_app = create_app()
+app = AsyncGateway(flask_app)
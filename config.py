@@ -25,7 +25,79 @@ class Config:
 
     # 配置文件路径（JSON 格式）
     CONFIG_PATH = os.getenv('CONFIG_PATH', os.path.join(os.path.dirname(__file__), 'config.json'))
+    # 配置快照的文件状态校验间隔（秒），间隔内直接使用内存中的配置
+    CONFIG_RELOAD_INTERVAL = float(os.getenv('CONFIG_RELOAD_INTERVAL', '1'))
+
+    # 上游 HTTP 连接池配置
+    HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+    HTTP_HOST_POOL_SIZES = os.getenv('HTTP_HOST_POOL_SIZES', '')  # 例如: api.example.com=20,img.example.com=5
+    PROXY_CONNECT_TIMEOUT = float(os.getenv('PROXY_CONNECT_TIMEOUT', '5'))
+    PROXY_READ_TIMEOUT = float(os.getenv('PROXY_READ_TIMEOUT', '15'))
+    DNS_CACHE_TTL = float(os.getenv('DNS_CACHE_TTL', '60'))  # 0 表示关闭 DNS 缓存
+    DNS_CACHE_SIZE = int(os.getenv('DNS_CACHE_SIZE', '256'))  # DNS 缓存最多保存的主机数
+    # 代理响应缓存最大条目数（端点 proxySettings.cacheTtl 开启缓存）
+    PROXY_CACHE_SIZE = int(os.getenv('PROXY_CACHE_SIZE', '1024'))
+    # 跨 worker 合并相同代理请求的共享目录（如 /dev/shm/image-forward），为空时只在 worker 内合并
+    PROXY_SINGLEFLIGHT_DIR = os.getenv('PROXY_SINGLEFLIGHT_DIR', '')
+    # 上游熔断：统计窗口内请求数达到下限且错误率（含慢调用）超过阈值时熔断 COOLDOWN 秒
+    PROXY_BREAKER_WINDOW = float(os.getenv('PROXY_BREAKER_WINDOW', '60'))
+    PROXY_BREAKER_MIN_REQUESTS = int(os.getenv('PROXY_BREAKER_MIN_REQUESTS', '10'))
+    PROXY_BREAKER_ERROR_RATE = float(os.getenv('PROXY_BREAKER_ERROR_RATE', '0.5'))
+    PROXY_BREAKER_SLOW_CALL = float(os.getenv('PROXY_BREAKER_SLOW_CALL', '5'))  # 0 表示不按耗时判断
+    PROXY_BREAKER_COOLDOWN = float(os.getenv('PROXY_BREAKER_COOLDOWN', '30'))
+    # 对冲请求线程池大小（端点 proxySettings.hedge 开启对冲）
+    PROXY_HEDGE_WORKERS = int(os.getenv('PROXY_HEDGE_WORKERS', '8'))
+    # 代理并发隔离：全部代理请求的并发上限（建议设为 gunicorn worker 数减 1，0 表示不限制）
+    PROXY_GLOBAL_LIMIT = int(os.getenv('PROXY_GLOBAL_LIMIT', '0'))
+    # 按上游主机的并发上限，格式 'api.example.com=2,other.com:8443=1'
+    PROXY_HOST_LIMITS = os.getenv('PROXY_HOST_LIMITS', '')
+    # 名额已满时最长等待时间（秒），超时返回 503
+    PROXY_BULKHEAD_WAIT = float(os.getenv('PROXY_BULKHEAD_WAIT', '2'))
+    # 跨 worker 信号量槽位文件目录，为空时使用 /dev/shm（不可用时为系统临时目录）
+    PROXY_BULKHEAD_DIR = os.getenv('PROXY_BULKHEAD_DIR', '')
+    # 异步入口（asgi.py）每个进程到上游的最大连接数
+    ASYNC_MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', '1000'))
 
     # 存储配置
     PICTURE_DIR = os.getenv('PICTURE_DIR', 'picture')
     MAX_CONTENT_LENGTH = 20 * 1024 * 1024  # 最大上传文件大小：20MB
+    # 图片上传：一次表单上传的请求体上限（多个文件合计）、分块上传的分块大小、未完成分块上传的保留时间（秒）
+    UPLOAD_MAX_REQUEST_SIZE = int(os.getenv('UPLOAD_MAX_REQUEST_SIZE', str(500 * 1024 * 1024)))
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(2 * 1024 * 1024)))
+    UPLOAD_SESSION_TTL = float(os.getenv('UPLOAD_SESSION_TTL', '86400'))
+    # 导入压缩包的大小上限（字节）
+    ARCHIVE_MAX_SIZE = int(os.getenv('ARCHIVE_MAX_SIZE', str(10 * 1024 * 1024 * 1024)))
+    # 带 seed / date / rotate 参数的合集请求结果可重复，响应的最长缓存时间（秒）
+    SEED_CACHE_MAX_AGE = int(os.getenv('SEED_CACHE_MAX_AGE', '3600'))
+    # 本地图片交给前端代理发送：留空由 worker 发送；x-accel 返回 nginx 的 X-Accel-Redirect（内部路径为
+    # IMAGE_OFFLOAD_PREFIX/合集/文件名）；x-sendfile 返回 Apache / lighttpd 的 X-Sendfile（文件绝对路径）
+    IMAGE_OFFLOAD = os.getenv('IMAGE_OFFLOAD', '').strip().lower()
+    IMAGE_OFFLOAD_PREFIX = os.getenv('IMAGE_OFFLOAD_PREFIX', '/_protected_picture').rstrip('/')
+    # 热点图片内存缓存（每个 worker）：总内存预算（字节，0 表示关闭）、单张图片大小上限（字节）
+    IMAGE_CACHE_SIZE = int(os.getenv('IMAGE_CACHE_SIZE', '0'))
+    IMAGE_CACHE_MAX_ITEM_SIZE = int(os.getenv('IMAGE_CACHE_MAX_ITEM_SIZE', str(512 * 1024)))
+    # 合集内存索引的磁盘校验间隔（秒），间隔内随机取图不访问文件系统
+    COLLECTION_INDEX_TTL = float(os.getenv('COLLECTION_INDEX_TTL', '2'))
+    # 外链删除日志累计多少条墓碑后压缩外链文件
+    LINK_COMPACT_THRESHOLD = int(os.getenv('LINK_COMPACT_THRESHOLD', '1000'))
+    # 只有外链的合集在后台下载封面：并发下载数、单次下载超时（秒）、失败后的重试间隔（秒）
+    COVER_WORKERS = int(os.getenv('COVER_WORKERS', '2'))
+    COVER_TIMEOUT = float(os.getenv('COVER_TIMEOUT', '10'))
+    COVER_RETRY_INTERVAL = float(os.getenv('COVER_RETRY_INTERVAL', '300'))
+    # 缓存外链图片：并发下载数、单个主机的并发下载数、读取超时（秒）、每个链接的最多尝试次数
+    DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', '8'))
+    DOWNLOAD_PER_HOST = int(os.getenv('DOWNLOAD_PER_HOST', '2'))
+    DOWNLOAD_READ_TIMEOUT = float(os.getenv('DOWNLOAD_READ_TIMEOUT', '30'))
+    DOWNLOAD_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', '3'))
+
+    # 后台任务（缓存、重命名、删除合集、检查外链）
+    # 任务表路径，为空时使用图片目录下的 .jobs/jobs.sqlite3
+    JOBS_DB_PATH = os.getenv('JOBS_DB_PATH', '')
+    # 全部 worker 合计同时运行的任务数
+    JOB_CONCURRENCY = int(os.getenv('JOB_CONCURRENCY', '2'))
+    # 运行中任务的心跳超过多少秒未更新视为执行进程已退出，重新排队
+    JOB_STALE_AFTER = float(os.getenv('JOB_STALE_AFTER', '60'))
+    # 每个任务的最多执行次数（包括重新排队后的执行）
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+    # 已结束任务记录的保留天数
+    JOB_RETENTION_DAYS = float(os.getenv('JOB_RETENTION_DAYS', '7'))